@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Benchmark of the comparison of sections.
+
+Compare large numeric sections, with and without the precompilation
+of the expected lines.
+
+Usage: python3 benchmarks/bench_match.py [LINES] [REPETITIONS]
+"""
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pvcheck.match import compare_sections, compile_section
+
+
+def make_section(lines, seed=0):
+    rnd = random.Random(seed)
+    return ["%d %.3f %.2f word%d" % (rnd.randrange(1000), rnd.random(),
+                                     100 * rnd.random(), rnd.randrange(10))
+            for _ in range(lines)]
+
+
+def make_matrix(rows, cols, seed=0):
+    rnd = random.Random(seed)
+    return [" ".join("%.3f" % rnd.random() for _ in range(cols))
+            for _ in range(rows)]
+
+
+def bench_numeric(reps):
+    # Matrix of reals printed with more digits than required.
+    expected = make_matrix(1000, 200)
+    actual = [" ".join("%.6f" % float(x) for x in line.split())
+              for line in expected]
+    compiled = compile_section(expected)
+    compiled.numeric_arrays()
+    t = timeit.timeit(lambda: compare_sections(actual, compiled),
+                      number=reps)
+    print("numeric   %6d lines: compiled %.4fs  (numpy %s)" % (
+        len(expected), t / reps,
+        "enabled" if compiled.numeric_arrays() else "disabled"))
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    reps = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    expected = make_section(lines)
+    actual = list(expected)
+    actual[lines // 2] = "0 0 0 0"
+    compiled = compile_section(expected)
+    assert (compare_sections(actual, expected) ==
+            compare_sections(actual, compiled))
+    for ordered in (True, False):
+        if not ordered:
+            actual = list(reversed(actual))
+        t_plain = timeit.timeit(
+            lambda: compare_sections(actual, expected, ordered), number=reps)
+        t_comp = timeit.timeit(
+            lambda: compare_sections(actual, compiled, ordered), number=reps)
+        print("%-9s %6d lines: plain %.4fs  compiled %.4fs  (x%.1f)" % (
+            "ordered" if ordered else "unordered", len(expected),
+            t_plain / reps, t_comp / reps, t_plain / max(t_comp, 1e-9)))
+    bench_numeric(reps)
+
+
+if __name__ == "__main__":
+    main()
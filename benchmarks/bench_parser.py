@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Benchmark of the parsing of the output of programs.
+
+Compare the line by line parser with the buffer level parser, on a
+large output where only one section is actually used.
+
+Usage: python3 benchmarks/bench_parser.py [LINES] [REPETITIONS]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pvcheck.parser import parse_sections, parse_output
+
+
+def make_output(lines):
+    parts = []
+    for tag in ("MATRIX", "VECTOR", "RESULT"):
+        parts.append("[%s]" % tag)
+        parts.extend("%d %d %.4f" % (i, i * i, i / 7) for i in range(lines))
+    return "\n".join(parts) + "\n"
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    reps = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    text = make_output(lines)
+
+    def old():
+        sections = list(parse_sections(text.splitlines()))
+        return sections[-1].content
+
+    def new():
+        return list(parse_output(text))[-1].content
+
+    assert old() == new()
+    for name, fun in (("parse_sections", old), ("parse_output", new)):
+        t = timeit.timeit(fun, number=reps) / reps
+        print("%-22s %d lines: %.4fs" % (name, 3 * lines, t))
+
+
+if __name__ == "__main__":
+    main()
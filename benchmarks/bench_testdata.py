@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Benchmark of the memory used by test suites.
+
+Build suites with a large prefix (a shared .INPUT section) and an
+increasing number of test cases, and report the memory allocated.
+With the prefix shared by the test cases the memory should not grow
+with their number, except for the few tests extending the prefix.
+
+Usage: python3 benchmarks/bench_testdata.py [PREFIX_LINES] [MAX_TESTS]
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pvcheck.testdata import Section, TestSuite
+
+
+def make_sections(prefix_lines, tests):
+    sections = [Section(".INPUT", ["%d %s" % (i, "x" * 40)
+                                   for i in range(prefix_lines)])]
+    for n in range(tests):
+        sections.append(Section(".TEST", ["test %d" % n]))
+        sections.append(Section("OUT", [str(n)]))
+        if n % 100 == 0:
+            # Some tests extend the shared input.
+            sections.append(Section(".INPUT", ["extra"]))
+    return sections
+
+
+def main():
+    prefix_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    max_tests = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    tests = 10
+    while tests <= max_tests:
+        sections = make_sections(prefix_lines, tests)
+        tracemalloc.start()
+        suite = TestSuite(sections)
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(suite.test_cases()) == tests
+        print("%6d tests: %8.1f MB (peak %8.1f MB)" %
+              (tests, size / 2 ** 20, peak / 2 ** 20))
+        del suite, sections
+        tests *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""Cache of execution results and of parsed test suites.
+
+The results are stored on disk and addressed by a digest of
+everything that determines them: the content of the executable (and
+of any other file named on the command line), the arguments, the
+input, the content of the temporary file and the execution
+parameters.  When the cache grows beyond its maximum size, the least
+recently used entries are removed.
+
+Parsed test suites are stored as pickles, one for each combination
+of the files they are read from.  An entry is valid as long as the
+files have the same modification time and size, or, failing that,
+the same content.  Since loading a pickle can execute arbitrary code,
+entries are ignored unless they and their directory belong to the
+user and are not writable by others.
+"""
+
+import os
+import stat
+import gc
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import threading
+import pvcheck.executor
+
+
+CACHE_FORMAT_VER = 1
+
+# To be incremented whenever the classes in testdata change, so that
+# old pickles are ignored.
+SUITE_FORMAT_VER = 3
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Results depending on the load of the system, or on the expected
+# output, and interrupted executions are never cached.
+_UNCACHED_RESULTS = (pvcheck.executor.ER_TIMEOUT,
+                     pvcheck.executor.ER_NOTFILE,
+                     pvcheck.executor.ER_MISMATCH,
+                     pvcheck.executor.ER_INTERRUPTED)
+
+
+def default_directory():
+    """Default location of the cache directory."""
+    base = os.environ.get("XDG_CACHE_HOME", "~/.cache")
+    return os.path.join(os.path.expanduser(base), "pvcheck")
+
+
+class ResultCache:
+    """On disk cache of ExecResult objects.
+
+    The same cache can be used concurrently by several threads.
+
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        """Create the cache in the given directory.
+
+        max_size is the maximum total size of the entries, in bytes.
+
+        """
+        self._dir = directory
+        self._max_size = max_size
+        self._size = None
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def key(self, executor, args, input, tmpfile=None, **params):
+        """Compute the key identifying an execution.
+
+        The parameters are the same passed to the exec_process method
+        of the executor.  The files named by input_file and
+        tmpfile_from are identified by their content.
+
+        """
+        args = [("<temp.file>" if a is pvcheck.executor.ARG_TMPFILE
+                 else a) for a in args]
+        files = [self._file_digest(a) for a in args[1:]]
+        files.insert(0, self._file_digest(shutil.which(args[0]) or args[0]))
+        desc = [CACHE_FORMAT_VER, type(executor).__name__, args, files,
+                input, tmpfile, sorted(params.items())]
+        # Files replacing the input or the content of the temporary
+        # file.
+        refs = [self._file_digest(params[name]) for name
+                in ("input_file", "tmpfile_from")
+                if params.get(name) is not None]
+        if refs:
+            desc.append(refs)
+        text = json.dumps(desc, sort_keys=True)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached result, or None when it is not present."""
+        path = self._path(key)
+        try:
+            with open(path, "rt") as f:
+                fields = json.load(f)
+            os.utime(path)  # Mark the entry as recently used
+        except (OSError, ValueError):
+            return None
+        return pvcheck.executor.ExecResult(*fields)
+
+    def put(self, key, result):
+        """Store a result in the cache."""
+        if result.result in _UNCACHED_RESULTS:
+            return
+        path = self._path(key)
+        data = json.dumps(list(result)).encode("utf-8")
+        # Write and rename, so that readers never see partial entries.
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(path),
+                                           suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpname, path)
+        except OSError:
+            try:
+                os.remove(tmpname)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(s for p, s, t in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self._max_size:
+                self._evict()
+
+    def _path(self, key):
+        return os.path.join(self._dir, key[:2], key[2:] + ".json")
+
+    def _entries(self):
+        # Generate (path, size, time of last use) for all the entries.
+        for dirpath, dirnames, filenames in os.walk(self._dir):
+            for name in filenames:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield (path, st.st_size, st.st_mtime)
+
+    def _evict(self):
+        # Remove the least recently used entries, until the cache is
+        # reduced to 3/4 of its maximum size.
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        self._size = sum(e[1] for e in entries)
+        for path, size, t in entries:
+            if self._size <= self._max_size * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def _file_digest(self, path):
+        # Digest of the content of the file (None if it is not a
+        # file).  Digests are remembered as long as the file is not
+        # modified.
+        try:
+            st = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        sig = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        h = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        except OSError:
+            return None
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[path] = (sig, digest)
+        return digest
+
+
+class SuiteCache:
+    """On disk cache of TestSuite objects."""
+
+    def __init__(self, directory):
+        """Create the cache in the given directory."""
+        self._dir = directory
+
+    def get(self, filenames, build, variant=""):
+        """Return the suite built from the given files.
+
+        The suite is taken from the cache when the files did not
+        change, otherwise it is built by calling build() and stored.
+        variant distinguishes suites built in different ways from
+        the same files.
+
+        """
+        filenames = [f for f in filenames if f]
+        try:
+            sigs = [_stat_signature(f) for f in filenames]
+        except OSError:
+            return build()
+        path = self._path(filenames, variant)
+        entry = self._read(path)
+        if entry is not None and entry["signatures"] == sigs:
+            return entry["suite"]
+        try:
+            digests = [_content_digest(f) for f in filenames]
+        except OSError:
+            return build()
+        if entry is not None and entry["digests"] == digests:
+            # Touched but not modified: remember the new signatures
+            # to avoid digesting the files the next time.
+            suite = entry["suite"]
+        else:
+            suite = build()
+        self._write(path, dict(version=SUITE_FORMAT_VER, signatures=sigs,
+                               digests=digests, suite=suite))
+        return suite
+
+    def _path(self, filenames, variant):
+        desc = [SUITE_FORMAT_VER, [os.path.abspath(f) for f in filenames],
+                variant]
+        text = json.dumps(desc)
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return os.path.join(self._dir, key + ".pickle")
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                if not (_is_private(os.fstat(f.fileno())) and
+                        _is_private(os.stat(self._dir))):
+                    return None
+                data = f.read()
+        except OSError:
+            return None
+        # Large suites are made of millions of objects: the garbage
+        # collector would otherwise run over and over while they are
+        # created.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            entry = pickle.loads(data)
+        except Exception:
+            # Damaged or written by an incompatible version.
+            return None
+        finally:
+            if enabled:
+                gc.enable()
+        if (not isinstance(entry, dict) or
+                entry.get("version") != SUITE_FORMAT_VER):
+            return None
+        return entry
+
+    def _write(self, path, entry):
+        try:
+            data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, RecursionError):
+            return
+        # Write and rename, so that readers never see partial entries.
+        try:
+            os.makedirs(self._dir, mode=0o700, exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=self._dir, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpname, path)
+        except OSError:
+            try:
+                os.remove(tmpname)
+            except OSError:
+                pass
+
+
+def _is_private(st):
+    # True if the file is owned by the user and cannot be modified by
+    # anybody else.
+    return (st.st_uid == os.getuid() and
+            not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _stat_signature(path):
+    # Cheap check for modifications of a file.
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _content_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
@@ -22,13 +22,34 @@ class CSVFormatter(pvcheck.formatter.Formatter):
         pvcheck.executor.ER_ERROR:
         "3",
         pvcheck.executor.ER_NOTFILE:
-        "4"
+        "4",
+        pvcheck.executor.ER_OUTPUT_LIMIT: "5",
+        pvcheck.executor.ER_CPU_LIMIT: "6",
+        pvcheck.executor.ER_FILE_LIMIT: "7",
+        pvcheck.executor.ER_MISMATCH: "8",
+        pvcheck.executor.ER_INTERRUPTED: "9"
+    }
+
+    # Columns reporting the resources used by the program, with
+    # the format of their values.
+    _RESOURCE_COLUMNS = OrderedDict([
+        (_("TIME"), "%.3f"),
+        (_("CPU TIME"), "%.3f"),
+        (_("MEMORY"), "%d")
+    ])
+
+    # Statistic corresponding to each resource column.
+    _RESOURCE_STATS = {
+        _("TIME"): "wall_time",
+        _("CPU TIME"): "cpu_time",
+        _("MEMORY"): "max_rss"
     }
 
     def __init__(self, destination=sys.stdout):
         self._dest = destination
         self._obj = None
         self._tests = []
+        self._stats = pvcheck.formatter.ResultStats()
         
     def _proc_args(self, args):
         return [(a if a is not pvcheck.executor.ARG_TMPFILE
@@ -37,6 +58,7 @@ class CSVFormatter(pvcheck.formatter.Formatter):
 
     def begin_session(self):
         self._tests = []
+        self._stats.begin_session()
 
     def _header_builder(self):
         """Build the header.
@@ -46,11 +68,8 @@ class CSVFormatter(pvcheck.formatter.Formatter):
         """
         header = ["TEST"]
         header.append(_("CODE"))
-        for test in self._tests:
-            section_names = list(test["sections"].keys())
-            for name in section_names:
-                if name not in header:
-                    header.append(name)
+        header.extend(self._RESOURCE_COLUMNS)
+        header.extend(self._stats.sections())
         return header
 
     def _row_builder(self, test, header):
@@ -63,6 +82,10 @@ class CSVFormatter(pvcheck.formatter.Formatter):
         for element in header:
             if element == _("CODE"):
                 row.append(test["status"])
+            elif element in self._RESOURCE_COLUMNS:
+                value = test["resources"][element]
+                fmt = self._RESOURCE_COLUMNS[element]
+                row.append("" if value is None else fmt % value)
             elif element != "TEST":
                 try:
                     row.append(test["sections"][element]["equality"])
@@ -74,22 +97,12 @@ class CSVFormatter(pvcheck.formatter.Formatter):
         """Build a row containing the arithmetic mean of equality for each section."""
         row = [_("TOTAL"), ""]
         for head in header:
-            if head not in ("TEST", _("CODE")):
-                values = []
-                for test in self._tests:
-                    try:
-                        if test["sections"][head]["equality"] != 'MISS':
-                            values.append(float(test["sections"][head]["equality"]))
-                        else:
-                            values.append(0)
-                    except KeyError:
-                        values.append(None)
-                try:
-                    # takes into account the sections that actually exist
-                    values_2 = [v for v in values if v is not None]
-                    row.append('%.2f' % (sum(values_2)/len(values_2)))
-                except ZeroDivisionError:
-                    row.append('%.2f' % 0)
+            if head in self._RESOURCE_COLUMNS:
+                mean = self._stats.resources[self._RESOURCE_STATS[head]].mean()
+                fmt = self._RESOURCE_COLUMNS[head]
+                row.append("" if mean is None else fmt % mean)
+            elif head not in ("TEST", _("CODE")):
+                row.append('%.2f' % self._stats.section(head).mean_equality())
         return row
 
     def end_session(self):
@@ -100,17 +113,33 @@ class CSVFormatter(pvcheck.formatter.Formatter):
             row = self._row_builder(test, header)
             fp.writerow(row)
         fp.writerow(self._statistics_row_builder(header))
+        if self._stats.skipped > 0:
+            fmt = _("TOO MANY FAILURES: %d TESTS SKIPPED")
+            fp.writerow([fmt % self._stats.skipped])
 
     def begin_test(self, description, cmdline_args, input, tempfile):
         t = OrderedDict([
             ("title", description)
         ])
         self._tests.append(t)
+        self._stats.begin_test(description, cmdline_args, input, tempfile)
+
+    def end_test(self):
+        self._stats.end_test()
 
     def execution_result(self, cmdline_args, execution_result, test):
+        self._stats.execution_result(cmdline_args, execution_result, test)
         t = self._tests[-1]
         self._sections = OrderedDict()
         t["status"] = self._RESULT_TABLE[execution_result.result]
+        cpu_time = None
+        if execution_result.user_time is not None:
+            cpu_time = execution_result.user_time + execution_result.sys_time
+        t["resources"] = {
+            _("TIME"): execution_result.wall_time,
+            _("CPU TIME"): cpu_time,
+            _("MEMORY"): execution_result.max_rss
+        }
         if execution_result.result != pvcheck.executor.ER_OK:
             for s in test.sections(exclude_special=True):
                 self._sections[s.tag] = OrderedDict([("equality", "0")])
@@ -118,15 +147,17 @@ class CSVFormatter(pvcheck.formatter.Formatter):
         t["sections"] = self._sections
 
     def comparison_result(self, expected, got, diffs, matches):
-        if len(diffs) != 0:
-            percent_correct = '%.2f' % (((len(diffs) - sum(diffs)) * 100)/len(diffs))
-        else:
-            percent_correct = '100.00'
+        self._stats.comparison_result(expected, got, diffs, matches)
+        percent_correct = '%.2f' % pvcheck.formatter.section_equality(diffs)
         s = OrderedDict([
             ("equality", percent_correct)
         ])
         self._sections[expected.tag] = s
 
+    def tests_skipped(self, count):
+        self._stats.tests_skipped(count)
+
     def missing_section(self, expected):
+        self._stats.missing_section(expected)
         s = OrderedDict([("equality", "MISS")])
         self._sections[expected.tag] = s
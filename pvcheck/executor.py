@@ -3,10 +3,23 @@
 
 import subprocess
 import contextlib
+import selectors
+import select
+import time
 import tempfile
+import shutil
+import hashlib
+import locale
+import atexit
+import fcntl
+import stat
 import signal
 import os
+import sys
 import collections
+import threading
+import math
+import resource
 
 
 # Execution results
@@ -16,43 +29,527 @@ ER_OUTPUT_LIMIT = "ER_OUTPUT_LIMIT"
 ER_SEGFAULT = "ER_SEGFAULT"
 ER_ERROR = "ER_ERROR"
 ER_NOTFILE = "ER_NOTFILE"
+ER_CPU_LIMIT = "ER_CPU_LIMIT"
+ER_FILE_LIMIT = "ER_FILE_LIMIT"
+ER_MISMATCH = "ER_MISMATCH"
+ER_INTERRUPTED = "ER_INTERRUPTED"
+
+# Limits that can be imposed on the resources used by the process:
+# address space and file size (in bytes), CPU time (in seconds) and
+# number of open files.
+LIMITS = collections.OrderedDict([
+    ("memory", resource.RLIMIT_AS),
+    ("cpu", resource.RLIMIT_CPU),
+    ("filesize", resource.RLIMIT_FSIZE),
+    ("files", resource.RLIMIT_NOFILE)
+])
+
+_SIZE_SUFFIXES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
 
 # Placeholder for the name of the temporary file
 ARG_TMPFILE = object()
 
 
-@contextlib.contextmanager
-def _make_temp_file(content):
-    tmp = tempfile.NamedTemporaryFile(mode="wt",
-                                      suffix=".pvcheck.tmp",
-                                      delete=False)
-    name = tmp.name
+def parse_size(text):
+    """Parse a size in bytes, with an optional suffix K, M or G.
+
+    Fractional sizes are rounded up.  Raise a ValueError for invalid
+    or negative sizes.
+
+    """
+    number = text.strip().upper()
+    scale = _SIZE_SUFFIXES.get(number[-1:], 1)
+    if scale != 1:
+        number = number[:-1]
+    return _parse_amount(number, scale, "Invalid size '%s'" % text)
+
+
+def parse_limit(name, value):
+    """Parse the value of a resource limit.
+
+    Sizes accept the suffixes K, M and G (e.g. '256M').  Raise a
+    ValueError for unknown limits or invalid values.
+
+    """
+    if name not in LIMITS:
+        raise ValueError("Unknown resource limit '%s'" % name)
+    msg = "Invalid value '%s' for the resource limit '%s'" % (value, name)
+    if name in ("memory", "filesize"):
+        try:
+            return parse_size(value)
+        except ValueError:
+            raise ValueError(msg)
+    return _parse_amount(value, 1, msg)
+
+
+def _parse_amount(text, scale, msg):
+    # Non-negative number, multiplied by scale and rounded up.
+    try:
+        number = float(text) * scale
+    except ValueError:
+        number = -1
+    if not 0 <= number < math.inf:
+        raise ValueError(msg)
+    return int(math.ceil(number))
+
+
+def parse_limits(lines):
+    """Parse lines in the form 'name value' into a dictionary of limits."""
+    limits = {}
+    for line in lines:
+        f = line.split()
+        if not f:
+            continue
+        try:
+            if len(f) != 2:
+                raise ValueError("Invalid resource limit")
+            limits[f[0]] = parse_limit(f[0], f[1])
+        except ValueError as e:
+            raise ValueError("%s (line '%s')" % (e, line.strip()))
+    return limits
+
+
+# Command stopping itself before executing the program given as
+# argument, so that the limits can be set from outside (they are
+# inherited through exec).
+_WAIT_LIMITS = ["/bin/sh", "-c", 'kill -STOP $$ && exec "$@"', "sh"]
+
+
+def _rlimits(limits):
+    # Convert the limits into arguments for setrlimit.  Soft limits
+    # are never set above the current hard limits.  The hard limit
+    # on CPU time is one second larger, so that SIGXCPU is sent
+    # before the process gets killed.
+    rlimits = []
+    for name, value in limits.items():
+        res = LIMITS[name]
+        hard = resource.getrlimit(res)[1]
+        soft = (value if hard == resource.RLIM_INFINITY
+                else min(value, hard))
+        if name != "cpu":
+            hard = soft
+        elif hard == resource.RLIM_INFINITY or soft + 1 < hard:
+            hard = soft + 1
+        rlimits.append((res, (soft, hard)))
+    return rlimits
+
+
+# Maximum total size of the temporary files kept for reuse while no
+# process is using them.
+_TMPFILE_MAX_IDLE = 64 * 1024 * 1024
+
+# Seals making the content of a memfd immutable.
+_SEALS = (getattr(fcntl, "F_SEAL_SHRINK", 0) |
+          getattr(fcntl, "F_SEAL_GROW", 0) |
+          getattr(fcntl, "F_SEAL_WRITE", 0) |
+          getattr(fcntl, "F_SEAL_SEAL", 0))
+
+
+class _TempFile:
+    """A file in memory (memfd) or in a temporary directory.
+
+    path is the name to be given to the process; the descriptors in
+    pass_fds must be inherited by the process for the name to be
+    valid.
+
+    """
+
+    def __init__(self, path, fd=None, size=0):
+        self.path = path
+        self.fd = fd
+        self.size = size
+        self.users = 0
+        self.pass_fds = (() if fd is None else (fd,))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        else:
+            os.remove(self.path)
+
+
+def _memfd(name, sealing=False):
+    # Return a new memfd, or None where they are not supported.
+    if not hasattr(os, "memfd_create") or not os.path.isdir("/proc/self/fd"):
+        return None
+    flags = os.MFD_CLOEXEC | (os.MFD_ALLOW_SEALING if sealing else 0)
     try:
-        tmp.write(content)
-        tmp.close()
-        yield name
-    finally:
-        os.remove(name)
+        return os.memfd_create(name, flags)
+    except OSError:
+        return None
+
+
+def _tmpdir():
+    # Directory for the temporary files, preferably in memory.
+    return ("/dev/shm" if os.access("/dev/shm", os.W_OK) else None)
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+    return len(data)
+
+
+def _copy_file(path, fd):
+    # Copy the content of the file into fd and return its size.  The
+    # kernel copies the data (with sendfile), where possible.
+    with open(path, "rb") as src:
+        size = os.fstat(src.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                n = os.sendfile(fd, src.fileno(), offset, size - offset)
+                if n == 0:
+                    break
+                offset += n
+            return offset
+        except (AttributeError, OSError):
+            if offset > 0:
+                raise
+        for block in iter(lambda: src.read(1 << 20), b""):
+            offset += _write_all(fd, block)
+        return offset
+
+
+class _TempFiles:
+    """Temporary files filled with the given contents.
+
+    Each distinct content, or version of a file, is written only once
+    in a master file, which is kept as long as it is in use (and
+    later, within a limit on the total size).  Each process receives
+    its own copy of the master, made by the kernel, so that it can
+    freely modify it.
+
+    Files are created with memfd_create when possible: they live in
+    memory and disappear with the process, whatever the way it
+    terminates.  Otherwise they are placed in /dev/shm (or in the
+    default temporary directory) and removed at exit.
+
+    """
+
+    def __init__(self, max_idle=_TMPFILE_MAX_IDLE):
+        self._max_idle = max_idle
+        self._idle = 0
+        self._masters = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def get(self, content):
+        """Context manager providing a _TempFile with the content."""
+        data = content.encode(_FILE_ENCODING)
+        key = hashlib.sha256(data).digest()
+        with self._use(key, lambda fd: _write_all(fd, data)) as copy:
+            yield copy
+
+    @contextlib.contextmanager
+    def get_file(self, path):
+        """Context manager providing a _TempFile with a copy of a file."""
+        st = os.stat(path)
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._use(key, lambda fd: _copy_file(path, fd)) as copy:
+            yield copy
+
+    @contextlib.contextmanager
+    def _use(self, key, fill):
+        # Private copy of the master with the given key.  fill(fd)
+        # writes the content of a new master and returns its size.
+        master = self._acquire(key, fill)
+        try:
+            copy = self._copy(master)
+            try:
+                yield copy
+            finally:
+                copy.close()
+        finally:
+            self._release(master)
+
+    def close(self):
+        """Remove all the files not in use."""
+        with self._lock:
+            for key, master in list(self._masters.items()):
+                if master.users == 0:
+                    del self._masters[key]
+                    master.close()
+            self._idle = 0
+
+    def _acquire(self, key, fill):
+        with self._lock:
+            master = self._masters.get(key)
+            if master is None:
+                master = self._create(fill)
+                self._masters[key] = master
+            else:
+                self._masters.move_to_end(key)
+                if master.users == 0:
+                    self._idle -= master.size
+            master.users += 1
+        return master
+
+    def _release(self, master):
+        with self._lock:
+            master.users -= 1
+            if master.users == 0:
+                self._idle += master.size
+                self._evict()
+
+    def _evict(self):
+        # Remove the least recently used masters not in use.
+        for key, master in list(self._masters.items()):
+            if self._idle <= self._max_idle:
+                break
+            if master.users == 0:
+                del self._masters[key]
+                self._idle -= master.size
+                master.close()
+
+    def _create(self, fill):
+        fd = _memfd("pvcheck.master", sealing=True)
+        if fd is not None:
+            try:
+                size = fill(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+            try:
+                fcntl.fcntl(fd, fcntl.F_ADD_SEALS, _SEALS)
+            except (AttributeError, OSError):
+                pass
+            return _TempFile("/proc/self/fd/%d" % fd, fd, size)
+        fd, name = tempfile.mkstemp(suffix=".pvcheck.tmp", dir=_tmpdir())
+        try:
+            size = fill(fd)
+        except BaseException:
+            os.remove(name)
+            raise
+        finally:
+            os.close(fd)
+        os.chmod(name, stat.S_IRUSR)
+        return _TempFile(name, None, size)
+
+    def _copy(self, master):
+        if master.fd is not None:
+            fd = _memfd("pvcheck.tmp")
+            if fd is not None:
+                offset = 0
+                while offset < master.size:
+                    offset += os.sendfile(fd, master.fd, offset,
+                                          master.size - offset)
+                return _TempFile("/proc/self/fd/%d" % fd, fd, master.size)
+        fd, name = tempfile.mkstemp(suffix=".pvcheck.tmp", dir=_tmpdir())
+        os.close(fd)
+        try:
+            shutil.copyfile(master.path, name)
+        except OSError:
+            os.remove(name)
+            raise
+        return _TempFile(name, None, master.size)
+
+
+# Encoding of the content of temporary files (as in text files).
+_FILE_ENCODING = locale.getpreferredencoding(False)
+
+# Temporary files shared by all the executors.
+_TEMP_FILES = _TempFiles()
+atexit.register(_TEMP_FILES.close)
 
 
 ExecResult = collections.namedtuple(
-    'ExecResult', ['result', 'status', 'output', 'stderr']
+    'ExecResult', ['result', 'status', 'output', 'stderr',
+                   'wall_time', 'user_time', 'sys_time', 'max_rss'],
+    defaults=(None, None, None, None)
 )
+ExecResult.__doc__ = """Result of the execution of a process.
+
+Beside the result code, the exit status and the output, it includes
+the resources used by the process: wall clock time, user and system
+CPU time (all in seconds) and the peak resident set size (in KiB).
+These are None when the process could not be executed, and the peak
+memory also when it could not be measured (see _PeakRss).
+"""
+
+
+# Unit of ru_maxrss, in bytes
+_RSS_UNIT = (1 if sys.platform == "darwin" else 1024)
+
+# Time (in seconds) between the first two readings of the peak memory
+# of a running process.  The interval is doubled after each reading,
+# up to _POLL_INTERVAL.
+_RSS_INTERVAL = 0.001
+
+
+def _vm_hwm(pid):
+    # Peak resident set size (in KiB) of the current address space of
+    # the process, or None when it is not available.
+    try:
+        with open("/proc/%s/status" % pid, "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class _PeakRss:
+    """Peak resident set size of a child process, in KiB.
+
+    The ru_maxrss given by wait4 also covers the address space that
+    the child had before executing the program, which is that of
+    pvcheck (shared by vfork or copied by fork).  It is taken as the
+    peak of the program only when it exceeds the peak of pvcheck.
+    Otherwise the result is the last VmHWM (a high-water mark) read
+    from /proc while the program was running, which misses the memory
+    allocated after the reading.  Readings are frequent at first, so
+    that short programs are measured too.  Where /proc is not
+    available ru_maxrss is used as it is.
+
+    """
+
+    def __init__(self, pid):
+        self._pid = pid
+        self._peak = None
+        self._interval = _RSS_INTERVAL
+        self._next = 0.0
+        self.sample()
+
+    def timeout(self):
+        """Time left before the next reading."""
+        return max(0.0, self._next - time.monotonic())
+
+    def sample(self):
+        """Read the peak of the process, if a reading is due.
+
+        Must not be called after the process has been reaped, since
+        its pid could be reused.
+
+        """
+        now = time.monotonic()
+        if now < self._next:
+            return
+        self._next = now + self._interval
+        self._interval = min(self._interval * 2, _POLL_INTERVAL)
+        hwm = _vm_hwm(self._pid)
+        if hwm is not None and (self._peak is None or hwm > self._peak):
+            self._peak = hwm
+
+    def result(self, usage):
+        """Peak of the program, given the usage of the reaped process."""
+        maxrss = usage.ru_maxrss * _RSS_UNIT // 1024
+        inherited = _vm_hwm("self")
+        if inherited is None or maxrss > inherited:
+            return maxrss
+        return self._peak
+
+
+# Size of the blocks read from (and written to) the pipes
+_CHUNK_SIZE = 32768
+_PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
+
+# How often (in seconds) a waiting thread checks whether its process
+# has been killed by kill_all.
+_POLL_INTERVAL = 0.1
+
+
+class _OutputLimitExceeded(Exception):
+    pass
+
+
+class _ProcessKilled(Exception):
+    pass
+
+
+class _OutputRejected(Exception):
+    pass
+
+
+class _OutputBuffer:
+    """Collect the data read from a pipe enforcing the limits.
+
+    Lines and bytes are counted as the data arrive, so that the
+    process can be stopped as soon as one of the limits is exceeded.
+
+    """
+
+    def __init__(self, line_limit=None, byte_limit=None):
+        self.data = bytearray()
+        self.exceeded = False
+        self._lines = 0
+        self._line_limit = line_limit
+        self._byte_limit = byte_limit
+
+    def add(self, chunk):
+        """Append a chunk of data.
+
+        Return False when a limit is exceeded.  In that case the
+        content is truncated to the allowed amount.
+
+        """
+        start = len(self.data)
+        self.data += chunk
+        if self._line_limit is not None:
+            allowed = self._line_limit - self._lines
+            self._lines += chunk.count(b"\n")
+            if self._lines >= self._line_limit:
+                end = start
+                for _ in range(allowed):
+                    end = self.data.index(b"\n", end) + 1
+                if len(self.data) > end:
+                    del self.data[end:]
+                    self.exceeded = True
+        if (self._byte_limit is not None and
+                len(self.data) > self._byte_limit):
+            del self.data[self._byte_limit:]
+            self.exceeded = True
+        return not self.exceeded
+
+    def text(self):
+        """Decoded content."""
+        return self.data.decode('utf-8', errors='ignore')
 
 
 class Executor:
-    """Class capable of executing a process."""
-    
+    """Class capable of executing a process.
+
+    The same executor can be used concurrently by several threads.
+
+    """
+
+    def __init__(self):
+        self._running = set()
+        self._killed = set()
+        self._lock = threading.Lock()
+
+    def kill_all(self):
+        """Kill all the processes currently running.
+
+        The executions are interrupted even when the output pipes are
+        kept open by other processes started by the program.
+
+        """
+        with self._lock:
+            for proc in self._running:
+                self._kill(proc)
+                self._killed.add(proc)
+
     def exec_process(self, args, input, tmpfile=None, timeout=None,
-                     output_limit=None):
+                     output_limit=None, output_byte_limit=None,
+                     limits=None, monitor=None, input_file=None,
+                     tmpfile_from=None):
         """Execute a process.
 
         Parameters:
         args    - list of arguments (the first being the process name)
-        input   - text to be sent on the standard input
+        input   - text (or bytes) to be sent on the standard input
         tmpfile - optional temporary file (can be None)
         timeout - in seconds, None for unlimited time
         output_limit - maximum number of output lines, None if unlimited
+        output_byte_limit - maximum size of the output, None if unlimited
+        limits  - dictionary of resource limits (see LIMITS), or None
+        monitor - optional function receiving the standard output
+        input_file - file to be used as standard input, in place of input
+        tmpfile_from - file to be copied into the temporary file, in
+                  place of tmpfile
 
         When one of the arguments is the placehoder 'ARG_TMPFILE' it
         gets replaced by the name of a temporary file having the
@@ -60,52 +557,289 @@ class Executor:
 
         Return an ExecResult object, that is, a named tuple with the
         result of the execution, the status code of the terminated
-        process, and the output produced by the process.
+        process, the output produced by the process and the resources
+        it used.
+
+        The output limits are applied independently to stdout and
+        stderr.  The output is checked while it is produced, and the
+        process is killed as soon as a limit is exceeded.  In that
+        case the execution is considered as failed.
+
+        Resource limits are enforced by the kernel: they are set
+        before the program is executed.  Exceeding
+        the CPU time or the file size is detected, while the memory
+        limit only makes the allocations fail: the resulting failure
+        of the program is indistinguishable from any other error.
+
+        The input file is given to the process as its standard input
+        and is never read by this process.
+
+        The monitor, when given, is called with each chunk of bytes
+        read from the standard output.  When it returns False the
+        output is considered wrong, the process is killed and the
+        result is ER_MISMATCH.
 
-        The output limit is applied independently to stdout and stderr.
-        When exceeded the execution is considered as failed.
+        Processes killed by kill_all give ER_INTERRUPTED, unless they
+        already terminated by themselves.
+
+        When the input file or the file to be copied cannot be read
+        the result is ER_NOTFILE, and the name of the file is given in
+        place of the standard error.
 
         """
+        out = _OutputBuffer(output_limit, output_byte_limit)
+        err = _OutputBuffer(output_limit, output_byte_limit)
         with contextlib.ExitStack() as stack:
-            if tmpfile is not None:
-                tmpname = stack.enter_context(_make_temp_file(tmpfile))
-                args = self._replace_placeholder(args, tmpname)
-            outputb = b""
-            errorb = b""
+            pass_fds = ()
+            stdin = subprocess.PIPE
+            try:
+                tmp = None
+                if tmpfile_from is not None:
+                    tmp = stack.enter_context(
+                        _TEMP_FILES.get_file(tmpfile_from))
+                elif tmpfile is not None:
+                    tmp = stack.enter_context(_TEMP_FILES.get(tmpfile))
+                if tmp is not None:
+                    args = self._replace_placeholder(args, tmp.path)
+                    pass_fds = tmp.pass_fds
+                if input_file is not None:
+                    stdin = stack.enter_context(open(input_file, "rb"))
+            except OSError as e:
+                return ExecResult(ER_NOTFILE, 0, "", str(e.filename))
             ret_code = 0
+            proc = None
+            usage = None
+            rss = None
+            rlimits = _rlimits(limits or {})
+            start_time = time.monotonic()
             try:
-                proc = subprocess.Popen(args,
-                                        stdin=subprocess.PIPE,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE)
-                inputb = input.encode('utf-8', errors='ignore')
-                outputb, errorb = proc.communicate(inputb, timeout)
-                codes = {0: ER_OK, -signal.SIGSEGV: ER_SEGFAULT}
-                er = codes.get(proc.returncode, ER_ERROR)
+                proc = self._popen(args, rlimits,
+                                   stdin=stdin,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   pass_fds=pass_fds)
+                with self._lock:
+                    self._running.add(proc)
+                rss = _PeakRss(proc.pid)
+                if input_file is not None:
+                    inputb = b""
+                elif isinstance(input, bytes):
+                    inputb = input
+                else:
+                    inputb = input.encode('utf-8', errors='ignore')
+                usage = self._communicate(proc, inputb, out, err, timeout,
+                                          monitor, rss)
+                er = self._result_code(proc, usage, limits or {})
                 ret_code = proc.returncode
             except subprocess.TimeoutExpired:
                 er = ER_TIMEOUT
-                proc.kill()
-                proc.stdin.close()
-                proc.stdout.close()
-                proc.stderr.close()
-                proc.wait()
+                usage = self._terminate(proc)
+            except _OutputLimitExceeded:
+                er = ER_OUTPUT_LIMIT
+                usage = self._terminate(proc)
+                ret_code = proc.returncode
+            except _OutputRejected:
+                er = ER_MISMATCH
+                usage = self._terminate(proc)
+                ret_code = proc.returncode
+            except _ProcessKilled:
+                usage = self._wait(proc, rss=rss)
+                if self._drain(proc, out, err):
+                    er = self._result_code(proc, usage, limits or {})
+                else:
+                    er = ER_OUTPUT_LIMIT
+                self._close_pipes(proc)
+                ret_code = proc.returncode
             except FileNotFoundError:
                 er = ER_NOTFILE
-        output = outputb.decode('utf-8', errors='ignore')
-        error = errorb.decode('utf-8', errors='ignore')
-        if output_limit is not None:
-            lines = output.splitlines(True) 
-            if len(lines) > output_limit:
-                output = "".join(lines[:output_limit])
-                er = ER_OUTPUT_LIMIT
-            lines = error.splitlines(True) 
-            if len(lines)  > output_limit:
-                error = "".join(lines[:output_limit])
-                er = ER_OUTPUT_LIMIT
-        return ExecResult(er, ret_code, output, error)
+            finally:
+                with self._lock:
+                    self._running.discard(proc)
+                    self._killed.discard(proc)
+            wall_time = time.monotonic() - start_time
+        if usage is None:
+            return ExecResult(er, ret_code, out.text(), err.text())
+        return ExecResult(er, ret_code, out.text(), err.text(),
+                          wall_time, usage.ru_utime, usage.ru_stime,
+                          rss.result(usage))
+
+    def _popen(self, args, rlimits, **kwargs):
+        # Start the process with the given resource limits.  Setting
+        # them in the child (with preexec_fn) is not safe when other
+        # threads are running: where possible the process stops
+        # before executing the program, and the limits are set from
+        # here with prlimit.
+        if not rlimits:
+            return subprocess.Popen(args, **kwargs)
+        if not hasattr(resource, "prlimit"):
+            return subprocess.Popen(args, preexec_fn=_limiter(rlimits),
+                                    **kwargs)
+        if shutil.which(args[0]) is None:
+            raise FileNotFoundError(args[0])
+        proc = subprocess.Popen(_WAIT_LIMITS + list(args), **kwargs)
+        try:
+            pid, status = os.waitpid(proc.pid, os.WUNTRACED)
+            if not os.WIFSTOPPED(status):
+                proc.returncode = _exit_code(status)
+                raise subprocess.SubprocessError(
+                    "The process terminated before starting the program")
+            for res, values in rlimits:
+                resource.prlimit(proc.pid, res, values)
+            os.kill(proc.pid, signal.SIGCONT)
+        except BaseException:
+            if proc.returncode is None:
+                os.kill(proc.pid, signal.SIGKILL)
+                proc.wait()
+            raise
+        return proc
+
+    def _result_code(self, proc, usage, limits):
+        # Result of a process terminated by itself, or by kill_all.
+        returncode = proc.returncode
+        if returncode == -signal.SIGKILL and proc in self._killed:
+            return ER_INTERRUPTED
+        if returncode == 0:
+            return ER_OK
+        if returncode == -signal.SIGXCPU:
+            return ER_CPU_LIMIT
+        if returncode == -signal.SIGXFSZ:
+            return ER_FILE_LIMIT
+        if ("cpu" in limits and
+                usage.ru_utime + usage.ru_stime >= limits["cpu"]):
+            return ER_CPU_LIMIT
+        if returncode == -signal.SIGSEGV:
+            return ER_SEGFAULT
+        return ER_ERROR
+
+    def _communicate(self, proc, inputb, out, err, timeout, monitor=None,
+                     rss=None):
+        # Feed the standard input and collect the output of the
+        # process, until its termination.  Return the resource usage
+        # of the process.  Its peak memory is sampled into rss.
+        deadline = (None if timeout is None
+                    else time.monotonic() + timeout)
+        buffers = {proc.stdout: out, proc.stderr: err}
+        input_view = memoryview(inputb)
+        with selectors.DefaultSelector() as sel:
+            if inputb:
+                sel.register(proc.stdin, selectors.EVENT_WRITE)
+            elif proc.stdin is not None:
+                proc.stdin.close()
+            sel.register(proc.stdout, selectors.EVENT_READ)
+            sel.register(proc.stderr, selectors.EVENT_READ)
+            while sel.get_map():
+                remaining = self._remaining(deadline, proc)
+                wait = (_POLL_INTERVAL if remaining is None
+                        else min(remaining, _POLL_INTERVAL))
+                if rss is not None:
+                    wait = min(wait, rss.timeout())
+                ready = sel.select(wait)
+                if proc in self._killed:
+                    raise _ProcessKilled()
+                if rss is not None:
+                    rss.sample()
+                for key, events in ready:
+                    if key.fileobj is proc.stdin:
+                        try:
+                            n = os.write(key.fd, input_view[:_PIPE_BUF])
+                        except BrokenPipeError:
+                            n = len(input_view)
+                        input_view = input_view[n:]
+                        if not input_view:
+                            sel.unregister(proc.stdin)
+                            proc.stdin.close()
+                        continue
+                    chunk = os.read(key.fd, _CHUNK_SIZE)
+                    if not chunk:
+                        sel.unregister(key.fileobj)
+                        key.fileobj.close()
+                    elif not buffers[key.fileobj].add(chunk):
+                        raise _OutputLimitExceeded()
+                    elif (monitor is not None and
+                          key.fileobj is proc.stdout and
+                          not monitor(chunk)):
+                        raise _OutputRejected()
+        return self._wait(proc, deadline, rss)
+
+    def _wait(self, proc, deadline=None, rss=None):
+        # Wait for the termination of the process and return its
+        # resource usage.  The process is reaped with wait4 while
+        # holding the lock, so that kill_all never signals a process
+        # that does not exist anymore.
+        delay = 0.0001
+        while True:
+            if rss is not None:
+                rss.sample()
+            with self._lock:
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid != 0:
+                    proc.returncode = _exit_code(status)
+                    return usage
+            remaining = self._remaining(deadline, proc)
+            delay = min(delay * 2, 0.01, remaining or 0.01)
+            time.sleep(delay)
+
+    def _remaining(self, deadline, proc):
+        # Time left before the deadline.
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(proc.args, 0)
+        return remaining
+
+    def _terminate(self, proc):
+        # Kill the process, release its resources and return its
+        # resource usage.
+        with self._lock:
+            self._kill(proc)
+        self._close_pipes(proc)
+        return self._wait(proc)
+
+    def _drain(self, proc, out, err):
+        # Collect what a terminated process left in the pipes.  Other
+        # processes may keep them open: read only what is available.
+        # Return False when the output exceeds the limits.
+        for f, buf in ((proc.stdout, out), (proc.stderr, err)):
+            if f.closed:
+                continue
+            os.set_blocking(f.fileno(), False)
+            while True:
+                try:
+                    chunk = os.read(f.fileno(), _CHUNK_SIZE)
+                except BlockingIOError:
+                    break
+                if not chunk:
+                    break
+                if not buf.add(chunk):
+                    return False
+        return True
+
+    def _close_pipes(self, proc):
+        for f in (proc.stdin, proc.stdout, proc.stderr):
+            if f is not None:
+                f.close()
+
+    def _kill(self, proc):
+        # Must be called while holding the lock.
+        if proc.returncode is None:
+            os.kill(proc.pid, signal.SIGKILL)
 
     def _replace_placeholder(self, args, name):
         return [(name if a is ARG_TMPFILE else a) for a in args]
 
 
+def _limiter(rlimits):
+    # Function setting the limits in the child process.
+    def preexec():
+        for res, values in rlimits:
+            resource.setrlimit(res, values)
+    return preexec
+
+
+def _exit_code(status):
+    # Convert a status returned by wait into a return code, using
+    # the same convention of subprocess.
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
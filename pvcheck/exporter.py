@@ -4,9 +4,13 @@ from pvcheck.i18n import translate as _
 def export(test, test_index):
     """Export input data from a test."""
     output_file_name = _file_name_builder(test.description)
-    _input, _file = _get_data(test)
+    try:
+        _input, _file = _get_data(test)
+    except OSError as e:
+        _print_file_error_message(e.filename)
+        exit(1)
     if (_input is not None) or (_file is not None):
-        with open(output_file_name, 'w') as f:
+        with open(output_file_name, 'wb') as f:
             _write_data(f, _input, _file)
         exit(0)
     else:
@@ -26,15 +30,28 @@ def _file_name_builder(test_name):
 def _get_data(test):
     """Obtain data from certain sections of a test.
     
-    Sections: - [.INPUT]
-              - [.FILE]
+    Sections: - [.INPUT] (or the file named in [.INPUT_FILE])
+              - [.FILE] (or the file named in [.FILE_FROM])
+    
+    The data is returned as bytes.
     
     """
-    _input = test.find_section_content(".INPUT", None)
-    _file = test.find_section_content(".FILE", None)
+    _input = _section_or_file(test, ".INPUT", ".INPUT_FILE")
+    _file = _section_or_file(test, ".FILE", ".FILE_FROM")
     return _input, _file
 
 
+def _section_or_file(test, tag, path_tag):
+    """Content of the file named in path_tag, or else of the section."""
+    paths = test.find_section_content(path_tag, None)
+    if paths:
+        # The last one wins, when the prefix names a file as well.
+        with open(paths.splitlines()[-1], 'rb') as f:
+            return f.read()
+    content = test.find_section_content(tag, None)
+    return (content.encode() if content is not None else None)
+
+
 def _write_data(output_file, _input, _file):
     """Write data into the output file."""
     if _input is not None:
@@ -48,3 +65,10 @@ def _print_error_message(test_index):
     fmt = _("Error: Can't export test number %d.")
     msg = fmt % (test_index + 1)
     print("\n" + msg + "\n")
+
+
+def _print_file_error_message(path):
+    """Print an error message naming a file that cannot be read."""
+    fmt = _("Error: Can't read the file '%s'.")
+    msg = fmt % path
+    print("\n" + msg + "\n")
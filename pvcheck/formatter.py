@@ -1,8 +1,10 @@
 """Classes that communicate the results."""
 
 import sys
+import queue
+import threading
 from itertools import zip_longest
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import pvcheck.executor
 from pvcheck.i18n import translate as _
 
@@ -31,7 +33,8 @@ class Formatter:
     2b)  execution_result
     2c)  zero or more of comparison_result or missing_section
     2d)  end_test
-    3) end_session
+    3) tests_skipped, when the session is stopped before its end
+    4) end_session
 
     """
 
@@ -72,6 +75,187 @@ class Formatter:
         """
         pass
 
+    def tests_skipped(self, count):
+        """Called when the remaining tests are not going to be run.
+
+        - count: the number of tests skipped
+        """
+        pass
+
+
+def section_equality(diffs):
+    """Percentage of correct lines in a compared section."""
+    if not diffs:
+        return 100.0
+    return (len(diffs) - sum(diffs)) * 100 / len(diffs)
+
+
+def result_info(cmdline_args, execution_result):
+    """Values of the placeholders in the messages about an execution."""
+    progname = cmdline_args[0]
+    if (execution_result.result == pvcheck.executor.ER_NOTFILE and
+            execution_result.stderr):
+        # The missing file is not the program (see Executor).
+        progname = execution_result.stderr
+    return {
+        'progname': progname,
+        'status': execution_result.status
+    }
+
+
+class ResultCounts:
+    """Number of successes, warnings and errors."""
+
+    __slots__ = ("ok", "warning", "error", "_equality", "_measures")
+
+    def __init__(self):
+        self.ok = self.warning = self.error = 0
+        self._equality = 0.0
+        self._measures = 0
+
+    def add(self, outcome, equality=None):
+        """Count an outcome ("ok", "warning" or "error")."""
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        if equality is not None:
+            self._equality += equality
+            self._measures += 1
+
+    def total(self):
+        return self.ok + self.warning + self.error
+
+    def mean_equality(self):
+        """Average percentage of correct lines (0 when unknown)."""
+        return (self._equality / self._measures if self._measures else 0.0)
+
+
+class ResourceUsage:
+    """Statistics on a resource used by the program."""
+
+    __slots__ = ("count", "total", "maximum", "argmax")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.maximum = None
+        self.argmax = None
+
+    def add(self, value, name):
+        """Account for the value measured in the test with the given name."""
+        if value is None:
+            return
+        self.count += 1
+        self.total += value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+            self.argmax = name
+
+    def mean(self):
+        return (self.total / self.count if self.count else None)
+
+
+class ResultStats(Formatter):
+    """Formatter that accumulates the statistics of the session.
+
+    Formatters forward their messages to a ResultStats object and
+    query it for the summaries.  Every message is accounted for in
+    constant time.
+
+    Sections are counted as successes or errors after their
+    comparison, as warnings when they are missing, and as errors when
+    the execution of the program failed before they could be
+    compared.  A failed execution of a test without sections counts
+    as one error in the totals.  A test is an error when either the
+    execution or one of its sections failed, a warning when some
+    sections are missing, and a success otherwise.
+
+    """
+
+    RESOURCES = ("wall_time", "cpu_time", "user_time", "sys_time", "max_rss")
+
+    def __init__(self):
+        """Create the object."""
+        self.begin_session()
+
+    def begin_session(self):
+        self.test_count = 0
+        self.skipped = 0
+        self.totals = ResultCounts()
+        self.tests = ResultCounts()
+        self.resources = dict((r, ResourceUsage()) for r in self.RESOURCES)
+        self._sections = {}
+        self._test_name = None
+        self._test_status = "ok"
+        self._test_outcomes = 0
+        self._pending = {}
+
+    def sections(self):
+        """Tags of the sections, in order of first occurrence."""
+        return list(self._sections)
+
+    def section(self, tag):
+        """Counts for the section with the given tag."""
+        counts = self._sections.get(tag)
+        if counts is None:
+            counts = self._sections[tag] = ResultCounts()
+        return counts
+
+    def begin_test(self, description, cmdline_args, input, tempfile):
+        self.test_count += 1
+        self._test_name = (description if description is not None
+                           else "#%d" % self.test_count)
+        self._test_status = "ok"
+        self._test_outcomes = 0
+        self._pending = {}
+
+    def end_test(self):
+        # Sections left without an answer by a failed execution.
+        for tag in self._pending:
+            self._add(tag, "error", 0.0)
+        self._pending = {}
+        if self._test_status == "error" and self._test_outcomes == 0:
+            # No section to blame: count the execution itself.
+            self.totals.add("error")
+        self.tests.add(self._test_status)
+
+    def execution_result(self, cmdline_args, execution_result, test):
+        name = self._test_name
+        if execution_result.wall_time is not None:
+            self.resources["wall_time"].add(execution_result.wall_time, name)
+        if execution_result.user_time is not None:
+            cpu_time = execution_result.user_time + execution_result.sys_time
+            self.resources["cpu_time"].add(cpu_time, name)
+            self.resources["user_time"].add(execution_result.user_time, name)
+            self.resources["sys_time"].add(execution_result.sys_time, name)
+        self.resources["max_rss"].add(execution_result.max_rss, name)
+        if execution_result.result != pvcheck.executor.ER_OK:
+            self._test_status = "error"
+            sections = (test.sections(exclude_special=True)
+                        if test is not None else [])
+            for s in sections:
+                self.section(s.tag)
+                self._pending[s.tag] = None
+
+    def comparison_result(self, expected, got, diffs, matches):
+        outcome = ("ok" if max(diffs, default=0) == 0 else "error")
+        self._pending.pop(expected.tag, None)
+        self._add(expected.tag, outcome, section_equality(diffs))
+        if outcome == "error":
+            self._test_status = "error"
+
+    def missing_section(self, expected):
+        self._pending.pop(expected.tag, None)
+        self._add(expected.tag, "warning", 0.0)
+        if self._test_status == "ok":
+            self._test_status = "warning"
+
+    def tests_skipped(self, count):
+        self.skipped = count
+
+    def _add(self, tag, outcome, equality):
+        self.section(tag).add(outcome, equality)
+        self.totals.add(outcome)
+        self._test_outcomes += 1
+
 
 class TextFormatter(Formatter):
     """Formatter that writes the results as plain text."""
@@ -98,7 +282,15 @@ class TextFormatter(Formatter):
                  _("(ERROR CODE {status})")]),
         pvcheck.executor.ER_NOTFILE:
         (ERROR, [_("FAILED TO RUN THE FILE '{progname}'"),
-                 _("(the file does not exist)")])
+                 _("(the file does not exist)")]),
+        pvcheck.executor.ER_CPU_LIMIT:
+        (ERROR, [_("CPU TIME LIMIT EXCEEDED: PROCESS TERMINATED")]),
+        pvcheck.executor.ER_FILE_LIMIT:
+        (ERROR, [_("FILE SIZE LIMIT EXCEEDED: PROCESS TERMINATED")]),
+        pvcheck.executor.ER_MISMATCH:
+        (ERROR, [_("WRONG OUTPUT: PROCESS TERMINATED")]),
+        pvcheck.executor.ER_INTERRUPTED:
+        (ERROR, [_("PROCESS INTERRUPTED")])
     }
 
     def __init__(self, destination=sys.stdout, verbosity=None,
@@ -116,8 +308,7 @@ class TextFormatter(Formatter):
         self.set_verbosity(verbosity)
         self._dst = destination
         self._maxerrors = maxerrors
-        self._testcount = 0
-        self._test_status = None
+        self._stats = ResultStats()
 
     def set_verbosity(self, verbosity=None):
         """Set a new verbosity level (0-4)."""
@@ -179,23 +370,15 @@ class TextFormatter(Formatter):
 
     def begin_session(self):
         # Initialize the counters for the summary
-        self._testcount = 0
-        self._sect_results = []
-
-    def _unique(self, seq):
-        # Unique elements in seq, preserving their order of occurrence
-        seen = set()
-        for x in seq:
-            if x in seen:
-                continue
-            seen.add(x)
-            yield x
-
-    def _count_results(self, tag, label):
-        return sum(1 for x in self._sect_results if x == (tag, label))
+        self._stats.begin_session()
 
     def end_session(self):
-        if self._testcount < 2:
+        stats = self._stats
+        if stats.skipped > 0:
+            self.info("")
+            fmt = _("TOO MANY FAILURES: %d TESTS SKIPPED")
+            self.warning(fmt % stats.skipped)
+        if stats.test_count < 2:
             return
 
         # Write a summary of the session
@@ -204,17 +387,34 @@ class TextFormatter(Formatter):
         self.info("")
         self.info(_("SUMMARY"))
 
-        tags = list(self._unique(x[0] for x in self._sect_results))
-        l = max(map(len, tags))
-        for t in tags:
+        rows = [(t, stats.section(t)) for t in stats.sections()]
+        rows.append((_("<program>"), stats.tests))
+        l = max(len(t) for t, counts in rows)
+        for t, counts in rows:
             row = ["{:{}}:".format(t, l)]
 
-            row.append("%2d %s," % (self._count_results(t, "ok"), _("successes")))
-            row.append("%2d %s," % (self._count_results(t, "warning"), _("warnings")))
-            row.append("%2d %s" % (self._count_results(t, "error"), _("errors")))
+            row.append("%2d %s," % (counts.ok, _("successes")))
+            row.append("%2d %s," % (counts.warning, _("warnings")))
+            row.append("%2d %s" % (counts.error, _("errors")))
             self.info("  ".join(row))
         self.info("")
-        self._testcount = 0
+        if stats.resources["wall_time"].count > 0:
+            self._resource_summary()
+            self.info("")
+
+    def _resource_summary(self):
+        # Write the resources used by the program in the session.
+        wall = self._stats.resources["wall_time"]
+        fmt = _("TIME: %.2fs in total, %.2fs at most (%s)")
+        self.info(fmt % (wall.total, wall.maximum, wall.argmax))
+        user = self._stats.resources["user_time"].total
+        system = self._stats.resources["sys_time"].total
+        fmt = _("CPU TIME: %.2fs user, %.2fs system")
+        self.info(fmt % (user, system))
+        rss = self._stats.resources["max_rss"]
+        if rss.count > 0:
+            fmt = _("MEMORY: %d KB at most (%s)")
+            self.info(fmt % (rss.maximum, rss.argmax))
 
     def _proc_args(self, args):
         return [(a if a is not pvcheck.executor.ARG_TMPFILE
@@ -222,9 +422,9 @@ class TextFormatter(Formatter):
                 for a in args]
 
     def begin_test(self, description, cmdline_args, input, tempfile):
-        if self._testcount > 0:
+        if self._stats.test_count > 0:
             self.info("-" * 60)
-        self._testcount += 1
+        self._stats.begin_test(description, cmdline_args, input, tempfile)
         maxlines = (None if self.level_enabled(self.DEBUG) else 5)
         f = lambda tit,con: self._format_section(tit, con, maxlines)
         if description is not None:
@@ -235,21 +435,13 @@ class TextFormatter(Formatter):
             self.info(f(_("INPUT"), input))
         if tempfile is not None:
             self.info(f(_("TEMPORARY FILE"), tempfile))
-        self._test_status = None  # initialize test status
 
     def end_test(self):
-        if self._test_status == "ok":
-            self._sect_results.append((_("<program>"), "ok"))
-        elif self._test_status == "warning":
-            self._sect_results.append((_("<program>"), "warning"))
-        else:
-            self._sect_results.append((_("<program>"), "error"))
+        self._stats.end_test()
 
     def execution_result(self, cmdline_args, execution_result, test):
-        info = {
-            'progname': cmdline_args[0],
-            'status': execution_result.status
-        }
+        info = result_info(cmdline_args, execution_result)
+        self._stats.execution_result(cmdline_args, execution_result, test)
         level, lines = self._RESULT_TABLE[execution_result.result]
         msg = " ".join(lines).format(**info)
         if msg:
@@ -264,14 +456,10 @@ class TextFormatter(Formatter):
                                             maxlines=None))
 
     def comparison_result(self, expected, got, diffs, matches):
+        self._stats.comparison_result(expected, got, diffs, matches)
         if max(diffs, default=0) == 0:
-            self._sect_results.append((expected.tag, "ok"))
-            if self._test_status is None:
-                self._test_status = "ok"
             self.success("{}: {}".format(expected.tag, _("OK")))
         else:
-            self._sect_results.append((expected.tag, "error"))
-            self._test_status = "error"
             if len(expected.content) != len(got.content):
                 fmt = _("wrong number of lines (expected %d, got %d)")
                 msg = fmt % (len(expected.content), len(got.content))
@@ -327,11 +515,12 @@ class TextFormatter(Formatter):
             self.debug(fmt % (prnt(e), prnt(a)))
 
     def missing_section(self, expected):
-        if self._test_status != "ok" or self._test_status is None:
-            self._test_status = "warning"
-        self._sect_results.append((expected.tag, "warning"))
+        self._stats.missing_section(expected)
         self.warning(expected.tag + ": " + _("missing section"))
 
+    def tests_skipped(self, count):
+        self._stats.tests_skipped(count)
+
 
 class ColoredTextFormatter(TextFormatter):
     """A formatter that outputs colored messages.
@@ -398,3 +587,151 @@ class CombinedFormatter(Formatter):
     def missing_section(self, *args):
         for f in self.formatters:
             f.missing_section(*args)
+
+    def tests_skipped(self, *args):
+        for f in self.formatters:
+            f.tests_skipped(*args)
+
+
+# Message for a formatter: name of the method and its arguments.
+_Event = namedtuple("_Event", ["method", "args"])
+
+# Maximum number of messages waiting for each formatter.  When a queue
+# is full the tests wait for the formatter.
+DEFAULT_QUEUE_SIZE = 256
+
+
+class AsyncCombinedFormatter(Formatter):
+    """A formatter that broadcasts the messages to other formatters,
+    each one running in its own thread.
+
+    The messages are queued, so that slow formatters do not delay the
+    execution of the tests.  The arguments are shared by the threads
+    and must not be modified after they have been sent.
+
+    end_session returns when all the formatters have processed all
+    the messages, and raises the first exception raised by them.
+
+    """
+
+    def __init__(self, formatters=(), queue_size=DEFAULT_QUEUE_SIZE):
+        """Create the formatter.
+
+        queue_size is the maximum number of messages waiting for each
+        formatter.
+
+        """
+        self.formatters = list(formatters)
+        self._queue_size = queue_size
+        self._workers = []
+
+    def begin_session(self):
+        self._workers = [_FormatterThread(f, self._queue_size)
+                         for f in self.formatters]
+        self._send("begin_session")
+
+    def end_session(self):
+        self._send("end_session")
+        workers, self._workers = self._workers, []
+        for w in workers:
+            w.join()
+        for w in workers:
+            if w.error is not None:
+                raise w.error
+
+    def begin_test(self, *args):
+        self._send("begin_test", *args)
+
+    def end_test(self):
+        self._send("end_test")
+
+    def execution_result(self, *args):
+        self._send("execution_result", *args)
+
+    def comparison_result(self, expected, got, diffs, matches):
+        # The content of the output is computed when first accessed:
+        # do it here, not concurrently in the threads.
+        got.content
+        self._send("comparison_result", expected, got, diffs, matches)
+
+    def missing_section(self, *args):
+        self._send("missing_section", *args)
+
+    def tests_skipped(self, *args):
+        self._send("tests_skipped", *args)
+
+    def _send(self, method, *args):
+        event = _Event(method, args)
+        for w in self._workers:
+            w.queue.put(event)
+
+
+class _FormatterThread:
+    """Thread delivering the queued messages to a formatter."""
+
+    def __init__(self, formatter, queue_size):
+        self.formatter = formatter
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def join(self):
+        # Wait with a timeout, so that KeyboardInterrupt is not delayed.
+        while self._thread.is_alive():
+            self._thread.join(0.1)
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            # After an error the messages are consumed anyway, so
+            # that the sender never blocks.
+            if self.error is None:
+                try:
+                    getattr(self.formatter, event.method)(*event.args)
+                except BaseException as e:
+                    self.error = e
+            if event.method == "end_session":
+                break
+
+
+class RecordingFormatter(Formatter):
+    """A formatter that records the messages to replay them later.
+
+    Useful when the tests are run in background threads, but the
+    messages must be delivered to the actual formatters in order.
+
+    """
+
+    def __init__(self):
+        """Create the formatter."""
+        self.events = []
+
+    def replay(self, formatter):
+        """Send the recorded messages to another formatter."""
+        for name, args in self.events:
+            getattr(formatter, name)(*args)
+
+    def begin_session(self):
+        self.events.append(("begin_session", ()))
+
+    def end_session(self):
+        self.events.append(("end_session", ()))
+
+    def begin_test(self, *args):
+        self.events.append(("begin_test", args))
+
+    def end_test(self):
+        self.events.append(("end_test", ()))
+
+    def execution_result(self, *args):
+        self.events.append(("execution_result", args))
+
+    def comparison_result(self, *args):
+        self.events.append(("comparison_result", args))
+
+    def missing_section(self, *args):
+        self.events.append(("missing_section", args))
+
+    def tests_skipped(self, *args):
+        self.events.append(("tests_skipped", args))
@@ -1,5 +1,7 @@
 """Formatter producing HTML data"""
+import sys
 from pvcheck.jsonformatter import JSONFormatter
+import pvcheck.formatter
 import pvcheck.i18n
 
 
@@ -7,21 +9,45 @@ _ = pvcheck.i18n.translate
 _trans_dic = {"\n": "<br>", "–": "&ndash;", "—": "&mdash;", "&": "&amp;", ">": "&gt;", "<": "&lt;"}
 _trantab = str.maketrans(_trans_dic)
 
-section_summary = {}
-total_summary = {"ok": 0, "warning": 0, "error": 0}
-
 
 class HTMLFormatter(JSONFormatter):
 
-    def end_session(self):
+    def __init__(self, destination=sys.stdout, indent=None, test_file=None):
+        super().__init__(destination, indent=indent, test_file=test_file)
+        self._stats = pvcheck.formatter.ResultStats()
 
-        header = self._tests_table_header_builder()
-        for element in header:
-            if element != "TEST":
-                section_summary[element] = {"ok": 0, "warning": 0, "error": 0}
+    def begin_session(self):
+        super().begin_session()
+        self._stats.begin_session()
+
+    def begin_test(self, *args):
+        super().begin_test(*args)
+        self._stats.begin_test(*args)
+
+    def end_test(self):
+        super().end_test()
+        self._stats.end_test()
+
+    def execution_result(self, *args):
+        super().execution_result(*args)
+        self._stats.execution_result(*args)
 
+    def comparison_result(self, *args):
+        super().comparison_result(*args)
+        self._stats.comparison_result(*args)
+
+    def missing_section(self, *args):
+        super().missing_section(*args)
+        self._stats.missing_section(*args)
+
+    def tests_skipped(self, *args):
+        super().tests_skipped(*args)
+        self._stats.tests_skipped(*args)
+
+    def end_session(self):
         self.print_html_header()
         self.print_tests_table()
+        self.print_skipped_tests()
         self.print_tests_information()
         self.print_summary_table()
         print("    </body>")
@@ -123,11 +149,7 @@ class HTMLFormatter(JSONFormatter):
             header = ["TEST"]
         else:
             header = []
-        for test in self._tests:
-            section_names = list(test["sections"].keys())
-            for name in section_names:
-                if name not in header:
-                    header.append(name)
+        header.extend(self._stats.sections())
         return header
 
     @staticmethod
@@ -184,6 +206,12 @@ class HTMLFormatter(JSONFormatter):
             color = "black"
         print('                <td><font color="{}">{}</font></td>'.format(color, section.translate(_trantab)))
 
+    def print_skipped_tests(self):
+        """Print the number of tests not run after too many failures."""
+        if self._stats.skipped > 0:
+            msg = _("TOO MANY FAILURES: %d TESTS SKIPPED") % self._stats.skipped
+            print('        <p align="center"><font color="orange">{}</font></p>'.format(msg))
+
     def print_tests_information(self):
         """Print a section for each test containing results' information."""
         print('        <h2><a name="info">Info</a></h2>')
@@ -244,21 +272,13 @@ class HTMLFormatter(JSONFormatter):
 
     def _print_section_status_message(self, test, section):
         if test["sections"][section]["section status"] == "ok":
-            section_summary[section]["ok"] += 1
-            total_summary["ok"] += 1
             self._print_section_ok_message(section)
         elif test["sections"][section]["section status"] == "error":
-            section_summary[section]["error"] += 1
-            total_summary["error"] += 1
             for wrong_line in test["sections"][section]['wrong_lines']:
                 self._print_section_error_message(wrong_line, section)
         elif test["sections"][section]["section status"] == "exec_error":
-            section_summary[section]["error"] += 1
-            total_summary["error"] += 1
             self._print_section_exec_error_message(section)
         else:
-            section_summary[section]["warning"] += 1
-            total_summary["warning"] += 1
             self._print_section_warning_message(section)
 
     @staticmethod
@@ -314,20 +334,20 @@ class HTMLFormatter(JSONFormatter):
                 <th><font color = "red">{}</font></th>
             </tr>""".format(_("Summary"), _("Successes"), _("Warnings"), _("Errors")))
 
-    @staticmethod
-    def _print_section_summary_row(section):
+    def _print_section_summary_row(self, section):
+        counts = self._stats.section(section)
         print("            <tr>")
         print('                <td>{}</td>'.format(section))
-        print('                <td>{}</td>'.format(section_summary[section]["ok"]))
-        print('                <td>{}</td>'.format(section_summary[section]["warning"]))
-        print('                <td>{}</td>'.format(section_summary[section]["error"]))
+        print('                <td>{}</td>'.format(counts.ok))
+        print('                <td>{}</td>'.format(counts.warning))
+        print('                <td>{}</td>'.format(counts.error))
         print("            </tr>")
 
-    @staticmethod
-    def _print_total_summary_row():
+    def _print_total_summary_row(self):
+        counts = self._stats.totals
         print("            <tr>")
         print('                <td>{}</td>'.format(_("TOTAL")))
-        print('                <td>{}</td>'.format(total_summary["ok"]))
-        print('                <td>{}</td>'.format(total_summary["warning"]))
-        print('                <td>{}</td>'.format(total_summary["error"]))
+        print('                <td>{}</td>'.format(counts.ok))
+        print('                <td>{}</td>'.format(counts.warning))
+        print('                <td>{}</td>'.format(counts.error))
         print("            </tr>")
@@ -65,7 +65,17 @@ _translations = {
         "set the verbosity level, where the level must be an integer between 0 (minimum) and 4 (maximum). The default value is 3.": "imposto il livello di verbosità.  Il livello deve essere un valore intero tra 0 (minimo) e 3 (massimo).  Il default è 2.",
         "set how many seconds it should be waited for the termination of the program.  The default is 10 seconds.": "imposta per quanti secondi bisogna attendere la terminazione del programma.  Il default è pari a 10 secondi.",
         "cut the output of the program to a maximum of L lines.  The default is 10000.": "taglia l'output del programma ad un massimo di L linee.  Il default è 10000.",
+        "cut the output of the program to a maximum of N bytes.  By default there is no limit.": "taglia l'output del programma ad un massimo di N byte.  Per default non c'è limite.",
         "reports up to N errors per section (default 4).": "riporta fino ad un massimo di N errori per sezione (default 4).",
+        "run up to N tests in parallel (default 1).": "esegue fino ad N test in parallelo (default 1).",
+        "stop after the first failed test.": "si ferma al primo test fallito.",
+        "stop after N failed tests.": "si ferma dopo N test falliti.",
+        "always run the program, without using the cache of the results.": "esegue sempre il programma, senza usare la cache dei risultati.",
+        "directory where the results are cached (default ~/.cache/pvcheck).": "directory in cui sono memorizzati i risultati (default ~/.cache/pvcheck).",
+        "compress the log in an archive when it exceeds SIZE bytes (suffixes K, M and G are allowed, 0 means no limit).  The default is 10M.": "comprime il log in un archivio quando supera SIZE byte (sono ammessi i suffissi K, M e G, 0 indica nessun limite).  Il default è 10M.",
+        "number of log archives to be kept (default 5).": "numero di archivi del log da conservare (default 5).",
+        "compression of the log archives (default gzip).": "compressione degli archivi del log (default gzip).",
+        "log the output of all the tests, or only that of the failed ones (default all).": "registra nel log l'output di tutti i test, o solo quello dei test falliti (default all).",
         "uses the specified configuration file.": "utilizza il file di configurazione specificato.",
         "enable or disable colored output (default AUTO).": "abilita o disabilita l'output colorato (default AUTO).",
         "use Valgrind (if installed) to check memory usage.": "utilizza Valgrind (se installato) per controllare l'utilizzo della memoria.",
@@ -105,6 +115,7 @@ _translations = {
         "Invalid parameter ('%s')": "Parametro non valido ('%s')",
         "Invalid parameter ('%d')": "Parametro non valido('%d')",
         "Invalid parameter ('%f')": "Parametro non valido('%f')",
+        "Error in the test file: %s": "Errore nel file di test: %s",
         "TIMEOUT EXPIRED: PROCESS TERMINATED": "TEMPO LIMITE SCADUTO: PROCESSO TERMINATO",
         "TOO MANY OUTPUT LINES": "TROPPE LINEE DI OUTPUT",
         "PROCESS ENDED WITH A FAILURE": "PROCESSO TERMINATO CON UN FALLIMENTO",
@@ -112,6 +123,12 @@ _translations = {
         "(ERROR CODE {status})": "(CODICE D'ERRORE {status})",
         "FAILED TO RUN THE FILE '{progname}'": "IMPOSSIBILE ESEGUIRE IL FILE '{progname}'",
         "(the file does not exist)": "(file inesistente)",
+        "CPU TIME LIMIT EXCEEDED: PROCESS TERMINATED": "LIMITE DI TEMPO CPU SUPERATO: PROCESSO TERMINATO",
+        "FILE SIZE LIMIT EXCEEDED: PROCESS TERMINATED": "LIMITE DI DIMENSIONE DEI FILE SUPERATO: PROCESSO TERMINATO",
+        "WRONG OUTPUT: PROCESS TERMINATED": "OUTPUT ERRATO: PROCESSO TERMINATO",
+        "PROCESS INTERRUPTED": "PROCESSO INTERROTTO",
+        "compare the output while the program is running, and stop it as soon as the output is wrong.": "confronta l'output durante l'esecuzione del programma, e lo interrompe appena l'output risulta errato.",
+        "limit the resources available to the program (memory, cpu, filesize or files).  Can be repeated.": "limita le risorse disponibili al programma (memory, cpu, filesize o files).  Può essere ripetuto.",
         "(... plus other %d lines ...)": "(... più altre %d righe ...)",
         "SUMMARY": "RIEPILOGO",
         "Summary": "Riepilogo",
@@ -124,10 +141,18 @@ _translations = {
         "Errors": "Errori",
         "<program>": "<programma>",
         "CODE": "CODICE",
+        "TIME": "TEMPO",
+        "CPU TIME": "TEMPO CPU",
+        "MEMORY": "MEMORIA",
+        "TIME: %.2fs in total, %.2fs at most (%s)": "TEMPO: %.2fs in totale, %.2fs al massimo (%s)",
+        "CPU TIME: %.2fs user, %.2fs system": "TEMPO CPU: %.2fs utente, %.2fs sistema",
+        "MEMORY: %d KB at most (%s)": "MEMORIA: %d KB al massimo (%s)",
+        "TOO MANY FAILURES: %d TESTS SKIPPED": "TROPPI FALLIMENTI: %d TEST NON ESEGUITI",
         "TOTAL": "TOTALE",
         "Test number %d doesn't exist.": "Il test numero %d non esiste.",
         "Use './pvcheck info' to list all the available tests.": "Utilizza './pvcheck info' per vedere tutti i test disponibili.",
         "Error: Can't export test number %d.": "Errore: Impossibile esportare il test numero %d.",
+        "Error: Can't read the file '%s'.": "Errore: Impossibile leggere il file '%s'.",
         "file containing the tests to be performed (default pvcheck.test).": "file contenente i test da eseguire (default pvcheck.test).",
         "file containing the tests to be performed.": "file contenente i test da eseguire.",
         "program to be tested.": "programma da testare.",
@@ -174,6 +199,7 @@ _translations = {
         "this line was not expected": "questa riga e` inattesa",
         "TEST RUNNING": "TEST IN ESECUZIONE",
         "TEST COMPLETED": "TEST TERMINATO",
+        "TEST STOPPED (%d SKIPPED)": "TEST INTERROTTO (%d NON ESEGUITI)",
         "section [%s] is missing": "sezione [%s] non trovata",
         "execution failed": "esecuzione fallita",
         "%(prog)s: error: %(message)s\n": "%(prog)s: errore: %(message)s\n",
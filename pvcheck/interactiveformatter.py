@@ -4,6 +4,7 @@
 
 import curses
 import threading
+from array import array
 import pvcheck.formatter
 import pvcheck.executor
 import functools
@@ -137,7 +138,11 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
         pvcheck.executor.ER_OUTPUT_LIMIT: _("TOO MANY OUTPUT LINES"),
         pvcheck.executor.ER_SEGFAULT: _("PROCESS ENDED WITH A FAILURE (SEGMENTATION FAULT)"),
         pvcheck.executor.ER_ERROR: ("PROCESS ENDED WITH A FAILURE (ERROR CODE {status})"),
-        pvcheck.executor.ER_NOTFILE: _("FAILED TO RUN THE FILE '{progname}' the file does not exist)")
+        pvcheck.executor.ER_NOTFILE: _("FAILED TO RUN THE FILE '{progname}' the file does not exist)"),
+        pvcheck.executor.ER_CPU_LIMIT: _("CPU TIME LIMIT EXCEEDED: PROCESS TERMINATED"),
+        pvcheck.executor.ER_FILE_LIMIT: _("FILE SIZE LIMIT EXCEEDED: PROCESS TERMINATED"),
+        pvcheck.executor.ER_MISMATCH: _("WRONG OUTPUT: PROCESS TERMINATED"),
+        pvcheck.executor.ER_INTERRUPTED: _("PROCESS INTERRUPTED")
     }
 
     def __init__(self):
@@ -147,13 +152,8 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
         self._screen = None
         self._mutex = threading.Lock()
         self._initialization_barrier = None
-        self._sections = []
-        self._err_counts = {}
-        self._warn_counts = {}
-        self._ok_counts = {}
-        self._error_count = 0
-        self._warn_count = 0
-        self._ok_count = 0
+        self._stats = pvcheck.formatter.ResultStats()
+        self._view = None
 
     @_register_key("q", "Q", 27)  # 27 -> ESC
     def _quit(self):
@@ -235,8 +235,9 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
         self._screen.clear()
         doc = self._reports[self._report_index]
         text = [_("SUMMARY:"), ""]
-        for s in self._sections:
-            line = "%20s %3d ok  %3d warnings  %3d errors" % (s, self._ok_counts[s], self._warn_counts[s], self._err_counts[s])
+        for s in self._stats.sections():
+            counts = self._stats.section(s)
+            line = "%20s %3d ok  %3d warnings  %3d errors" % (s, counts.ok, counts.warning, counts.error)
             text.append(line)
         text.append(" ")
         self._show_info("\n".join(text))
@@ -270,6 +271,18 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
             with self._mutex:
                 _CALLBACKS.get(ch, lambda self: None)(self)
 
+    def _view_pad(self, height):
+        """Pad where the visible part of the documents is drawn.
+
+        The same pad, as large as the screen, is shared by all the
+        documents.
+        """
+        if self._view is None:
+            self._view = curses.newpad(height, self.MAX_W + 1)
+        elif self._view.getmaxyx()[0] != height:
+            self._view.resize(height, self.MAX_W + 1)
+        return self._view
+
     def _text_height(self):
         """Number of text lines displayed."""
         return self._screen.getmaxyx()[0] - self.FOOTER_H
@@ -286,10 +299,11 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
 
     def _add_short_report(self):
         """Insert ok, warnings, errors counters in the footer."""
+        counts = self._stats.totals
         texts = [
-            "%3d " % self._ok_count, " %s, " % _("passes"),
-            "%3d " % self._warn_count, " %s, " % _("warnings"),
-            "%3d " % self._err_count, " %s" % _("errors")
+            "%3d " % counts.ok, " %s, " % _("passes"),
+            "%3d " % counts.warning, " %s, " % _("warnings"),
+            "%3d " % counts.error, " %s" % _("errors")
         ]
         styles = [
             [curses.color_pair(self.COLOR_OK)], [],
@@ -312,7 +326,7 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
         width = self._text_width()
         doc = self._reports[self._report_index]
         self._footer.mvwin(height, 0)
-        doc.refresh(self._text_height(), self._text_width())
+        doc.refresh(self._view_pad(height), height, width)
         self._footer.clear()
         self._add_footer(0, "center", _("[Press 'h' for help]"), curses.A_DIM)
         text = _("Test case %d of %d (%s)") % (self._report_index, len(self._reports) - 1, doc.title) + " "
@@ -321,8 +335,10 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
         self._add_footer(0, "right", text)
         self._add_short_report()
         if self._running:
-            tot = self._err_count + self._warn_count + self._ok_count
+            tot = self._stats.totals.total()
             text = _("TEST RUNNING") + "..." + "|/-\\"[tot % 4]
+        elif self._stats.skipped > 0:
+            text = _("TEST STOPPED (%d SKIPPED)") % self._stats.skipped
         else:
             text = _("TEST COMPLETED")
         self._add_footer(1, "right", text, curses.A_BOLD)
@@ -331,36 +347,34 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
     def _show_info(self, text):
         """Show some text on the screen temporarily disabling the main interface."""
         self._screen.refresh()
-        lines = text.splitlines()
-        content_pad = curses.newpad(len(lines), 1 + max(map(len, lines)))
-        for n, line in enumerate(lines):
-            content_pad.addstr(n, 0, line)
-        start_line = 0
+        doc = Report("", self.MAX_W)
+        for line in text.splitlines():
+            doc.add_line(line)
         while True:
             height, width = self._screen.getmaxyx()
-            start_line = max(0, start_line)
-            start_line = min(len(lines) - height, start_line)
-            content_pad.refresh(start_line, 0, 0, 0, height - 1, width - 1)
+            width = min(width, self.MAX_W)
+            doc.scroll(height)
+            doc.refresh(self._view_pad(height), height, width)
             ch = self._screen.getch()
             if ch in (curses.KEY_DOWN, ord("n"), ord("N")):
-                start_line += 1
+                doc.scroll(height, 1)
             elif ch in (curses.KEY_UP, ord("p"), ord("P")):
-                start_line -= 1
+                doc.scroll(height, -1)
             elif ch == curses.KEY_NPAGE:
-                start_line += height
+                doc.scroll(height, pages=1)
             elif ch == curses.KEY_PPAGE:
-                start_line -= height
+                doc.scroll(height, pages=-1)
             elif ch == curses.KEY_END:
-                start_line += len(lines)
+                doc.scroll(height, documents=1)
             elif ch == curses.KEY_HOME:
-                start_line = 0
+                doc.scroll(height, documents=-1)
             else:
                 break
 
     # -- Formatter interface --------------------------------------------------
         
     def begin_session(self):
-        self._err_count = self._warn_count = self._ok_count = 0
+        self._stats.begin_session()
         self._running = True
         # Start the UI thread
         self._initialization_barrier = threading.Barrier(2)
@@ -377,6 +391,7 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
 
     @_synchronized
     def begin_test(self, description, cmdline_args, input, tempfile):
+        self._stats.begin_test(description, cmdline_args, input, tempfile)
         description = description or ""
         self._reports.append(Report(description, self.MAX_W, cmdline_args, input, tempfile))
         if self._report_index == 0:
@@ -385,41 +400,26 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
 
     @_synchronized
     def end_test(self):
-        pass
+        self._stats.end_test()
+        self._update()
 
     @_synchronized
     def execution_result(self, cmdline_args, execution_result, test):
-        info = {
-            'progname': cmdline_args[0],
-            'status': execution_result.status
-        }
+        info = pvcheck.formatter.result_info(cmdline_args, execution_result)
+        self._stats.execution_result(cmdline_args, execution_result, test)
         message = self._RESULT_TABLE[execution_result.result]
         if execution_result.result != pvcheck.executor.ER_OK:
-            self._err_count += 1
             message = message.format(**info)
             for line in message.splitlines():
                 self._reports[-1].add_line(line, curses.color_pair(self.COLOR_ERR))
         self._reports[-1].output = execution_result.output
         self._update()
 
-    def _new_section(self, section_name):
-        if section_name not in self._sections:
-            self._sections.append(section_name)
-            self._err_counts[section_name] = 0
-            self._warn_counts[section_name] = 0
-            self._ok_counts[section_name] = 0
-
     @_synchronized
     def comparison_result(self, expected, got, diffs, matches):
         add = self._reports[-1].add_line
         all_ok = (max(diffs, default=0) <= 0)
-        self._new_section(expected.tag)
-        if all_ok:
-            self._ok_count += 1
-            self._ok_counts[expected.tag] += 1
-        else:
-            self._err_count += 1
-            self._err_counts[expected.tag] += 1
+        self._stats.comparison_result(expected, got, diffs, matches)
         color = curses.color_pair(self.COLOR_OK if all_ok else self.COLOR_ERR)
         add("[%s]" % expected.tag, color | curses.A_BOLD)
 
@@ -448,11 +448,14 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
         add("")
         self._update()
 
+    @_synchronized
+    def tests_skipped(self, count):
+        self._stats.tests_skipped(count)
+        self._update()
+
     @_synchronized
     def missing_section(self, expected):
-        self._new_section(expected.tag)
-        self._warn_count += 1
-        self._warn_counts[expected.tag] += 1
+        self._stats.missing_section(expected)
         message = ("\t\t(" + _("section [%s] is missing") + ")") % expected.tag
         self._reports[-1].add_line(message, curses.color_pair(self.COLOR_WARN))
         self._reports[-1].add_line("")
@@ -460,7 +463,12 @@ class InteractiveFormatter(pvcheck.formatter.Formatter):
 
 
 class Report:
-    """Test result displayed on the screen."""
+    """Test result displayed on the screen.
+
+    The lines are kept as plain text, and only those visible are
+    drawn, so that the cost of the redraw does not depend on the
+    length of the document.
+    """
 
     def __init__(self, title, max_width, cmdline_args="", input="", tempfile=""):
         """Create a new report with the given title.
@@ -468,29 +476,36 @@ class Report:
         Lines are truncated to max_width.
         """
         self.title = title
-        self._length = 0
+        self._lines = []
+        self._attrs = array("L")
         self._max_width = max_width
-        self._pad = curses.newpad(1, max_width)
         self._position = 0
         self._cmdline_args = cmdline_args
         self._input = input
         self._tempfile = tempfile
         self.output = ""
 
-    def add_line(self, line, *extra):
+    def add_line(self, line, attr=0):
         """Add a line at the bottom of the document."""
-        self._pad.resize(self._length + 1, self._max_width)
-        self._pad.addnstr(self._length, 0, line, self._max_width, *extra)
-        self._length += 1
+        self._lines.append(line[:self._max_width])
+        self._attrs.append(attr)
 
     def scroll(self, page_height, lines=0, pages=0, documents=0):
         """Scroll up or down."""
-        amount = lines + page_height * pages + documents * self._length
-        self._position = max(0, min(self._position + amount, self._length - page_height))
-
-    def refresh(self, page_height, page_width):
-        """Redraw the document on the screen."""
-        self._pad.refresh(self._position, 0, 0, 0, page_height - 1, page_width - 1)
+        amount = lines + page_height * pages + documents * self.length()
+        self._position = max(0, min(self._position + amount, self.length() - page_height))
+
+    def refresh(self, pad, page_height, page_width):
+        """Redraw the document on the screen, by means of the given pad."""
+        pad.erase()
+        stop = min(self._position + page_height, self.length())
+        for row, n in enumerate(range(self._position, stop)):
+            try:
+                pad.addnstr(row, 0, self._lines[n], self._max_width, self._attrs[n])
+            except curses.error:
+                # Tabs may push the text beyond the border.
+                pass
+        pad.refresh(0, 0, 0, 0, page_height - 1, page_width - 1)
 
     def top(self):
         """Index of the first line on the screen (starting from 1)."""
@@ -498,11 +513,11 @@ class Report:
 
     def bottom(self, page_height):
         """Index of the last line on the screen."""
-        return min(self._position + page_height, self._length)
+        return min(self._position + page_height, self.length())
 
     def length(self):
         """Number of lines in the document."""
-        return self._length
+        return len(self._lines)
 
     def info(self):
         lines = [_("Test title: %s") % self.title]
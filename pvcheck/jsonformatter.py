@@ -7,9 +7,10 @@ from collections import OrderedDict
 from itertools import zip_longest
 import pvcheck.formatter
 import pvcheck.executor
+import pvcheck.testdata
 
 
-JSON_FORMAT_VER = "2.2.0"
+JSON_FORMAT_VER = "2.3.0"
 
 
 # TO BE DEFINED
@@ -28,7 +29,15 @@ class JSONFormatter(pvcheck.formatter.Formatter):
         pvcheck.executor.ER_ERROR:
         "PROCESS ENDED WITH A FAILURE (ERROR CODE {status})",
         pvcheck.executor.ER_NOTFILE:
-        "FAILED TO RUN THE FILE '{progname}' (the file does not exist)"
+        "FAILED TO RUN THE FILE '{progname}' (the file does not exist)",
+        pvcheck.executor.ER_CPU_LIMIT:
+        "CPU TIME LIMIT EXCEEDED: PROCESS TERMINATED",
+        pvcheck.executor.ER_FILE_LIMIT:
+        "FILE SIZE LIMIT EXCEEDED: PROCESS TERMINATED",
+        pvcheck.executor.ER_MISMATCH:
+        "WRONG OUTPUT: PROCESS TERMINATED",
+        pvcheck.executor.ER_INTERRUPTED:
+        "PROCESS INTERRUPTED"
     }
 
     def __init__(self, destination=sys.stdout, indent=None, test_file=None):
@@ -79,14 +88,15 @@ class JSONFormatter(pvcheck.formatter.Formatter):
 
     def execution_result(self, cmdline_args, execution_result, test):
         t = self._tests[-1]
-        info = {
-            "progname": cmdline_args[0],
-            "status": execution_result.status
-        }
+        info = pvcheck.formatter.result_info(cmdline_args, execution_result)
         msg = self._RESULT_TABLE[execution_result.result]
         t["return_code"] = execution_result.status
         t["error_message"] = msg.format(**info)
         t["output"] = execution_result.output
+        t["wall_time"] = execution_result.wall_time
+        t["user_time"] = execution_result.user_time
+        t["sys_time"] = execution_result.sys_time
+        t["max_rss"] = execution_result.max_rss
         self._sections = OrderedDict()
         if execution_result.result != pvcheck.executor.ER_OK:
             for s in test.sections(exclude_special=True):
@@ -104,15 +114,165 @@ class JSONFormatter(pvcheck.formatter.Formatter):
                                 matches, diffs)
                  if d > 0]
             
+        if isinstance(expected.content, pvcheck.testdata.MappedLines):
+            # Read from a file that can be very large: only its path
+            # is recorded.
+            content = None
+        else:
+            content = list(expected.content)
         s = OrderedDict([
             ("section status", status),
-            ("expected", expected.content),
-            ("generated", got.content),
+            ("expected", content),
+            ("generated", list(got.content)),
             ("wrong_lines", wrong),
 	    ("difference", sum(diffs))
         ])
+        if content is None:
+            s["expected_file"] = expected.content.path
         self._sections[expected.tag] = s
         
     def missing_section(self, expected):
         s = OrderedDict([("section status", "missing")])
         self._sections[expected.tag] = s
+
+    def tests_skipped(self, count):
+        self._obj["skipped_tests"] = count
+
+
+class JSONLinesFormatter(JSONFormatter):
+    """Formatter writing JSON Lines, one record at a time.
+
+    The session is written as a header record, one record for each
+    test (written when the test ends) and a footer record.  Each
+    record is a JSON object on a single line, with a "record" field
+    telling its kind ("session", "test" or "end").  The tests are not
+    kept in memory, and the records are flushed as soon as they are
+    written.  read_sessions rebuilds the documents written by
+    JSONFormatter.
+
+    When outputs is "failures", the output of the program is recorded
+    only for the failed tests (it is null for the others), and the
+    expected and generated lines only for the wrong sections.
+
+    """
+
+    def __init__(self, destination=sys.stdout, test_file=None,
+                 outputs="all"):
+        super().__init__(destination, None, test_file)
+        self._skipped = None
+        self._outputs = outputs
+        self._failed = False
+
+    def _write(self, kind, obj):
+        record = OrderedDict([("record", kind)])
+        record.update(obj)
+        self._dest.write(json.dumps(record) + "\n")
+        self._dest.flush()
+
+    def begin_session(self):
+        super().begin_session()
+        self._skipped = None
+        header = OrderedDict((k, v) for (k, v) in self._obj.items()
+                             if k != "tests")
+        self._write("session", header)
+
+    def begin_test(self, *args):
+        super().begin_test(*args)
+        self._failed = False
+
+    def execution_result(self, cmdline_args, execution_result, test):
+        super().execution_result(cmdline_args, execution_result, test)
+        if execution_result.result != pvcheck.executor.ER_OK:
+            self._failed = True
+
+    def comparison_result(self, expected, got, diffs, matches):
+        super().comparison_result(expected, got, diffs, matches)
+        if max(diffs, default=0) > 0:
+            self._failed = True
+
+    def missing_section(self, expected):
+        super().missing_section(expected)
+        self._failed = True
+
+    def end_test(self):
+        if not self._tests:
+            return
+        t = self._tests.pop()
+        if self._outputs == "failures":
+            if not self._failed:
+                t["output"] = None
+            for s in t.get("sections", {}).values():
+                if s.get("section status") == "ok":
+                    s["expected"] = None
+                    s["generated"] = None
+        self._write("test", t)
+
+    def tests_skipped(self, count):
+        self._skipped = count
+
+    def end_session(self):
+        footer = OrderedDict()
+        if self._skipped is not None:
+            footer["skipped_tests"] = self._skipped
+        self._write("end", footer)
+
+
+def read_sessions(f):
+    """Read the sessions written in a file (e.g. a log file).
+
+    Generate the documents in the format of JSONFormatter, also for
+    the sessions written by JSONLinesFormatter.  Sessions cut short
+    (without the footer record) include the tests written so far.
+    Damaged records, such as the last one written by a process that
+    was killed, are skipped.
+
+    """
+    text = f.read()
+    decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+    session = None
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos >= len(text):
+            break
+        try:
+            obj, end = decoder.raw_decode(text, pos)
+        except ValueError:
+            obj = None
+        if not isinstance(obj, dict):
+            pos = _next_record(text, pos)
+            continue
+        pos = end
+        kind = obj.pop("record", None)
+        if kind is None:
+            # A whole document
+            if session is not None:
+                yield session
+                session = None
+            yield obj
+        elif kind == "session":
+            if session is not None:
+                yield session
+            session = obj
+            session["tests"] = []
+        elif session is None:
+            continue  # The header is missing
+        elif kind == "test":
+            session["tests"].append(obj)
+        elif kind == "end":
+            session.update(obj)
+            yield session
+            session = None
+    if session is not None:
+        yield session
+
+
+def _next_record(text, pos):
+    # Position where the record following the damaged one at pos may
+    # start: the next line, or the next header when a new session was
+    # appended to a truncated line.
+    end = text.find("\n", pos)
+    header = text.find('{"record": "session"', pos + 1)
+    candidates = [p for p in (end + 1 if end >= 0 else -1, header) if p >= 0]
+    return min(candidates, default=len(text))
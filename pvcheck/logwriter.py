@@ -0,0 +1,149 @@
+"""Writer of the log file.
+
+The text is written by a background thread, so that a slow file
+system does not slow down the execution of the tests.  When, at the
+beginning of a session, the log is larger than its maximum size, it
+is compressed into an archive and a new log is started.  Only the
+most recent archives are kept.  Processes sharing the same log rotate
+it one at a time.
+"""
+
+import os
+import fcntl
+import gzip
+import lzma
+import queue
+import shutil
+import threading
+
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+
+# Maximum number of pieces of text waiting to be written.  When the
+# queue is full, writers wait for the background thread.
+DEFAULT_QUEUE_SIZE = 1024
+
+# Compression of the archives: extension and function opening them.
+COMPRESSIONS = {
+    "gzip": (".gz", gzip.open),
+    "lzma": (".xz", lzma.open),
+    "none": ("", open)
+}
+
+# Marks the end of the text in the queue.
+_END = None
+
+
+class LogWriter:
+    """File-like object appending text to a log file in background.
+
+    The file is opened immediately, so that errors are reported to
+    the caller.  Errors occurring later in the background thread are
+    raised by close.
+
+    """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE,
+                 backups=DEFAULT_BACKUPS, compression="gzip",
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        """Open the log file with the given path.
+
+        max_size is the size beyond which the log is rotated (0 for
+        no rotation), backups the number of archives to be kept and
+        compression one of the keys in COMPRESSIONS.
+
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression '%s'" % compression)
+        self._path = path
+        self._max_size = max_size
+        self._backups = backups
+        self._compression = compression
+        self._file = open(path, "at")
+        self._queue = queue.Queue(queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, text):
+        """Queue the text for writing."""
+        if self._error is None:
+            self._queue.put(text)
+
+    def flush(self):
+        """Nothing to do: the background thread writes as soon as possible."""
+        pass
+
+    def close(self):
+        """Write the pending text and close the file."""
+        if self._thread is not None:
+            self._queue.put(_END)
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        # Body of the background thread.
+        try:
+            if self._max_size > 0 and self._file.tell() > self._max_size:
+                self._rotate()
+            while True:
+                text = self._queue.get()
+                if text is _END:
+                    break
+                self._file.write(text)
+                if self._queue.empty():
+                    self._file.flush()
+        except Exception as e:
+            self._error = e
+            # Let the writers go on without blocking.
+            while self._queue.get() is not _END:
+                pass
+        finally:
+            self._file.close()
+
+    def _rotate(self):
+        # Archive the current log and start a new one.  Another
+        # process may be doing the same: the lock on the log makes
+        # them wait for each other, and the log is archived only if it
+        # has not been replaced in the meantime.
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            st = os.fstat(self._file.fileno())
+            try:
+                current = os.stat(self._path)
+            except FileNotFoundError:
+                current = None
+            if (current is not None and
+                    (current.st_dev, current.st_ino) == (st.st_dev, st.st_ino)
+                    and current.st_size > self._max_size):
+                self._archive()
+        finally:
+            self._file.close()  # Releases the lock
+        self._file = open(self._path, "at")
+
+    def _archive(self):
+        # Compress the log into the first archive and remove it.
+        ext, opener = COMPRESSIONS[self._compression]
+        names = ["%s.%d%s" % (self._path, n, ext)
+                 for n in range(1, self._backups + 1)]
+        if names:
+            if os.path.exists(names[-1]):
+                os.remove(names[-1])
+            for src, dst in reversed(list(zip(names, names[1:]))):
+                if os.path.exists(src):
+                    os.replace(src, dst)
+            tmpname = names[0] + ".tmp"
+            with open(self._path, "rb") as src, opener(tmpname, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmpname, names[0])
+        os.remove(self._path)
@@ -12,6 +12,7 @@ import sys
 from pvcheck.argparser import ArgParser
 import os
 import math
+import hashlib
 import pvcheck.pvcheck
 import pvcheck.parser
 import pvcheck.testdata
@@ -24,6 +25,8 @@ import pvcheck.executor
 import pvcheck.valgrind
 import pvcheck.i18n
 import pvcheck.exporter
+import pvcheck.cache
+import pvcheck.logwriter
 
 
 _ = pvcheck.i18n.translate
@@ -43,6 +46,9 @@ def parse_options():
     color = (color == "YES" or (color == "AUTO" and sys.stdout.isatty()))
     format = args.format
     logfile = args.log
+    log_options = dict(max_size=args.log_size, backups=args.log_backups,
+                       compression=args.log_compression)
+    log_outputs = args.log_outputs
     valgrind = args.valgrind
     run = args.test
     export = args.test_number
@@ -52,12 +58,21 @@ def parse_options():
     program_arguments = args.program_arguments
     maxerrors = args.errors
     output_limit = args.output_limit
+    output_bytes = args.output_bytes
+    limits = dict(args.limit)
+    jobs = args.jobs
+    cache_dir = (None if args.no_cache else args.cache_dir)
+    maxfail = (1 if args.exitfirst else args.maxfail)
+    stream = args.stream
 
     args = dict(test_file=test_file, program=program, program_arguments=program_arguments
                 )
     opts = dict(config=config, verbosity=verbosity, timeout=timeout,
                 maxerrors=maxerrors, color=color, valgrind=valgrind,
-                format=format, logfile=logfile, list=list, run=run, export=export, output_limit=output_limit)
+                format=format, logfile=logfile, log_options=log_options,
+                log_outputs=log_outputs, list=list, run=run, export=export, output_limit=output_limit,
+                output_bytes=output_bytes, limits=limits, jobs=jobs,
+                cache_dir=cache_dir, maxfail=maxfail, stream=stream)
     return args, opts
 
 
@@ -87,13 +102,40 @@ def _initialized_argparser():
                             action='store_true')
     a("-l", "--log", help=_("specify the name of the file used for logging.  The default is "
                             "~/.pvcheck.log."), nargs='?', const=_DEFAULT_LOG_FILE, default=_DEFAULT_LOG_FILE)
+    a("--log-size", help=_("compress the log in an archive when it exceeds SIZE bytes (suffixes K, M "
+                           "and G are allowed, 0 means no limit).  The default is 10M."),
+                           metavar="SIZE", default=pvcheck.logwriter.DEFAULT_MAX_SIZE, type=check_size)
+    a("--log-backups", help=_("number of log archives to be kept (default 5)."), metavar="N",
+                              default=pvcheck.logwriter.DEFAULT_BACKUPS, type=check_int_non_negative)
+    a("--log-compression", help=_("compression of the log archives (default gzip)."), default="gzip",
+                                  choices=tuple(pvcheck.logwriter.COMPRESSIONS))
+    a("--log-outputs", help=_("log the output of all the tests, or only that of the failed ones "
+                              "(default all)."), default="all", choices=("all", "failures"))
     a("-L", "--output_limit", help=_("cut the output of the program to a maximum of L lines.  "
                             "The default is 10000."), nargs='?', const=10000, default=10000,
                             type=check_int_non_negative)
+    a("--output-bytes", help=_("cut the output of the program to a maximum of N bytes.  "
+                            "By default there is no limit."), default=None,
+                            type=check_int_non_negative)
+    a("--limit", help=_("limit the resources available to the program (memory, cpu, "
+                        "filesize or files).  Can be repeated."), metavar="NAME=VALUE",
+                        action="append", default=[], type=check_limit)
+    a("-j", "--jobs", help=_("run up to N tests in parallel (default 1)."), default=1,
+                            type=check_int_greater_than_one)
+    a("-x", "--exitfirst", help=_("stop after the first failed test."),
+                            action='store_true')
+    a("--maxfail", help=_("stop after N failed tests."), default=None, metavar="N",
+                            type=check_int_greater_than_one)
+    a("--stream", help=_("compare the output while the program is running, and stop it as soon as "
+                         "the output is wrong."), action='store_true')
+    a("--no-cache", help=_("always run the program, without using the cache of the results."),
+                            action='store_true')
+    a("--cache-dir", help=_("directory where the results are cached (default ~/.cache/pvcheck)."),
+                            default=pvcheck.cache.default_directory())
     a("-c", "--config", help=_("uses the specified configuration file."), nargs='?', const='',
                             default='')
     a("-F", "--format", help=_("select the output type."), default='interactive',
-      choices=('interactive', 'text', 'json', 'csv', 'html'))
+      choices=('interactive', 'text', 'json', 'jsonl', 'csv', 'html'))
     a("-C", "--color", help=_("enable or disable colored output (default AUTO)."), nargs='?',
                                const='AUTO', default='AUTO', choices=('YES', 'NO', 'AUTO'))
 
@@ -105,7 +147,10 @@ def _initialized_argparser():
     parser_info.add_argument("file", help=_("file containing the tests to be performed."))
     parser_info.set_defaults(config='', timeout=10, verbosity=3, errors=4, color='AUTO', valgrind=False,
                              format='text', log=_DEFAULT_LOG_FILE, test=None, program=None, program_arguments=None,
-                             test_number=None, info=True, output_limit=10000)
+                             test_number=None, info=True, output_limit=10000, output_bytes=None,
+                             limit=[], jobs=1, exitfirst=False, maxfail=None, stream=False, no_cache=False,
+                             log_size=0, log_backups=0, log_compression='gzip', log_outputs='all',
+                             cache_dir=pvcheck.cache.default_directory())
 
     # create the parser for the "export" command
     parser_export = subparsers.add_parser('export', help=_("export in a file the input arguments from the selected "
@@ -116,7 +161,10 @@ def _initialized_argparser():
     parser_export.add_argument("file", help=_("file containing the tests to be exported."))
     parser_export.set_defaults(config='', timeout=10, verbosity=3, errors=4, color='AUTO', valgrind=False,
                                format='text', log=_DEFAULT_LOG_FILE, test=None, program=None, program_arguments=None,
-                               info=False, output_limit=10000)
+                               info=False, output_limit=10000, output_bytes=None,
+                               limit=[], jobs=1, exitfirst=False, maxfail=None, stream=False, no_cache=False,
+                               log_size=0, log_backups=0, log_compression='gzip', log_outputs='all',
+                               cache_dir=pvcheck.cache.default_directory())
 
     return argparser
 
@@ -142,13 +190,75 @@ def check_int_greater_than_one(value):
     return ivalue
 
 
+def check_size(value):
+    try:
+        return pvcheck.executor.parse_size(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError((_("Invalid parameter"), "('%s')" % value))
+
+
+def check_limit(value):
+    name, sep, limit = value.partition("=")
+    try:
+        if not sep:
+            raise ValueError
+        return (name, pvcheck.executor.parse_limit(name, limit))
+    except ValueError:
+        raise argparse.ArgumentTypeError((_("Invalid parameter"), "('%s')" % value))
+
+
 def parse_file(filename):
     """Read the content of a file containing tests."""
     if filename == "":
         return []
     try:
         with open(filename, "rt") as f:
-            return list(pvcheck.parser.parse_sections(f))
+            sections = list(pvcheck.parser.parse_sections(f))
+        return pvcheck.testdata.resolve_paths(sections,
+                                              os.path.dirname(filename))
+    except FileNotFoundError as e:
+        print(e)
+        sys.exit(1)
+
+
+def load_suite(config, test_file, valgrind=False, cache_dir=None):
+    """Build the test suite from the configuration and the test file.
+
+    When cache_dir is given, the suite is taken from the cache of the
+    parsed suites whenever the files did not change.
+
+    """
+    def build():
+        cfg = parse_file(config)
+        td = parse_file(test_file)
+        if valgrind:
+            cfg.append(pvcheck.testdata.Section('VALGRIND', []))
+        return pvcheck.testdata.TestSuite(cfg + td)
+
+    if cache_dir is None:
+        return build()
+    cache = pvcheck.cache.SuiteCache(os.path.join(cache_dir, "suites"))
+    return cache.get([config, test_file], build,
+                     variant=("valgrind" if valgrind else ""))
+
+
+def load_lazy_suite(config, test_file, valgrind=False, cache_dir=None):
+    """Build a suite whose test cases are parsed only when accessed.
+
+    When cache_dir is given, the position of the tests in the file is
+    saved there for the next time.
+
+    """
+    cfg = parse_file(config)
+    if valgrind:
+        cfg.append(pvcheck.testdata.Section('VALGRIND', []))
+    index_file = None
+    if cache_dir is not None:
+        name = hashlib.sha256(os.path.abspath(test_file).encode("utf-8"))
+        index_file = os.path.join(cache_dir, "index",
+                                  name.hexdigest() + ".json")
+    try:
+        return pvcheck.testdata.LazyTestSuite(test_file, cfg, index_file)
     except FileNotFoundError as e:
         print(e)
         sys.exit(1)
@@ -156,10 +266,7 @@ def parse_file(filename):
 
 def test_names_list(test_suite):
     """Build a list containing all the test names of a test suite."""
-    test_names = []
-    for test in test_suite.test_cases():
-        test_names.append(test.description)
-    return test_names
+    return test_suite.descriptions()
 
 
 def print_test_names_list(test_suite):
@@ -182,21 +289,19 @@ def main():
 
     single_test_index = None
 
-    cfg = parse_file(opts["config"])
+    # A single test is parsed without reading the whole suite.
+    if (opts["list"] or opts["run"] is not None or
+            opts["export"] is not None):
+        loader = load_lazy_suite
+    else:
+        loader = load_suite
+    suite = loader(opts["config"], args["test_file"], opts["valgrind"],
+                   opts["cache_dir"])
 
     if opts["list"]:
-        td = parse_file(args["test_file"])
-        suite = pvcheck.testdata.TestSuite(cfg + td)
         print_test_names_list(suite)
         exit(0)
 
-    td = parse_file(args["test_file"])
-
-    if opts['valgrind']:
-        cfg.append(pvcheck.testdata.Section('VALGRIND', []))
-
-    suite = pvcheck.testdata.TestSuite(cfg + td)
-
     if opts['run'] is not None and opts['export'] is None:
         single_test_index = opts['run'] - 1
         suite = suite.test_case(single_test_index)
@@ -214,6 +319,8 @@ def main():
         fmt = pvcheck.interactiveformatter.InteractiveFormatter()
     elif opts["format"] == "json":
         fmt = pvcheck.jsonformatter.JSONFormatter(indent=4, test_file=args["test_file"])
+    elif opts["format"] == "jsonl":
+        fmt = pvcheck.jsonformatter.JSONLinesFormatter(test_file=args["test_file"])
     elif opts["format"] == "csv":
         fmt = pvcheck.csvformatter.CSVFormatter()
     elif opts["format"] == "html":
@@ -232,21 +339,37 @@ def main():
     if args['program_arguments'] is not None:
         program.extend(args['program_arguments'])
 
-    with open(opts["logfile"], "at") as logfile:
-        logfmt = pvcheck.jsonformatter.JSONFormatter(logfile,
-                                             test_file=args["test_file"])
-        combfmt = pvcheck.formatter.CombinedFormatter([fmt, logfmt])
-        pvc = pvcheck.pvcheck.PvCheck(exe, combfmt)
+    with pvcheck.logwriter.LogWriter(opts["logfile"], **opts["log_options"]) as logfile:
+        logfmt = pvcheck.jsonformatter.JSONLinesFormatter(logfile,
+                                                  test_file=args["test_file"],
+                                                  outputs=opts["log_outputs"])
+        combfmt = pvcheck.formatter.AsyncCombinedFormatter([fmt, logfmt])
+        cache = None
+        if opts["cache_dir"] is not None:
+            cache = pvcheck.cache.ResultCache(os.path.join(opts["cache_dir"], "results"))
+        pvc = pvcheck.pvcheck.PvCheck(exe, combfmt, cache=cache)
         try:
             if single_test_index is None:
                 failures = pvc.exec_suite(suite, program,
                                           timeout=opts["timeout"],
-                                          output_limit=opts["output_limit"])
+                                          output_limit=opts["output_limit"],
+                                          output_byte_limit=opts["output_bytes"],
+                                          limits=opts["limits"],
+                                          jobs=opts["jobs"],
+                                          maxfail=opts["maxfail"],
+                                          stream=opts["stream"],
+                                          maxerrors=opts["maxerrors"])
             else:
                 failures = pvc.exec_single_test(suite, program,
                                                 timeout=opts["timeout"],
-                                                output_limit=opts["output_limit"])
+                                                output_limit=opts["output_limit"],
+                                                output_byte_limit=opts["output_bytes"],
+                                                limits=opts["limits"],
+                                                stream=opts["stream"],
+                                                maxerrors=opts["maxerrors"])
             retcode = min(failures, 254)
+        except pvcheck.testdata.TestFileError as e:
+            print(_("Error in the test file: %s") % e, file=sys.stderr)
         finally:
             # in case of exception (e.g. tested a non executable file) write a
             # newline to the json log
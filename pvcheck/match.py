@@ -4,14 +4,31 @@ Used to compare the expected and the actual outputs.
 """
 
 import re
-from itertools import zip_longest
+import operator
+from itertools import zip_longest, chain, compress
+from collections import deque
+from collections.abc import Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 _RE_INT = re.compile(r'(-|\+)?[0-9]+')
 _RE_REAL = re.compile(r'(-|\+)?[0-9]+\.(?P<frac>[0-9]*)')
 
+# Maximum number of inserted and deleted lines considered when
+# aligning ordered sections.
+DEFAULT_MAX_ALIGN_COST = 1000
+
+# Minimum number of elements in an ordered numeric section for which
+# the comparison is vectorized (when numpy is available).
+_NUMPY_MIN_ELEMENTS = 4096
 
-def compare_sections(actual, expected, ordered=True):
+
+def compare_sections(actual, expected, ordered=True, aligned=False,
+                     max_cost=DEFAULT_MAX_ALIGN_COST):
     """Compare the content of two sections.
 
     The 'ordered' parameter indicates whether or not the order of the
@@ -34,59 +51,217 @@ def compare_sections(actual, expected, ordered=True):
     returned matches would produce a side-by-side comparison of the
     matched lines, with None values filling the holes.
 
+    When both 'ordered' and 'aligned' are True, the two sections are
+    aligned by computing the shortest sequence of line insertions and
+    deletions transforming one into the other.  Extra lines in
+    'actual' are then reported as unmatched, and missing lines are
+    appended to the matches, as for unordered sections.  When more
+    than 'max_cost' insertions and deletions would be needed, lines
+    are compared by position instead.
+
+    The 'expected' section can be given as a list of lines or as the
+    result of compile_section.  The latter is convenient when the
+    same section is compared many times.
+
     """
-    if ordered:
-        matched = list(expected)
-        diffs = _compare_ordered_sections(actual, matched)
+    if not isinstance(expected, CompiledSection):
+        expected = CompiledSection(expected)
+    result = None
+    if ordered and aligned:
+        result = _compare_aligned_sections(actual, expected, max_cost)
+    if result is not None:
+        diffs, matched = result
+    elif ordered:
+        matched = list(expected.lines)
+        diffs = _compare_ordered_sections(actual, expected)
         matched.extend([None] * (len(actual) - len(matched)))
     else:
         diffs, matched = _compare_unordered_sections(actual, expected)
     return (diffs, matched)
 
 
-def _compare_elements(value, expected):
-    """Compare a pair of elements.
+def compare_ordered_chunks(actual, chunks):
+    """Compare an ordered section with expected lines given in chunks.
+
+    chunks is an iterable of lists of lines.  The result is the same
+    of compare_sections(actual, expected), where expected is the
+    concatenation of the chunks, but only one chunk at a time is
+    compiled and kept in memory.  The matches include only the
+    expected lines paired with wrong lines: the correct actual lines
+    stand for the lines they matched (see _ChunkMatches).
+
+    """
+    diffs = []
+    wrong = {}
+    start = 0
+    for lines in chunks:
+        d, m = compare_sections(actual[start:start + len(lines)], lines)
+        for k, x in enumerate(d):
+            if x > 0:
+                wrong[start + k] = m[k]
+        diffs.extend(d)
+        start += len(lines)
+    extra = len(actual) - start
+    if extra > 0:
+        diffs.extend([1.0] * extra)
+        wrong.update((n, None) for n in range(start, len(actual)))
+    return (diffs, _ChunkMatches(actual, wrong, len(diffs)))
+
+
+class _ChunkMatches(Sequence):
+    """Matches computed by compare_ordered_chunks.
+
+    wrong maps the positions of the wrong lines to the expected lines
+    (or None); at the other positions the actual lines are returned.
+
+    """
+
+    def __init__(self, actual, wrong, length):
+        self._actual = actual
+        self._wrong = wrong
+        self._len = length
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[i] for i in range(*n.indices(self._len))]
+        if n < 0:
+            n += self._len
+        if not 0 <= n < self._len:
+            raise IndexError("match index out of range")
+        if n in self._wrong:
+            return self._wrong[n]
+        return self._actual[n]
+
+
+# Kinds of elements in the expected lines
+_STRING = 0
+_INT = 1
+_REAL = 2
+_NEVER = 3
+
+
+class CompiledSection:
+    """Expected lines prepared for the comparison.
 
-    Return true if value matches expected value.  The type of
-    comparison (numerical with a set precision or textual) is inferred
-    from the expected value.
+    Each line is split into elements, and each element is converted
+    into a matcher (kind, value, digits, text), where the kind tells
+    whether the value must be compared as a string, as an integer or
+    as a real number with the given number of fractional digits.  An
+    actual element equal to the text always matches, unless the kind
+    is _NEVER.
+
+    """
+
+    def __init__(self, lines):
+        """Compile the given lines."""
+        self.lines = lines
+        self.matchers = [tuple(_compile_element(e) for e in line.split())
+                         for line in lines]
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def numeric_arrays(self):
+        """Return the arrays used by the vectorized comparison.
+
+        The result is None when numpy is not available, when the
+        section is small or when some elements are not numbers.
+
+        """
+        if self._arrays is None:
+            self._arrays = _NumericArrays.build(self.matchers) or False
+        return self._arrays or None
+
+
+def compile_section(expected):
+    """Prepare the expected lines for repeated comparisons."""
+    return CompiledSection(expected)
+
+
+def _compile_element(expected):
+    """Build the matcher for an element.
+
+    The type of comparison (numerical with a set precision or
+    textual) is inferred from the expected value.
 
     """
     m = _RE_REAL.fullmatch(expected)
     if m is not None:
         # If the expected value is a fractional number, compare the
         # result up to the given number of digits.
+        value = float(expected)
         digits = len(m.group('frac'))
-        try:
-            return float(expected) == round(float(value), digits)
-        except ValueError:
-            return False
+        if round(value, digits) != value:
+            # Not even the expected text matches itself.
+            return (_NEVER, value, digits, None)
+        return (_REAL, value, digits, expected)
     elif _RE_INT.fullmatch(expected):
         # If the expected value is an integer, compare by value so
         # that 15, +15 and 015 are considered as equivalent.
         try:
-            return int(expected) == int(value)
+            return (_INT, int(expected), 0, expected)
         except ValueError:
-            return False
+            # Too many digits for a conversion.
+            return (_NEVER, None, 0, None)
     else:
         # In the general case just compare the strings.
-        return (value == expected)
+        return (_STRING, expected, 0, expected)
+
+
+def _compare_elements(value, matcher):
+    """Compare an element with a matcher.
+
+    Return true if value matches the expected value.
+
+    """
+    kind, expected, digits, text = matcher
+    if value == text:
+        return True
+    try:
+        if kind == _REAL:
+            return expected == round(float(value), digits)
+        elif kind == _INT:
+            return expected == int(value)
+    except ValueError:
+        pass
+    return False
 
 
-def _compare_lines(actual, expected):
+def _compare_lines(actual, matchers):
     """Return the difference between the given and the expected lines.
 
-    The result is in the range [0, 1], with 0 denoting a perfect
-    match.
+    The actual line must be already split into elements, and the
+    expected one compiled into matchers.  The result is in the range
+    [0, 1], with 0 denoting a perfect match.
 
     """
-    act = actual.split()
-    exp = expected.split()
-    ok = sum(1 for a, e in zip(act, exp) if _compare_elements(a, e))
-    den = max(len(act), len(exp))
+    ok = 0
+    for a, m in zip(actual, matchers):
+        if a == m[3] or (m[0] != _STRING and _compare_elements(a, m)):
+            ok += 1
+    den = max(len(actual), len(matchers))
     return float(den - ok) / max(den, 1)
 
 
+def _lines_equal(actual, matchers):
+    """Return True if the lines match perfectly.
+
+    Equivalent to _compare_lines(actual, matchers) == 0, but stops at
+    the first difference.
+
+    """
+    if len(actual) != len(matchers):
+        return False
+    for a, m in zip(actual, matchers):
+        if a != m[3] and (m[0] == _STRING or not _compare_elements(a, m)):
+            return False
+    return True
+
+
 def _compare_ordered_sections(actual, expected):
     """Compare the content of two sections.
 
@@ -95,9 +270,275 @@ def _compare_ordered_sections(actual, expected):
     longest of the two sections.
 
     """
+    arrays = expected.numeric_arrays()
+    if arrays is not None:
+        diffs = arrays.compare(actual, expected)
+        if diffs is not None:
+            return diffs
     return [1.0 if x[0] is None or x[1] is None
-            else _compare_lines(x[0], x[1])
-            for (i, x) in enumerate(zip_longest(actual, expected))]
+            else _compare_lines(x[0].split(), x[1])
+            for x in zip_longest(actual, expected.matchers)]
+
+
+class _NumericArrays:
+    """Expected values of a numeric section, stored in numpy arrays.
+
+    The comparison converts the actual elements in bulk with the
+    conversion functions of Python, and rounds and compares them
+    with array operations.  The rare values for which the rounding of
+    numpy may differ from that of Python are checked again one by one,
+    so that the results are the same of the plain comparison.
+
+    """
+
+    def __init__(self, counts, real, values, digits, ints):
+        self.counts = counts    # number of elements in each line
+        self.real = real        # True for real elements
+        self.values = values    # expected reals
+        self.digits = digits    # precision of the expected reals
+        self.ints = ints        # expected integers
+
+    @classmethod
+    def build(cls, matchers):
+        """Build the arrays, or return None if it is not possible."""
+        if numpy is None:
+            return None
+        n = sum(map(len, matchers))
+        if n < _NUMPY_MIN_ELEMENTS:
+            return None
+        flat = list(chain.from_iterable(matchers))
+        if any(m[0] != _REAL and m[0] != _INT for m in flat):
+            return None
+        counts = numpy.fromiter(map(len, matchers), dtype=numpy.int64,
+                                count=len(matchers))
+        real = numpy.fromiter((m[0] == _REAL for m in flat), dtype=bool,
+                              count=n)
+        reals = [m for m in flat if m[0] == _REAL]
+        values = numpy.array([m[1] for m in reals], dtype=numpy.float64)
+        digits = numpy.array([m[2] for m in reals], dtype=numpy.int64)
+        try:
+            ints = numpy.array([m[1] for m in flat if m[0] == _INT],
+                               dtype=numpy.int64)
+        except OverflowError:
+            return None
+        return cls(counts, real, values, digits, ints)
+
+    def compare(self, actual, expected):
+        """Vectorized version of _compare_ordered_sections.
+
+        Return None when some actual element cannot be converted: in
+        that case the plain comparison must be used.
+
+        """
+        nlines = len(self.counts)
+        total = max(len(actual), nlines)
+        common = min(len(actual), nlines)
+        actual = actual[:common]
+        # Lines identical to the expected ones need no conversion.
+        same = numpy.fromiter(map(operator.eq, actual, expected.lines),
+                              dtype=bool, count=common)
+        todo = numpy.flatnonzero(~same)
+        elements = list(map(str.split, compress(actual, (~same).tolist())))
+        # Lines with a different number of elements are compared
+        # with the plain method.
+        lens = numpy.fromiter(map(len, elements), dtype=numpy.int64,
+                              count=len(elements))
+        regular_todo = (lens == self.counts[todo])
+        regular = numpy.zeros(common, dtype=bool)
+        regular[todo[regular_todo]] = True
+        mask = numpy.repeat(regular, self.counts[:common])
+        real = self.real[:len(mask)]
+        tokens = chain.from_iterable(compress(elements,
+                                              regular_todo.tolist()))
+        tokens = list(tokens)
+        real_mask = real[mask]
+        real_sel = mask[real]
+        int_sel = mask[~real]
+        try:
+            x = numpy.fromiter(map(float, compress(tokens,
+                                                   real_mask.tolist())),
+                               dtype=numpy.float64,
+                               count=int(real_mask.sum()))
+            a = numpy.fromiter(map(int, compress(tokens,
+                                                 (~real_mask).tolist())),
+                               dtype=numpy.int64,
+                               count=len(tokens) - len(x))
+        except (ValueError, OverflowError):
+            return None
+        ok = numpy.empty(len(tokens), dtype=bool)
+        ok[~real_mask] = (a == self.ints[:len(int_sel)][int_sel])
+        ok[real_mask] = self._compare_reals(
+            x, self.values[:len(real_sel)][real_sel],
+            self.digits[:len(real_sel)][real_sel])
+        # Count the matching elements in each regular line.
+        counts = self.counts[:common][regular]
+        ends = numpy.cumsum(counts)
+        cs = numpy.concatenate(([0], numpy.cumsum(ok)))
+        good = cs[ends] - cs[ends - counts]
+        diffs = numpy.ones(total)
+        diffs[:common][same] = 0.0
+        diffs[:common][regular] = ((counts - good).astype(numpy.float64) /
+                                   numpy.maximum(counts, 1))
+        diffs = diffs.tolist()
+        for k in numpy.flatnonzero(~regular_todo).tolist():
+            i = int(todo[k])
+            diffs[i] = _compare_lines(elements[k], expected.matchers[i])
+        return diffs
+
+    @staticmethod
+    def _compare_reals(x, expected, digits):
+        # Compare expected with round(x, digits), element by element.
+        scale = numpy.power(10.0, digits)
+        with numpy.errstate(all="ignore"):
+            y = x * scale
+            r = numpy.rint(y)
+            ok = (r / scale == expected)
+            # Values too close to a tie, or too large, are rounded
+            # again by Python.
+            frac = numpy.abs(y - numpy.floor(y) - 0.5)
+            dubious = ~(numpy.abs(y) < 2.0 ** 52)
+            dubious |= (frac < 1e-9 + numpy.abs(y) * 1e-15)
+            dubious |= (digits > 22)
+        for i in numpy.flatnonzero(dubious).tolist():
+            ok[i] = (expected[i] == round(float(x[i]), int(digits[i])))
+        return ok
+
+
+def _compare_aligned_sections(actual, expected, max_cost):
+    """Compare two sections after aligning their lines.
+
+    The result is the same pair of lists computed by
+    _compare_unordered_sections, or None when the cost of the
+    alignment exceeds the bound.
+
+    Runs of deleted and inserted lines between two matching lines are
+    paired by position and compared element by element.  Remaining
+    inserted lines are unmatched, and remaining deleted lines are
+    appended at the end.
+
+    """
+    elements = [x.split() for x in actual]
+    matchers = expected.matchers
+    script = _edit_script(elements, matchers, max_cost)
+    if script is None:
+        return None
+    diffs = [1.0] * len(actual)
+    ordered = [None] * len(actual)
+    missing = []
+    dels = []
+    ins = []
+
+    def flush():
+        for i, j in zip(dels, ins):
+            diffs[j] = _compare_lines(elements[j], matchers[i])
+            ordered[j] = expected.lines[i]
+        missing.extend(dels[len(ins):])
+        del dels[:], ins[:]
+
+    for op, i, j in script:
+        if op == "=":
+            flush()
+            diffs[j] = 0.0
+            ordered[j] = expected.lines[i]
+        elif op == "-":
+            dels.append(i)
+        else:
+            ins.append(j)
+    flush()
+    diffs.extend([1.0] * len(missing))
+    ordered.extend(expected.lines[i] for i in missing)
+    return (diffs, ordered)
+
+
+def _edit_script(elements, matchers, max_cost):
+    """Shortest edit script transforming the expected into the actual lines.
+
+    The script is a list of triplets (op, i, j), where op is "=" when
+    the i-th expected line matches the j-th actual line, "-" when the
+    i-th expected line is deleted, and "+" when the j-th actual line is
+    inserted (the index not relevant to the operation is None).
+    Return None when the script would include more than max_cost
+    insertions and deletions.
+
+    This is the O(ND) algorithm by E. W. Myers, applied after
+    removing the common prefix and suffix.
+
+    """
+    n = len(matchers)
+    m = len(elements)
+    # Common prefix and suffix.
+    start = 0
+    while (start < n and start < m and
+           _lines_equal(elements[start], matchers[start])):
+        start += 1
+    end = 0
+    while (end < n - start and end < m - start and
+           _lines_equal(elements[m - end - 1], matchers[n - end - 1])):
+        end += 1
+    a = matchers[start:n - end]
+    b = elements[start:m - end]
+    middle = _myers(a, b, max_cost)
+    if middle is None:
+        return None
+    script = [("=", i, i) for i in range(start)]
+    script.extend((op, (i if i is None else i + start),
+                   (j if j is None else j + start))
+                  for op, i, j in middle)
+    script.extend(("=", n - end + k, m - end + k) for k in range(end))
+    return script
+
+
+def _myers(a, b, max_cost):
+    # Myers' algorithm on the expected matchers a and the actual
+    # elements b.  Return the edit script, or None when it costs more
+    # than max_cost.
+    n = len(a)
+    m = len(b)
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, max_cost) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and _lines_equal(b[y], a[x]):
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(trace, x, y):
+    # Rebuild the edit script from the history of the furthest
+    # reaching paths.
+    script = []
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            script.append(("=", x, y))
+        if d > 0:
+            if x == prev_x:
+                script.append(("+", None, y - 1))
+            else:
+                script.append(("-", x - 1, None))
+        x = prev_x
+        y = prev_y
+    script.reverse()
+    return script
 
 
 def _compare_unordered_sections(actual, expected):
@@ -110,22 +551,144 @@ def _compare_unordered_sections(actual, expected):
     values where no match is found.  The tow lists have the same
     length.
 
+    Each actual line is matched to the first remaining expected line
+    that matches it perfectly.  Expected lines are looked up in an
+    index, so that the comparison takes linear time in most cases.
+
     """
-    expected = set(enumerate(expected))
+    index = _UnorderedIndex(expected.matchers)
     diffs = []
     ordered = []
     for x in actual:
-        for (n, y) in expected:
-            d = _compare_lines(x, y)
-            if d == 0:
-                diffs.append(d)
-                ordered.append(y)
-                expected.remove((n, y))
-                break
+        n = index.pop(x.split())
+        if n is not None:
+            diffs.append(0.0)
+            ordered.append(expected.lines[n])
         else:
             diffs.append(1.0)
             ordered.append(None)
-    for (n, y) in sorted(expected):
+    for n in index.remaining():
         diffs.append(1.0)
-        ordered.append(y)
+        ordered.append(expected.lines[n])
     return (diffs, ordered)
+
+
+class IncrementalComparison:
+    """Comparison of the lines of a section as they are produced.
+
+    Each line is checked as soon as it is added, so that a wrong
+    section can be detected before its end.  The comparison agrees
+    with compare_sections on whether the section is correct.
+
+    """
+
+    def __init__(self, expected, ordered=True):
+        """Prepare the comparison with the expected lines."""
+        if not isinstance(expected, CompiledSection):
+            expected = CompiledSection(expected)
+        self.errors = 0
+        self._matchers = expected.matchers
+        self._count = 0
+        self._index = (None if ordered else
+                       _UnorderedIndex(expected.matchers))
+
+    def add(self, line):
+        """Check a new line and return True if it is correct."""
+        elements = line.split()
+        if self._index is not None:
+            ok = (self._index.pop(elements) is not None)
+        else:
+            ok = (self._count < len(self._matchers) and
+                  _lines_equal(elements, self._matchers[self._count]))
+        self._count += 1
+        if not ok:
+            self.errors += 1
+        return ok
+
+    def end(self):
+        """Count the missing lines and return True if no error occurred."""
+        if self._index is not None:
+            self.errors += len(self._index.remaining())
+        else:
+            self.errors += max(0, len(self._matchers) - self._count)
+        return (self.errors == 0)
+
+
+class _UnorderedIndex:
+    """Index of the expected lines of an unordered section.
+
+    Lines are grouped by shape (the kind and the precision of their
+    elements).  Within each group they are indexed by a canonical key
+    where integers are normalized, real numbers rounded to the
+    expected precision and strings taken verbatim.  An actual line
+    matches an expected line of the same shape exactly when their keys
+    are equal.  Lines that cannot be indexed are kept aside and
+    scanned one by one.
+
+    """
+
+    def __init__(self, matchers):
+        self._shapes = {}    # length -> {shape -> {key -> [indices]}}
+        self._fallback = []  # indices of the lines not indexed
+        self._matchers = matchers
+        for n, line in enumerate(matchers):
+            if any(m[0] == _NEVER for m in line):
+                self._fallback.append(n)
+                continue
+            shape = tuple((m[0], m[2]) for m in line)
+            key = tuple(m[1] for m in line)
+            groups = self._shapes.setdefault(len(line), {})
+            groups.setdefault(shape, {}).setdefault(key, deque()).append(n)
+
+    def pop(self, elements):
+        """Remove and return the first line matching the elements.
+
+        Return None when there is no matching line.
+
+        """
+        best = None
+        best_bucket = None
+        for shape, keys in self._shapes.get(len(elements), {}).items():
+            bucket = keys.get(_canonical_key(elements, shape))
+            if bucket and (best is None or bucket[0] < best):
+                best = bucket[0]
+                best_bucket = bucket
+        for i, n in enumerate(self._fallback):
+            if best is not None and n > best:
+                break
+            if _lines_equal(elements, self._matchers[n]):
+                del self._fallback[i]
+                return n
+        if best_bucket is not None:
+            best_bucket.popleft()
+        return best
+
+    def remaining(self):
+        """Return the sorted indices of the lines not yet matched."""
+        ret = list(self._fallback)
+        for groups in self._shapes.values():
+            for keys in groups.values():
+                for bucket in keys.values():
+                    ret.extend(bucket)
+        ret.sort()
+        return ret
+
+
+def _canonical_key(elements, shape):
+    """Canonical key of the actual elements for the given shape.
+
+    Return None when the elements cannot match lines of that shape.
+
+    """
+    key = []
+    try:
+        for a, (kind, digits) in zip(elements, shape):
+            if kind == _STRING:
+                key.append(a)
+            elif kind == _INT:
+                key.append(int(a))
+            else:
+                key.append(round(float(a), digits))
+    except ValueError:
+        return None
+    return tuple(key)
@@ -1,6 +1,7 @@
 """Parse text representing sections."""
 
 import re
+from itertools import chain
 import pvcheck.testdata
 
 
@@ -22,6 +23,14 @@ import pvcheck.testdata
 #
 _RE_HEADER = re.compile(r"[^[]*\[\s*(?P<tag>[-._a-zA-Z][-._\w]*)\s*\]\s*")
 
+# Line boundaries, other than '\n' and '\r\n', recognized by
+# str.splitlines.
+_OTHER_BOUNDARIES = "\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+# Sections with at least this number of lines are stored compactly
+# (see testdata.Lines).
+COMPACT_MIN_LINES = 64
+
 
 def parse_sections(f):
     """Parse the lines in f and generates sections.
@@ -39,11 +48,197 @@ def parse_sections(f):
         m = _RE_HEADER.match(line)
         if m:
             if tag != "" or len(content) > 0:
-                yield pvcheck.testdata.Section(tag, content)
+                yield _make_section(tag, content)
             # A new section
             tag = m.group("tag")
             content = []
         else:
             content.append(line.rstrip())
     if tag != "" or len(content) > 0:
-        yield pvcheck.testdata.Section(tag, content)
+        yield _make_section(tag, content)
+
+
+def _make_section(tag, content):
+    if len(content) >= COMPACT_MIN_LINES:
+        content = pvcheck.testdata.Lines(content)
+    return pvcheck.testdata.Section(tag, content)
+
+
+def parse_output(buf):
+    """Parse the output of a program and generate its sections.
+
+    The result is the same of parse_sections(buf.splitlines()), but
+    the headers are searched in the whole string at once and the
+    content of a section is extracted only when it is accessed.
+
+    """
+    return _parse_output(buf, True)
+
+
+# Policies for the tags occurring more than once in the output.
+DUPLICATE_POLICIES = ("first", "last", "merge")
+
+
+def index_output(buf, tags, duplicates=None):
+    """Parse the output of a program and index its sections by tag.
+
+    Return a dictionary mapping tags to sections.  Only the sections
+    with the given tags are included: the content of the others is
+    never extracted.
+
+    When a tag occurs more than once, duplicates[tag] selects which
+    section is returned: the 'first' one (the default), the 'last'
+    one, or one obtained by concatenating all of them ('merge').
+
+    """
+    duplicates = duplicates or {}
+    found = {}
+    for s in _parse_output(buf, "" in tags):
+        if s.tag in tags:
+            found.setdefault(s.tag, []).append(s)
+    index = {}
+    for tag, sections in found.items():
+        policy = duplicates.get(tag, "first")
+        if policy == "last":
+            index[tag] = sections[-1]
+        elif policy == "merge" and len(sections) > 1:
+            content = list(chain.from_iterable(s.content for s in sections))
+            index[tag] = pvcheck.testdata.Section(tag, content)
+        else:
+            index[tag] = sections[0]
+    return index
+
+
+def _parse_output(buf, leading):
+    # Implementation of parse_output.  The section preceding the
+    # first header is generated only when leading is True.
+    if _other_boundaries(buf):
+        # Rare: rely on the line by line parser.
+        for s in parse_sections(buf.splitlines()):
+            if s.tag or leading:
+                yield s
+    else:
+        headers = _find_headers(buf)
+        yield from _split_sections(buf, headers, leading)
+
+
+def _other_boundaries(buf):
+    # True if lines in buf are not separated just by '\n' or '\r\n'.
+    if "\r" in buf and buf.count("\r") != buf.count("\r\n"):
+        return True
+    return any(c in buf for c in _OTHER_BOUNDARIES)
+
+
+def _find_headers(buf):
+    # Return the list of headers as (start, end, tag) triplets, where
+    # start and end delimit the line of the header.  Only the lines
+    # including a '[' are checked.
+    headers = []
+    pos = buf.find("[")
+    while pos >= 0:
+        start = buf.rfind("\n", 0, pos) + 1
+        end = buf.find("\n", pos)
+        if end < 0:
+            end = len(buf)
+        line = buf[start:end]
+        m = _RE_HEADER.match(line)
+        if m and not line.lstrip().startswith("#"):
+            headers.append((start, end, m.group("tag")))
+        pos = buf.find("[", end)
+    return headers
+
+
+def _split_sections(buf, headers, leading=True):
+    # Generate the sections delimited by the headers.
+    if leading:
+        first = (headers[0][0] if headers else len(buf))
+        content = _body_lines(buf, 0, first)
+        if content:
+            yield pvcheck.testdata.Section("", content)
+    for n, (start, end, tag) in enumerate(headers):
+        stop = (headers[n + 1][0] if n + 1 < len(headers) else len(buf))
+        yield _LazySection(tag, buf, end, stop)
+
+
+def _body_lines(buf, start, stop):
+    # Content lines between the two positions of the buffer (bytes
+    # are accepted for testdata.MappedLines).
+    text = buf[start:stop]
+    if not isinstance(text, str):
+        text = text.decode("utf-8", errors="ignore")
+    content = []
+    for line in text.split("\n"):
+        l = line.strip()
+        if l and l[0] != '#':
+            content.append(line.rstrip())
+    return content
+
+
+class _LazySection(pvcheck.testdata.Section):
+    """Section whose content is extracted from a buffer when needed."""
+
+    __slots__ = ("_buf", "_start", "_stop", "_content")
+
+    def __init__(self, tag, buf, start, stop):
+        self.tag = tag
+        self._buf = buf
+        self._start = start
+        self._stop = stop
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = _body_lines(self._buf, self._start, self._stop)
+            self._buf = None
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._buf = None
+
+
+class IncrementalParser:
+    """Parse sections from text received in pieces.
+
+    The text is split into lines as done by str.splitlines, and the
+    lines are interpreted as in parse_sections.  Instead of sections,
+    the parser generates the events ("header", tag) and ("line",
+    text) as soon as each line is complete.
+
+    """
+
+    def __init__(self):
+        """Create the parser."""
+        self._pending = ""
+
+    def feed(self, text):
+        """Parse more text and generate the resulting events."""
+        parts = (self._pending + text).splitlines(True)
+        self._pending = ""
+        if parts:
+            # The last line is kept aside if it is not terminated (a
+            # trailing '\r' may be followed by a '\n').
+            last = parts[-1]
+            if last.endswith("\r") or last.splitlines()[0] == last:
+                self._pending = parts.pop()
+        for part in parts:
+            yield from self._parse_line(part.splitlines()[0])
+
+    def close(self):
+        """Parse the last line, if not terminated."""
+        line = self._pending
+        self._pending = ""
+        if line:
+            yield from self._parse_line(line.splitlines()[0])
+
+    def _parse_line(self, line):
+        l = line.strip()
+        if not l or l[0] == '#':
+            return  # Skip empty lines and comments
+        m = _RE_HEADER.match(line)
+        if m:
+            yield ("header", m.group("tag"))
+        else:
+            yield ("line", line.rstrip())
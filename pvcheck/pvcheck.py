@@ -1,36 +1,92 @@
 """Main PvCheck class."""
 
 
+import codecs
+import collections
+import concurrent.futures
+import itertools
+import threading
 import pvcheck.match
 import pvcheck.parser
+import pvcheck.testdata
 import pvcheck.executor
+import pvcheck.formatter
+
+
+# Number of compiled sections kept for reuse.
+COMPILED_CACHE_SIZE = 64
 
 
 class PvCheck:
     """Main class that runs the tests."""
 
-    def __init__(self, executor, formatter):
+    def __init__(self, executor, formatter, cache=None):
+        """Create the object.
+
+        When a cache is given, the results of the executions are
+        taken from it whenever possible.
+
+        """
         self._exec = executor
         self._fmt = formatter
+        self._cache = cache
+        self._compiled = collections.OrderedDict()
+        self._compiled_lock = threading.Lock()
 
-    def exec_suite(self, suite, args, timeout=None, output_limit=None):
+    def exec_suite(self, suite, args, timeout=None, output_limit=None,
+                   output_byte_limit=None, limits=None, jobs=1,
+                   maxfail=None, stream=False, maxerrors=None):
         """Verify the program with a collection of test cases.
 
+        The resource limits can be overridden by the .LIMITS section
+        of each test case.
+
+        When jobs is larger than one, that number of tests are run in
+        parallel.  The formatter receives the results in the same
+        order anyway.
+
+        When maxfail is given, the session stops after that number of
+        failures: the remaining tests are skipped and those in
+        progress are interrupted.
+
+        When stream is True the output is compared while the program
+        is running, and the program is stopped as soon as all the
+        sections are wrong, or when the number of wrong lines reaches
+        maxerrors.
+
         Return the number of failed tests.
         """
         self._fmt.begin_session()
         failures = 0
+        done = 0
+        tests = suite.test_cases()
+        kwargs = dict(timeout=timeout, output_limit=output_limit,
+                      output_byte_limit=output_byte_limit, limits=limits,
+                      stream=stream, maxerrors=maxerrors)
+        if jobs > 1:
+            outcomes = self._exec_parallel(tests, args, jobs, kwargs)
+        else:
+            outcomes = (self._exec_test(self._fmt, test, args, **kwargs)
+                        for test in tests)
         try:
-            for test in suite.test_cases():
-                if not self._exec_test(test, args, timeout=timeout,
-                                       output_limit=output_limit):
+            for success in outcomes:
+                done += 1
+                if not success:
                     failures += 1
                 self._fmt.end_test()
+                if maxfail is not None and failures >= maxfail:
+                    outcomes.close()
+                    if done < len(tests):
+                        self._fmt.tests_skipped(len(tests) - done)
+                    break
         finally:
+            outcomes.close()
             self._fmt.end_session()
         return failures
 
-    def exec_single_test(self, test, args, timeout=None, output_limit=None):
+    def exec_single_test(self, test, args, timeout=None, output_limit=None,
+                         output_byte_limit=None, limits=None, stream=False,
+                         maxerrors=None):
         """Verify the program on a single test case.
 
         Return True if the test has been successfully passed.
@@ -38,56 +94,291 @@ class PvCheck:
         self._fmt.begin_session()
         success = False
         try:
-            success = self._exec_test(test, args, timeout=timeout,
-                                      output_limit=output_limit)
+            success = self._exec_test(self._fmt, test, args, timeout=timeout,
+                                      output_limit=output_limit,
+                                      output_byte_limit=output_byte_limit,
+                                      limits=limits, stream=stream,
+                                      maxerrors=maxerrors)
         finally:
             self._fmt.end_test()
             self._fmt.end_session()
         return success
 
-    def _exec_test(self, test, args, timeout=None, output_limit=None):
+    def _exec_parallel(self, tests, args, jobs, kwargs):
+        # Run the tests in a pool of threads and generate their
+        # outcomes in the order of the suite.  The messages for the
+        # formatter are recorded by the workers and replayed here, so
+        # that the report does not depend on the number of jobs.
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        pending = collections.deque()
+        tests = iter(tests)
+
+        def submit(n):
+            for test in itertools.islice(tests, n):
+                pending.append(pool.submit(self._record_test, test,
+                                           args, kwargs))
+
+        try:
+            submit(2 * jobs)
+            while pending:
+                success, recorder = pending.popleft().result()
+                submit(1)
+                recorder.replay(self._fmt)
+                yield success
+        finally:
+            # Reached also on errors and on KeyboardInterrupt: drop
+            # the tests not yet started and kill those in progress.
+            for f in pending:
+                f.cancel()
+            while not all(f.done() for f in pending):
+                self._exec.kill_all()
+                concurrent.futures.wait(pending, timeout=0.1)
+            pool.shutdown()
+
+    def _record_test(self, test, args, kwargs):
+        # Worker executing a test with a formatter recording the
+        # messages for later.
+        recorder = pvcheck.formatter.RecordingFormatter()
+        success = self._exec_test(recorder, test, args, **kwargs)
+        return (success, recorder)
+
+    def _exec_test(self, fmt, test, args, timeout=None, output_limit=None,
+                   output_byte_limit=None, limits=None, stream=False,
+                   maxerrors=None):
         # Run the program and verify it according to the test case.
         # Return True if the test is successful.
-        input = test.find_section_content(".INPUT", "")
+        limits = dict(limits or {})
+        limits_sect = test.find_section(".LIMITS")
+        if limits_sect is not None:
+            try:
+                limits.update(pvcheck.executor.parse_limits(
+                    limits_sect.content))
+            except ValueError as e:
+                raise pvcheck.testdata.TestFileError(
+                    "[.LIMITS] of test '%s': %s" % (test.description or "", e))
+        for s in test.sections(exclude_special=True):
+            try:
+                _alignment_options(test.section_options(s.tag))
+            except ValueError as e:
+                raise pvcheck.testdata.TestFileError(
+                    "[.SECTIONS] of test '%s': %s" % (test.description or "",
+                                                      e))
+        input_file = _referenced_file(test, ".INPUT_FILE")
+        tmpfile_from = _referenced_file(test, ".FILE_FROM")
+        # An input file replaces the .INPUT section.
+        input_sect = (test.find_section(".INPUT") if input_file is None
+                      else None)
+        input = (input_sect.text() if input_sect is not None else "")
         tmpfile = test.find_section_content(".FILE", None)
         args = list(args)
         arg_sect = test.find_section(".ARGS")
         if arg_sect is not None:
             args.extend(map(str.strip, arg_sect.content))
-            if tmpfile is not None:
+            if tmpfile is not None or tmpfile_from is not None:
                 args = [(a if a != ".FILE" else pvcheck.executor.ARG_TMPFILE)
                         for a in args]
 
-        self._fmt.begin_test(test.description, args, input, tmpfile)
+        fmt.begin_test(test.description, args, input, tmpfile)
 
-        exec_result = self._exec.exec_process(
+        monitor = (_StreamMonitor(test, self._compiled_section, maxerrors)
+                   if stream else None)
+        exec_result = self._exec_process(
             args, input, tmpfile=tmpfile,
+            encoded_input=(input_sect.encoded() if input_sect is not None
+                           else None),
+            input_file=input_file,
+            tmpfile_from=tmpfile_from,
             timeout=timeout,
-            output_limit=output_limit
+            output_limit=output_limit,
+            output_byte_limit=output_byte_limit,
+            limits=limits,
+            monitor=monitor
         )
-        self._fmt.execution_result(args, exec_result, test)
+        fmt.execution_result(args, exec_result, test)
         if exec_result.result == pvcheck.executor.ER_OK:
-            return self._check_output(test, exec_result.output)
+            return self._check_output(fmt, test, exec_result.output)
+        elif exec_result.result == pvcheck.executor.ER_MISMATCH:
+            # Report the errors found in the partial output.
+            self._check_output(fmt, test, exec_result.output)
+            return False
         else:
             return False
 
-    def _check_output(self, test, output):
+    def _exec_process(self, args, input, tmpfile=None, monitor=None,
+                      encoded_input=None, **kwargs):
+        # Execute the program, or take the result from the cache.
+        # The monitor does not change the output: it is not part of
+        # the key.  The encoded input, when available, is sent to the
+        # program in place of the text.
+        if monitor is not None:
+            kwargs["monitor"] = monitor
+        stdin = (encoded_input if encoded_input is not None else input)
+        if self._cache is None:
+            return self._exec.exec_process(args, stdin, tmpfile=tmpfile,
+                                           **kwargs)
+        params = dict(kwargs)
+        params.pop("monitor", None)
+        key = self._cache.key(self._exec, args, input, tmpfile, **params)
+        exec_result = self._cache.get(key)
+        if exec_result is None:
+            exec_result = self._exec.exec_process(args, stdin,
+                                                  tmpfile=tmpfile, **kwargs)
+            self._cache.put(key, exec_result)
+        return exec_result
+
+    def _check_output(self, fmt, test, output):
         # Return True if the test has been passed.
         success = True
-        answers = list(pvcheck.parser.parse_sections(output.splitlines()))
-        for s in test.sections(exclude_special=True):
-            for ans in answers:
-                if ans.tag != s.tag:
-                    continue
-                ordered = ("unordered" not in test.section_options(s.tag))
-                diffs, matches = pvcheck.match.compare_sections(
-                    ans.content, s.content, ordered=ordered
-                )
-                self._fmt.comparison_result(s, ans, diffs,
-                                            matches)
-                success = success and (max(diffs, default=0.0) == 0)
-                break
-            else:
+        expected = test.sections(exclude_special=True)
+        duplicates = dict((s.tag, _duplicate_policy(test, s.tag))
+                          for s in expected)
+        answers = pvcheck.parser.index_output(
+            output, set(duplicates), duplicates)
+        for s in expected:
+            ans = answers.get(s.tag)
+            if ans is None:
                 success = False
-                self._fmt.missing_section(s)
+                fmt.missing_section(s)
+                continue
+            diffs, matches = self._compare_section(
+                s, ans.content, test.section_options(s.tag))
+            fmt.comparison_result(s, ans, diffs, matches)
+            success = success and (max(diffs, default=0.0) == 0)
         return success
+
+    def _compare_section(self, section, actual, options):
+        # Compare the expected section with the actual lines.
+        ordered = ("unordered" not in options)
+        aligned, max_cost = _alignment_options(options)
+        if isinstance(section.content, pvcheck.testdata.MappedLines):
+            if ordered and not aligned:
+                # Large external files are compared piece by piece.
+                return pvcheck.match.compare_ordered_chunks(
+                    actual, section.content.chunks())
+            expected = list(section.content)
+        else:
+            expected = self._compiled_section(section)
+        return pvcheck.match.compare_sections(
+            actual, expected, ordered=ordered, aligned=aligned,
+            max_cost=max_cost)
+
+    def _compiled_section(self, section):
+        # Return the compiled content of the section.  Sections shared
+        # by several tests (those inherited from the prefix of the
+        # suite) are compiled only once.  Only the most recently used
+        # ones are kept: the entries hold the section, so that its id
+        # is not reused while in the cache.
+        key = id(section)
+        with self._compiled_lock:
+            entry = self._compiled.get(key)
+            if entry is not None:
+                self._compiled.move_to_end(key)
+                return entry[1]
+        compiled = pvcheck.match.compile_section(section.content)
+        with self._compiled_lock:
+            self._compiled[key] = (section, compiled)
+            if len(self._compiled) > COMPILED_CACHE_SIZE:
+                self._compiled.popitem(last=False)
+        return compiled
+
+
+class _StreamMonitor:
+    """Compare the output of the program while it is produced.
+
+    Called with the chunks of the standard output, it returns False
+    when the test is definitively failed: all the expected sections
+    are wrong, or the total number of wrong lines reached maxerrors.
+
+    """
+
+    def __init__(self, test, compile, maxerrors=None):
+        self._test = test
+        self._compile = compile
+        self._maxerrors = maxerrors
+        self._expected = dict((s.tag, s)
+                              for s in test.sections(exclude_special=True))
+        self._decoder = codecs.getincrementaldecoder("utf-8")(
+            errors="ignore")
+        self._parser = pvcheck.parser.IncrementalParser()
+        self._seen = set()
+        self._failed = set()
+        self._errors = 0
+        self._tag = None
+        self._comparison = None
+
+    def __call__(self, chunk):
+        events = self._parser.feed(self._decoder.decode(chunk))
+        for kind, value in events:
+            if kind == "header":
+                self._begin_section(value)
+            elif self._comparison is not None:
+                if not self._comparison.add(value):
+                    self._errors += 1
+                    self._failed.add(self._tag)
+        if not self._expected:
+            return True
+        return not (self._failed == set(self._expected) or
+                    (self._maxerrors is not None and
+                     self._errors >= self._maxerrors))
+
+    def _begin_section(self, tag):
+        # Close the current section and start a new one.  Only the
+        # first occurrence of an expected section is compared, and
+        # only when it is the one that counts.  Sections read from
+        # external files are left to the final check.
+        if self._comparison is not None:
+            errors = self._comparison.errors
+            if not self._comparison.end():
+                # Missing lines
+                self._failed.add(self._tag)
+                self._errors += self._comparison.errors - errors
+        self._comparison = None
+        self._tag = tag
+        if (tag in self._expected and tag not in self._seen and
+                _duplicate_policy(self._test, tag) == "first" and
+                not isinstance(self._expected[tag].content,
+                               pvcheck.testdata.MappedLines)):
+            self._seen.add(tag)
+            s = self._expected[tag]
+            ordered = ("unordered" not in self._test.section_options(tag))
+            self._comparison = pvcheck.match.IncrementalComparison(
+                self._compile(s), ordered)
+
+
+def _referenced_file(test, tag):
+    # Path of the file named by a special section (the last one, when
+    # the prefix and the test case both name a file), or None.
+    s = test.find_section(tag)
+    if s is None or len(s.content) == 0:
+        return None
+    return s.content[-1]
+
+
+def _duplicate_policy(test, tag):
+    # Which section to compare when the tag occurs more than once
+    # in the output (see parser.index_output).
+    options = test.section_options(tag)
+    for policy in pvcheck.parser.DUPLICATE_POLICIES:
+        if policy in options:
+            return policy
+    return "first"
+
+
+def _alignment_options(options):
+    # Return the pair (aligned, max_cost) from the options of a
+    # section ("aligned" or "aligned=COST").  Raise a ValueError when
+    # the cost is not a non-negative integer.
+    for opt in options:
+        if opt == "aligned":
+            break
+        elif opt.startswith("aligned="):
+            try:
+                cost = int(opt[len("aligned="):])
+            except ValueError:
+                cost = -1
+            if cost < 0:
+                raise ValueError("Invalid option '%s'" % opt)
+            return (True, cost)
+    else:
+        return (False, pvcheck.match.DEFAULT_MAX_ALIGN_COST)
+    return (True, pvcheck.match.DEFAULT_MAX_ALIGN_COST)
@@ -1,12 +1,193 @@
 """Classes defining test cases and test suites."""
 
+import io
+import os
+import json
+import mmap
+from array import array
 from collections import OrderedDict
-from itertools import chain
+from itertools import accumulate, chain, islice
 from pvcheck.i18n import translate as _
 
 
+# Special sections naming a file, whose path is relative to the
+# directory of the test file.  Each line of .EXPECTED_FROM is a tag
+# followed by the path.
+PATH_SECTIONS = (".INPUT_FILE", ".FILE_FROM")
+TAGGED_PATH_SECTIONS = (".EXPECTED_FROM",)
+
+# Size of the pieces in which external expected files are read.
+_MAPPED_CHUNK_BYTES = 1 << 20
+
+
+class TestFileError(Exception):
+    """Error in the content of a test file."""
+    pass
+
+
+def resolve_paths(sections, directory):
+    """Make absolute the paths in the sections naming files.
+
+    Relative paths are taken as relative to the given directory.  The
+    sections are modified in place.
+
+    """
+    def absolute(path):
+        return os.path.abspath(os.path.join(directory, path.strip()))
+
+    for s in sections:
+        if s.tag in PATH_SECTIONS:
+            s.content = [absolute(l) for l in s.content if l.strip()]
+        elif s.tag in TAGGED_PATH_SECTIONS:
+            fields = (l.split(None, 1) for l in s.content)
+            s.content = [f[0] + " " + absolute(f[1])
+                         for f in fields if len(f) == 2]
+    return sections
+
+
+class Lines:
+    """Immutable sequence of lines stored in a single string.
+
+    The lines are kept joined as in Section.text(), together with the
+    offsets where each of them starts.  Compared to a list of strings
+    this takes a fraction of the memory, and the text is available
+    without joining the lines again.
+
+    """
+
+    __slots__ = ("_text", "_offsets", "_encoded")
+
+    def __init__(self, lines=()):
+        """Create the sequence from an iterable of strings."""
+        lines = list(lines)
+        self._text = ("\n".join(lines) + "\n" if lines else "")
+        starts = accumulate(chain((0,), (len(l) + 1 for l in lines)))
+        self._offsets = array("Q", starts)
+        self._encoded = None
+
+    def text(self):
+        """Return the lines joined, each one followed by a newline."""
+        return self._text
+
+    def encoded(self):
+        """Return the text encoded in UTF-8."""
+        if self._encoded is None:
+            self._encoded = self._text.encode("utf-8", errors="ignore")
+        return self._encoded
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[i] for i in range(*n.indices(len(self)))]
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError("line index out of range")
+        return self._text[self._offsets[n]:self._offsets[n + 1] - 1]
+
+    def __iter__(self):
+        text = self._text
+        offsets = self._offsets
+        for n in range(len(offsets) - 1):
+            yield text[offsets[n]:offsets[n + 1] - 1]
+
+    def __eq__(self, other):
+        if isinstance(other, Lines):
+            return (self._text == other._text and
+                    self._offsets == other._offsets)
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return (self._text, self._offsets)
+
+    def __setstate__(self, state):
+        self._text, self._offsets = state
+        self._encoded = None
+
+    def __repr__(self):
+        return "Lines(%r)" % list(self)
+
+
+class MappedLines:
+    """Sequence of the lines of a file, read only when needed.
+
+    The file is memory-mapped and decoded one chunk at a time.  As in
+    the sections of a test file, empty lines and comments are
+    skipped.  Iterating does not keep the lines in memory, while
+    indexing requires a scan of the file.
+
+    """
+
+    __slots__ = ("path", "_len")
+
+    def __init__(self, path):
+        """Refer to the file with the given path."""
+        self.path = path
+        self._len = None
+
+    def chunks(self, size=_MAPPED_CHUNK_BYTES):
+        """Generate the lines in lists, reading about size bytes at a time."""
+        import pvcheck.parser  # Not at the top: it imports this module
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                start = 0
+                while start < len(buf):
+                    end = buf.find(b"\n", start + size)
+                    end = (len(buf) if end < 0 else end + 1)
+                    lines = pvcheck.parser._body_lines(buf, start, end)
+                    start = end
+                    if lines:
+                        yield lines
+
+    def __iter__(self):
+        for lines in self.chunks():
+            yield from lines
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(map(len, self.chunks()))
+        return self._len
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return list(islice(self, *n.indices(len(self))))
+        if n < 0:
+            n += len(self)
+        if n >= 0:
+            for line in islice(self, n, n + 1):
+                return line
+        raise IndexError("line index out of range")
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, state):
+        self.path = state
+        self._len = None
+
+    def __repr__(self):
+        return "MappedLines(%r)" % self.path
+
+
 class Section:
-    """A section denoted by a tag and with some content."""
+    """A section denoted by a tag and with some content.
+
+    The content is a sequence of lines: a list, or a Lines object
+    for large sections.
+
+    """
+
+    __slots__ = ("tag", "content")
+
     def __init__(self, tag, content):
         self.tag = tag
         self.content = content
@@ -14,12 +195,24 @@ class Section:
     def copy(self):
         return Section(self.tag, self.content[:])
 
+    def compact(self):
+        """Return a copy of the section with its content in a Lines object."""
+        return Section(self.tag, Lines(self.content))
+
     def text(self):
-        if not self.content:
+        if isinstance(self.content, Lines):
+            return self.content.text()
+        elif not self.content:
             return ""
         else:
             return "\n".join(self.content) + "\n"
 
+    def encoded(self):
+        """Return the text of the section encoded in UTF-8."""
+        if isinstance(self.content, Lines):
+            return self.content.encoded()
+        return self.text().encode("utf-8", errors="ignore")
+
     def __repr__(self):
         return ("Section('%s')" % self.tag)
 
@@ -30,6 +223,7 @@ class TestCase:
         """Create a new test case with the given description."""
         self.description = description
         self._sections = OrderedDict()
+        self._owned = set()
         self._section_options = {}
         for s in sections:
             self.add_section(s)
@@ -42,14 +236,31 @@ class TestCase:
         '.SECTIONS' section is parsed and recorded as the options of
         the test case.
 
+        The section is not copied, so that the sections of a prefix
+        are shared by all the test cases of a suite.  A copy is made
+        only when another section is merged into it.
+
+        Each line of the special '.EXPECTED_FROM' section adds a
+        section whose content is read from a file (see MappedLines).
+
         """
         if section.tag == ".SECTIONS":
             opts = self._parse_section_options(section.content)
             self._section_options.update(opts)
+        elif section.tag == ".EXPECTED_FROM":
+            for line in section.content:
+                fields = line.split(None, 1)
+                if len(fields) == 2:
+                    content = MappedLines(fields[1].strip())
+                    self.add_section(Section(fields[0], content))
         elif section.tag in self._sections:
+            if section.tag not in self._owned:
+                shared = self._sections[section.tag]
+                self._sections[section.tag] = shared.copy()
+                self._owned.add(section.tag)
             self._sections[section.tag].content.extend(section.content)
         else:
-            self._sections[section.tag] = section.copy()
+            self._sections[section.tag] = section
 
     def find_section(self, tag):
         """Search for a section with the given tag name."""
@@ -113,6 +324,10 @@ class TestSuite:
         """Return the list of test cases in the suite."""
         return self._cases
 
+    def descriptions(self):
+        """Return the list of the descriptions of the test cases."""
+        return [c.description for c in self._cases]
+
     def test_case(self, test_number):
         """Return a test case."""
         try:
@@ -142,3 +357,162 @@ class TestSuite:
                 lst.append(s)
         if n > 0 or lst:
             yield (name, lst)
+
+
+INDEX_FORMAT_VER = 1
+
+
+class LazyTestSuite(TestSuite):
+    """A suite whose test cases are read from a file on demand.
+
+    At first only the position of each '.TEST' header is located.
+    A test case is parsed when it is accessed, and iterating over the
+    test cases parses them one at a time, so that the memory used does
+    not depend on the number of tests.
+
+    """
+
+    def __init__(self, filename, prefix=(), index_file=None):
+        """Create the suite from the file with the given name.
+
+        The sections in prefix are placed before the content of the
+        file.  When index_file is given, the position of the tests is
+        saved there and reused as long as the file is not modified.
+
+        """
+        self._filename = filename
+        st = os.stat(filename)
+        signature = [st.st_mtime_ns, st.st_size]
+        index = (_load_index(index_file, signature)
+                 if index_file is not None else None)
+        if index is None:
+            with open(filename, "rb") as f:
+                index = _build_index(f)
+            if index_file is not None:
+                _save_index(index_file, signature, index)
+        self._offsets = [i[0] for i in index]
+        self._descriptions = [i[1] for i in index]
+        end = (self._offsets[0] if self._offsets else None)
+        with open(filename, "rb") as f:
+            sections = self._parse(f.read(end))
+        self._prefix = list(prefix) + sections
+
+    def test_cases(self):
+        """Return the sequence of test cases in the suite."""
+        return _LazyCases(self)
+
+    def descriptions(self):
+        """Return the list of the descriptions of the test cases."""
+        if not self._offsets:
+            return [None]
+        return list(self._descriptions)
+
+    def _test_case(self, f, n):
+        # Parse the n-th test case from the file.
+        if not self._offsets:
+            return TestCase(None, self._prefix)
+        f.seek(self._offsets[n])
+        end = (self._offsets[n + 1] if n + 1 < len(self._offsets) else None)
+        sections = self._parse(f.read(end - self._offsets[n]
+                                      if end is not None else -1))
+        c = TestCase(self._descriptions[n])
+        for s in chain(self._prefix, sections[1:]):
+            c.add_section(s)
+        return c
+
+    def _parse(self, data):
+        # Decode the data as parse_file does with the whole file.
+        import pvcheck.parser  # Not at the top: it imports this module
+        sections = list(pvcheck.parser.parse_sections(
+            io.TextIOWrapper(io.BytesIO(data))))
+        return resolve_paths(sections, os.path.dirname(self._filename))
+
+
+class _LazyCases:
+    """Sequence of the test cases of a LazyTestSuite."""
+
+    def __init__(self, suite):
+        self._suite = suite
+
+    def __len__(self):
+        return max(len(self._suite._offsets), 1)
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError("test case index out of range")
+        with open(self._suite._filename, "rb") as f:
+            return self._suite._test_case(f, n)
+
+    def __iter__(self):
+        with open(self._suite._filename, "rb") as f:
+            for n in range(len(self)):
+                yield self._suite._test_case(f, n)
+
+
+def _build_index(f):
+    # Return the list of (offset, description) of the tests in the
+    # binary file f.  Headers and descriptions are recognized as
+    # parse_sections and TestSuite do, but only the lines containing
+    # '.TEST' (found by searching the mapped file) are examined.
+    import pvcheck.parser
+    if os.fstat(f.fileno()).st_size == 0:
+        return []
+    index = []
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        pos = buf.find(b".TEST")
+        while pos >= 0:
+            start = buf.rfind(b"\n", 0, pos) + 1
+            end = _line_end(buf, pos)
+            pos = buf.find(b".TEST", end)
+            text = buf[start:end].decode("utf-8", errors="replace")
+            l = text.strip()
+            if not l or l[0] == "#":
+                continue
+            m = pvcheck.parser._RE_HEADER.match(text)
+            if m is None or m.group("tag") != ".TEST":
+                continue
+            index.append([start, "Test-%d" % (len(index) + 1)])
+            # The description is the first line of the section.
+            while end < len(buf):
+                start = end
+                end = _line_end(buf, start)
+                text = buf[start:end].decode("utf-8", errors="replace")
+                l = text.strip()
+                if l and l[0] != "#":
+                    if pvcheck.parser._RE_HEADER.match(text) is None:
+                        index[-1][1] = l
+                    break
+    return index
+
+
+def _line_end(buf, pos):
+    # Position following the end of the line containing pos.
+    end = buf.find(b"\n", pos)
+    return (end + 1 if end >= 0 else len(buf))
+
+
+def _load_index(path, signature):
+    try:
+        with open(path, "rt") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(data, dict) or
+            data.get("version") != INDEX_FORMAT_VER or
+            data.get("signature") != signature):
+        return None
+    return data["tests"]
+
+
+def _save_index(path, signature, index):
+    data = dict(version=INDEX_FORMAT_VER, signature=signature, tests=index)
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmpname = path + ".%d.tmp" % os.getpid()
+        with open(tmpname, "wt") as f:
+            json.dump(data, f)
+        os.replace(tmpname, path)
+    except OSError:
+        pass
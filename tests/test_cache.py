@@ -0,0 +1,230 @@
+import unittest
+import sys
+sys.path.insert(0, '..')
+import io
+import os
+import tempfile
+from unittest import mock
+from pvcheck.cache import *
+from pvcheck.executor import *
+from pvcheck.pvcheck import PvCheck
+from pvcheck.testdata import TestCase, TestSuite, Section
+from pvcheck.parser import parse_sections
+from pvcheck.formatter import TextFormatter
+
+
+class CountingExecutor(Executor):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def exec_process(self, *args, **kwargs):
+        self.count += 1
+        return super().exec_process(*args, **kwargs)
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self._tmpdir.name
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_get_put(self):
+        cache = ResultCache(self.dir)
+        key = cache.key(Executor(), ['echo', 'abc'], '')
+        self.assertIsNone(cache.get(key))
+        res = ExecResult(ER_OK, 0, 'abc\n', '', 0.1, 0.01, 0.0, 1000)
+        cache.put(key, res)
+        self.assertEqual(cache.get(key), res)
+        self.assertEqual(ResultCache(self.dir).get(key), res)
+
+    def test_uncached(self):
+        cache = ResultCache(self.dir)
+        key = cache.key(Executor(), ['sleep', '10'], '')
+        cache.put(key, ExecResult(ER_TIMEOUT, 0, '', ''))
+        self.assertIsNone(cache.get(key))
+        cache.put(key, ExecResult(ER_INTERRUPTED, -9, '', ''))
+        self.assertIsNone(cache.get(key))
+
+    def test_write_error(self):
+        cache = ResultCache(self.dir)
+        key = cache.key(Executor(), ['echo', 'abc'], '')
+        res = ExecResult(ER_OK, 0, 'abc\n', '', 0.1, 0.01, 0.0, 1000)
+        with mock.patch("os.replace", side_effect=OSError), \
+                mock.patch("os.remove", side_effect=OSError):
+            cache.put(key, res)
+        self.assertIsNone(cache.get(key))
+
+    def test_key(self):
+        cache = ResultCache(self.dir)
+        exe = Executor()
+        k = cache.key(exe, ['cat'], 'a', timeout=1)
+        self.assertEqual(k, cache.key(exe, ['cat'], 'a', timeout=1))
+        self.assertNotEqual(k, cache.key(exe, ['cat'], 'b', timeout=1))
+        self.assertNotEqual(k, cache.key(exe, ['cat'], 'a', timeout=2))
+        self.assertNotEqual(k, cache.key(exe, ['cat', ARG_TMPFILE], 'a',
+                                         'x', timeout=1))
+
+    def test_key_file_content(self):
+        cache = ResultCache(self.dir)
+        name = os.path.join(self.dir, 'data.txt')
+        with open(name, 'w') as f:
+            f.write('1')
+        k = cache.key(Executor(), ['cat', name], '')
+        with open(name, 'w') as f:
+            f.write('22')
+        self.assertNotEqual(k, cache.key(Executor(), ['cat', name], ''))
+
+    def test_eviction(self):
+        cache = ResultCache(self.dir, max_size=2000)
+        keys = []
+        for n in range(20):
+            key = cache.key(Executor(), ['echo', str(n)], '')
+            cache.put(key, ExecResult(ER_OK, 0, 'x' * 100, ''))
+            keys.append(key)
+        self.assertIsNotNone(cache.get(keys[-1]))
+        self.assertIsNone(cache.get(keys[0]))
+        total = sum(os.path.getsize(os.path.join(d, f))
+                    for d, ds, fs in os.walk(self.dir) for f in fs)
+        self.assertLessEqual(total, 2000)
+
+    def test_key_referenced_files(self):
+        cache = ResultCache(self.dir)
+        path = os.path.join(self.dir, 'input.txt')
+        keys = []
+        for text in ('a', 'b'):
+            with open(path, 'wt') as f:
+                f.write(text * 10)
+            os.utime(path, ns=(len(keys), len(keys)))
+            keys.append(cache.key(Executor(), ['cat'], '', input_file=path))
+        self.assertNotEqual(keys[0], keys[1])
+
+    def test_pvcheck(self):
+        exe = CountingExecutor()
+        test = TestCase("echo", [
+            Section(".ARGS", ["[OUT]\nfoo"]),
+            Section("OUT", ["foo"])
+        ])
+        outputs = []
+        for n in range(2):
+            dst = io.StringIO()
+            pv = PvCheck(exe, TextFormatter(destination=dst),
+                         cache=ResultCache(self.dir))
+            self.assertTrue(pv.exec_single_test(test, ["echo"]))
+            outputs.append(dst.getvalue())
+        self.assertEqual(exe.count, 1)
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_pvcheck_maxfail(self):
+        # Tests interrupted by maxfail are not cached.
+        sections = [
+            Section(".TEST", ["fail"]),
+            Section(".ARGS", ["-c", "echo '[OUT]'; echo 1"]),
+            Section("OUT", ["0"]),
+            Section(".TEST", ["slow"]),
+            Section(".ARGS", ["-c", "sleep 0.5; echo '[OUT]'; echo 0"]),
+            Section("OUT", ["0"])
+        ]
+        exe = CountingExecutor()
+        pv = PvCheck(exe, TextFormatter(destination=io.StringIO()),
+                     cache=ResultCache(self.dir))
+        self.assertEqual(pv.exec_suite(TestSuite(sections), ["sh"], jobs=2,
+                                       maxfail=1), 1)
+        self.assertEqual(pv.exec_suite(TestSuite(sections), ["sh"]), 1)
+        self.assertEqual(exe.count, 3)
+
+
+class TestSuiteCache(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self._tmpdir.name, "suites")
+        self.test_file = os.path.join(self._tmpdir.name, "t.test")
+        self.write("[.TEST]\na\n[.SECTIONS]\nOUT unordered\n[OUT]\n1\n")
+        self.builds = 0
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def write(self, text, mtime=None):
+        with open(self.test_file, "wt") as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(self.test_file, ns=(mtime, mtime))
+
+    def build(self):
+        self.builds += 1
+        with open(self.test_file, "rt") as f:
+            return TestSuite(parse_sections(f))
+
+    def get(self, variant=""):
+        cache = SuiteCache(self.dir)
+        return cache.get(["", self.test_file], self.build, variant)
+
+    def test_reuse(self):
+        s1 = self.get()
+        s2 = self.get()
+        self.assertEqual(self.builds, 1)
+        self.assertIsNot(s1, s2)
+        test = s2.test_case(0)
+        self.assertEqual(test.description, "a")
+        self.assertEqual(test.find_section("OUT").content, ["1"])
+        self.assertEqual(test.section_options("OUT"), {"unordered"})
+
+    def test_modified(self):
+        self.write("[.TEST]\na\n[OUT]\n1\n", 10 ** 9)
+        self.get()
+        self.write("[.TEST]\nb\n[OUT]\n1\n", 2 * 10 ** 9)
+        self.assertEqual(self.get().test_case(0).description, "b")
+        self.assertEqual(self.builds, 2)
+
+    def test_touched(self):
+        self.get()
+        os.utime(self.test_file, ns=(10 ** 9, 10 ** 9))
+        self.get()
+        self.get()
+        self.assertEqual(self.builds, 1)
+
+    def test_variant(self):
+        self.get()
+        self.get("valgrind")
+        self.get("valgrind")
+        self.assertEqual(self.builds, 2)
+
+    def test_damaged(self):
+        self.get()
+        for name in os.listdir(self.dir):
+            with open(os.path.join(self.dir, name), "wb") as f:
+                f.write(b"garbage")
+        self.assertEqual(self.get().test_case(0).description, "a")
+        self.assertEqual(self.builds, 2)
+
+    def test_not_private(self):
+        self.get()
+        for name in os.listdir(self.dir):
+            os.chmod(os.path.join(self.dir, name), 0o666)
+        self.get()
+        self.assertEqual(self.builds, 2)
+        os.chmod(self.dir, 0o777)
+        self.get()
+        self.assertEqual(self.builds, 3)
+        os.chmod(self.dir, 0o700)
+        self.get()
+        self.assertEqual(self.builds, 3)
+
+    def test_write_error(self):
+        with mock.patch("os.replace", side_effect=OSError), \
+                mock.patch("os.remove", side_effect=OSError):
+            self.get()
+        self.get()
+        self.assertEqual(self.builds, 2)
+
+    def test_missing_file(self):
+        os.remove(self.test_file)
+        self.assertIsNone(SuiteCache(self.dir).get([self.test_file],
+                                                    lambda: None))
+
+
+if __name__ == '__main__':
+    unittest.main()
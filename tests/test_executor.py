@@ -1,7 +1,13 @@
 import unittest
 import sys
 sys.path.insert(0, '..')
+import os
+import time
+import tempfile
+import threading
+from unittest import mock
 from pvcheck.executor import *
+import pvcheck.executor
 
 
 class TestExecutor(unittest.TestCase):
@@ -17,6 +23,33 @@ class TestExecutor(unittest.TestCase):
         self.assertEqual(r.status, 0)
         self.assertEqual(r.output, 'test test test\n')
 
+    def test_exec_process_bytes(self):
+        r = Executor().exec_process(['cat'], 'caff\u00e8\n'.encode())
+        self.assertEqual(r.result, ER_OK)
+        self.assertEqual(r.output, 'caff\u00e8\n')
+
+    def test_exec_process_input_file(self):
+        with tempfile.NamedTemporaryFile("wt") as f:
+            f.write("line\n" * 10000)
+            f.flush()
+            r = Executor().exec_process(['wc', '-l'], 'ignored',
+                                        input_file=f.name)
+            self.assertEqual(r.result, ER_OK)
+            self.assertEqual(r.output.strip(), '10000')
+            r = Executor().exec_process(['cat', ARG_TMPFILE], '',
+                                        tmpfile='ignored',
+                                        tmpfile_from=f.name)
+            self.assertEqual(r.output, "line\n" * 10000)
+
+    def test_exec_process_missing_files(self):
+        r = Executor().exec_process(['cat'], '', input_file='__zzzzz')
+        self.assertEqual(r.result, ER_NOTFILE)
+        self.assertEqual(r.stderr, '__zzzzz')
+        r = Executor().exec_process(['cat', ARG_TMPFILE], '',
+                                    tmpfile_from='__zzzzz')
+        self.assertEqual(r.result, ER_NOTFILE)
+        self.assertEqual(r.stderr, '__zzzzz')
+
     def test_exec_process3(self):
         r = Executor().exec_process(['cat', ARG_TMPFILE], '',
                                     tmpfile='1\n2\n3\n4')
@@ -41,7 +74,193 @@ class TestExecutor(unittest.TestCase):
         r = Executor().exec_process(['seq', '10'], '', output_limit=5)
         self.assertEqual(r.result, ER_OUTPUT_LIMIT)
         self.assertEqual(r.output, '1\n2\n3\n4\n5\n')
+
+    def test_exec_process8(self):
+        r = Executor().exec_process(['seq', '5'], '', output_limit=5)
+        self.assertEqual(r.result, ER_OK)
+        self.assertEqual(r.output, '1\n2\n3\n4\n5\n')
+        self.assertEqual(r.status, 0)
+
+    def test_exec_process9(self):
+        r = Executor().exec_process(['yes'], '', timeout=10,
+                                    output_limit=100000)
+        self.assertEqual(r.result, ER_OUTPUT_LIMIT)
+        self.assertEqual(r.output, 'y\n' * 100000)
+
+    def test_exec_process10(self):
+        r = Executor().exec_process(['yes'], '', timeout=10,
+                                    output_byte_limit=1001)
+        self.assertEqual(r.result, ER_OUTPUT_LIMIT)
+        self.assertEqual(r.output, 'y\n' * 500 + 'y')
+
+    def test_exec_process_resources(self):
+        r = Executor().exec_process(['sleep', '0.1'], '')
+        self.assertGreaterEqual(r.wall_time, 0.1)
+        self.assertGreaterEqual(r.user_time, 0)
+        self.assertGreaterEqual(r.sys_time, 0)
+        self.assertGreater(r.max_rss, 0)
+        r = Executor().exec_process(['__zzzzz'], '')
+        self.assertIsNone(r.wall_time)
+        self.assertIsNone(r.max_rss)
+
+    def test_exec_process_own_memory(self):
+        # The memory of pvcheck is not attributed to the program.
+        ballast = bytearray(300 * 1024 * 1024)
+        for i in range(0, len(ballast), 4096):
+            ballast[i] = 1
+        for limits in (None, {'files': 64}):
+            r = Executor().exec_process(['sleep', '0.1'], '', limits=limits)
+            self.assertIsNotNone(r.max_rss)
+            self.assertLess(r.max_rss, 100 * 1024)
+        r = Executor().exec_process(
+            [sys.executable, '-c', 'b = bytearray(400 * 2 ** 20)'], '')
+        self.assertGreater(r.max_rss, 400 * 1024)
+
+    def test_exec_process_cpu_limit(self):
+        r = Executor().exec_process(['sh', '-c', 'while :; do :; done'], '',
+                                    timeout=10, limits={'cpu': 1})
+        self.assertEqual(r.result, ER_CPU_LIMIT)
+
+    def test_exec_process_limits(self):
+        r = Executor().exec_process(['sh', '-c', 'ulimit -n; ulimit -t; cat'],
+                                    'input\n', limits={'files': 64, 'cpu': 3})
+        self.assertEqual(r.result, ER_OK)
+        self.assertEqual(r.output, '64\n3\ninput\n')
+        r = Executor().exec_process(['__zzzzz'], '', limits={'files': 64})
+        self.assertEqual(r.result, ER_NOTFILE)
+
+    def test_exec_process_interrupted(self):
+        exe = Executor()
+        timer = threading.Timer(0.2, exe.kill_all)
+        timer.start()
+        r = exe.exec_process(['sleep', '10'], '')
+        timer.join()
+        self.assertEqual(r.result, ER_INTERRUPTED)
+
+    def test_exec_process_terminated_before_kill(self):
+        # A process which exits by itself is not considered killed.
+        exe = Executor()
+
+        def monitor(chunk):
+            time.sleep(0.2)
+            exe.kill_all()
+            return True
+
+        r = exe.exec_process(['echo', '1'], '', monitor=monitor)
+        self.assertEqual(r.result, ER_OK)
         self.assertEqual(r.status, 0)
+        self.assertEqual(r.output, '1\n')
+
+    def test_exec_process_memory_limit(self):
+        # A failed allocation is an ordinary error.
+        r = Executor().exec_process([sys.executable, '-c', 'bytearray(10 ** 9)'],
+                                    '', limits={'memory': 200 * 1024 ** 2})
+        self.assertEqual(r.result, ER_ERROR)
+
+    def test_exec_process_file_limit(self):
+        cmd = 'exec dd if=/dev/zero of="$1" bs=1000 count=100'
+        r = Executor().exec_process(['sh', '-c', cmd, 'sh', ARG_TMPFILE],
+                                    '', tmpfile='', limits={'filesize': 1000})
+        self.assertEqual(r.result, ER_FILE_LIMIT)
+
+    def test_exec_process11(self):
+        text = 'abc\n' * 100000
+        r = Executor().exec_process(['cat'], text)
+        self.assertEqual(r.result, ER_OK)
+        self.assertEqual(r.output, text)
+
+    def test_exec_process_monitor(self):
+        chunks = []
+
+        def monitor(chunk):
+            chunks.append(chunk)
+            return b'stop' not in b''.join(chunks)
+
+        cmd = 'echo go; sleep 0.1; echo stop; sleep 10'
+        r = Executor().exec_process(['sh', '-c', cmd], '', timeout=5,
+                                    monitor=monitor)
+        self.assertEqual(r.result, ER_MISMATCH)
+        self.assertEqual(r.output, 'go\nstop\n')
+        chunks.clear()
+        r = Executor().exec_process(['echo', 'go'], '', monitor=monitor)
+        self.assertEqual(r.result, ER_OK)
+
+
+class TestLimits(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(parse_size("100"), 100)
+        self.assertEqual(parse_size("2k"), 2048)
+        self.assertEqual(parse_size("1M"), 1024 ** 2)
+        self.assertEqual(parse_size("1.5K"), 1536)
+        for text in ("x", "-1", "K", "infG"):
+            self.assertRaises(ValueError, parse_size, text)
+
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit('memory', '2K'), 2048)
+        self.assertEqual(parse_limit('filesize', '1m'), 1024 ** 2)
+        self.assertEqual(parse_limit('cpu', '1.5'), 2)
+        self.assertEqual(parse_limit('files', '64'), 64)
+        self.assertRaises(ValueError, parse_limit, 'cpu', '1K')
+        self.assertRaises(ValueError, parse_limit, 'cpu', '-1')
+        self.assertRaises(ValueError, parse_limit, 'foo', '1')
+
+    def test_parse_limits(self):
+        limits = parse_limits(['memory 1G', '', 'files 8', 'memory 2G'])
+        self.assertEqual(limits, {'memory': 2 * 1024 ** 3, 'files': 8})
+        self.assertRaises(ValueError, parse_limits, ['processes 8'])
+        self.assertRaises(ValueError, parse_limits, ['memory'])
+
+
+class TestTempFiles(unittest.TestCase):
+    def check_files(self):
+        files = pvcheck.executor._TempFiles(max_idle=15)
+        with files.get("abc\n") as t1, files.get("abc\n") as t2:
+            # Same master, private copies.
+            self.assertEqual(len(files._masters), 1)
+            self.assertNotEqual(t1.path, t2.path)
+            r = Executor().exec_process(
+                ['sh', '-c', 'echo x >> "$1"; cat "$1"', 'sh', ARG_TMPFILE],
+                '', tmpfile="abc\n")
+            self.assertEqual(r.output, "abc\nx\n")
+        with files.get("long content") as t3:
+            pass
+        # Only the most recent master fits the limit.
+        self.assertEqual(len(files._masters), 1)
+        files.close()
+        self.assertEqual(len(files._masters), 0)
+        with tempfile.NamedTemporaryFile("wt") as f:
+            f.write("from file\n")
+            f.flush()
+            with files.get_file(f.name) as t4, files.get_file(f.name) as t5:
+                self.assertEqual(len(files._masters), 1)
+                with open(t4.path) as g:
+                    self.assertEqual(g.read(), "from file\n")
+            f.write("more\n")
+            f.flush()
+            with files.get_file(f.name) as t6:
+                # A modified file gets a new master.
+                self.assertEqual(len(files._masters), 2)
+                with open(t6.path) as g:
+                    self.assertEqual(g.read(), "from file\nmore\n")
+        with self.assertRaises(FileNotFoundError):
+            with files.get_file("__zzzzz"):
+                pass
+        files.close()
+        self.assertEqual(len(files._masters), 0)
+        return t3
+
+    def test_memfd(self):
+        t = self.check_files()
+        if pvcheck.executor._memfd("test") is not None:
+            self.assertTrue(t.path.startswith("/proc/self/fd/"))
+
+    def test_no_memfd(self):
+        with mock.patch("pvcheck.executor._memfd", return_value=None):
+            t = self.check_files()
+            self.assertFalse(os.path.exists(t.path))
+            r = Executor().exec_process(['cat', ARG_TMPFILE], '',
+                                        tmpfile='1\n2\n')
+            self.assertEqual(r.output, '1\n2\n')
 
 
 if __name__ == '__main__':
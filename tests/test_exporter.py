@@ -0,0 +1,73 @@
+import unittest
+import sys
+sys.path.insert(0, '..')
+import contextlib
+import io
+import os
+import tempfile
+from pvcheck.exporter import export
+from pvcheck.testdata import TestCase, Section
+
+
+class TestExporter(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self._tmpdir.name
+        self._cwd = os.getcwd()
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmpdir.cleanup()
+
+    def export(self, test):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            with self.assertRaises(SystemExit) as cm:
+                export(test, 0)
+        return (cm.exception.code, out.getvalue())
+
+    def read(self, name):
+        with open(os.path.join(self.dir, name), "rb") as f:
+            return f.read()
+
+    def test_sections(self):
+        test = TestCase("my test", [Section(".INPUT", ["1", "2"]),
+                                    Section(".FILE", ["abc"])])
+        self.assertEqual(self.export(test)[0], 0)
+        self.assertEqual(self.read("my_test.dat"), b"1\n2\nabc\n")
+
+    def test_input_file(self):
+        path = os.path.join(self.dir, "input.txt")
+        with open(path, "wb") as f:
+            f.write(b"3\n4\n")
+        test = TestCase("t", [Section(".INPUT", ["ignored"]),
+                              Section(".INPUT_FILE", [path])])
+        self.assertEqual(self.export(test)[0], 0)
+        self.assertEqual(self.read("t.dat"), b"3\n4\n")
+
+    def test_file_from(self):
+        path = os.path.join(self.dir, "file.txt")
+        with open(path, "wb") as f:
+            f.write(b"xyz\n")
+        test = TestCase("t", [Section(".INPUT", ["1"]),
+                              Section(".FILE_FROM", [path])])
+        self.assertEqual(self.export(test)[0], 0)
+        self.assertEqual(self.read("t.dat"), b"1\nxyz\n")
+
+    def test_missing_file(self):
+        path = os.path.join(self.dir, "missing.txt")
+        test = TestCase("t", [Section(".INPUT_FILE", [path])])
+        code, out = self.export(test)
+        self.assertEqual(code, 1)
+        self.assertIn(path, out)
+        self.assertFalse(os.path.exists("t.dat"))
+
+    def test_nothing(self):
+        code, out = self.export(TestCase("t", [Section("OUT", ["1"])]))
+        self.assertEqual(code, 1)
+        self.assertIn("1", out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,12 @@ import unittest
 import sys
 sys.path.insert(0, '..')
 import io
+import json
+import time
+from collections import OrderedDict
 from pvcheck.formatter import *
-from pvcheck.testdata import Section
+from pvcheck.jsonformatter import *
+from pvcheck.testdata import Section, TestCase
 from pvcheck.executor import *
 
 
@@ -171,5 +175,217 @@ EXPECTED: missing line (expected '1')
         self.assertEqual(dst.getvalue(), exp)
 
 
+class TestJSONLinesFormatter(unittest.TestCase):
+    def run_session(self, fmt, skipped=None):
+        test = TestCase("t", [Section("OUT", ["1", "2"])])
+        res = ExecResult(ER_OK, 0, "[OUT]\n1\n3\n", "", 0.1, 0.1, 0.0, 100)
+        fmt.begin_session()
+        for n in range(2):
+            fmt.begin_test("test%d" % n, ["prog", "a"], "in\n", None)
+            fmt.execution_result(["prog", "a"], res, test)
+            fmt.comparison_result(test.find_section("OUT"),
+                                  Section("OUT", ["1", "3"]),
+                                  [0.0, 1.0], ["1", "2"])
+            fmt.end_test()
+        if skipped is not None:
+            fmt.tests_skipped(skipped)
+        fmt.end_session()
+
+    def test_records(self):
+        dst = io.StringIO()
+        self.run_session(JSONLinesFormatter(dst))
+        records = [json.loads(l) for l in dst.getvalue().splitlines()]
+        self.assertEqual([r["record"] for r in records],
+                         ["session", "test", "test", "end"])
+        self.assertEqual(records[0]["version"], JSON_FORMAT_VER)
+        self.assertEqual(records[2]["title"], "test1")
+        self.assertEqual(records[2]["sections"]["OUT"]["wrong_lines"],
+                         [[1, "3", "2"]])
+
+    def test_read_sessions(self):
+        for skipped in (None, 3):
+            old = io.StringIO()
+            fmt = JSONFormatter(old)
+            self.run_session(fmt, skipped)
+            new = io.StringIO()
+            fmt = JSONLinesFormatter(new)
+            self.run_session(fmt, skipped)
+            # Old documents and new records, as in an old log file.
+            log = io.StringIO(old.getvalue() + new.getvalue() +
+                              new.getvalue())
+            docs = list(read_sessions(log))
+            self.assertEqual(len(docs), 3)
+            expected = json.loads(old.getvalue(),
+                                  object_pairs_hook=OrderedDict)
+            for doc in docs:
+                self.assertEqual(list(doc), list(expected))
+                doc["created_at"] = expected["created_at"]
+                self.assertEqual(doc, expected)
+
+    def test_failed_outputs(self):
+        dst = io.StringIO()
+        self.run_session(JSONLinesFormatter(dst, outputs="failures"))
+        fmt = JSONLinesFormatter(dst, outputs="failures")
+        fmt.begin_session()
+        test = TestCase("t", [Section("OUT", ["1"])])
+        fmt.begin_test("ok", ["prog"], "", None)
+        fmt.execution_result(["prog"], ExecResult(ER_OK, 0, "[OUT]\n1\n", ""),
+                             test)
+        fmt.comparison_result(test.find_section("OUT"),
+                              Section("OUT", ["1"]), [0.0], ["1"])
+        fmt.end_test()
+        test = TestCase("t", [Section("OUT", ["1"]), Section("X", ["2"])])
+        fmt.begin_test("mixed", ["prog"], "", None)
+        fmt.execution_result(["prog"], ExecResult(ER_OK, 0, "", ""), test)
+        fmt.comparison_result(test.find_section("OUT"),
+                              Section("OUT", ["0"]), [1.0], ["1"])
+        fmt.comparison_result(test.find_section("X"),
+                              Section("X", ["2"]), [0.0], ["2"])
+        fmt.end_test()
+        fmt.end_session()
+        tests = [json.loads(l) for l in dst.getvalue().splitlines()
+                 if json.loads(l)["record"] == "test"]
+        self.assertEqual(tests[0]["output"], "[OUT]\n1\n3\n")
+        self.assertEqual(tests[0]["sections"]["OUT"]["generated"], ["1", "3"])
+        self.assertIsNone(tests[2]["output"])
+        self.assertIsNone(tests[2]["sections"]["OUT"]["generated"])
+        self.assertIsNone(tests[2]["sections"]["OUT"]["expected"])
+        # Only the wrong sections of a failed test.
+        self.assertEqual(tests[3]["sections"]["OUT"]["expected"], ["1"])
+        self.assertIsNone(tests[3]["sections"]["X"]["expected"])
+        self.assertIsNone(tests[3]["sections"]["X"]["generated"])
+
+    def test_read_interrupted(self):
+        dst = io.StringIO()
+        fmt = JSONLinesFormatter(dst)
+        self.run_session(fmt)
+        lines = dst.getvalue().splitlines(keepends=True)
+        docs = list(read_sessions(io.StringIO("".join(lines[:2]))))
+        self.assertEqual(len(docs), 1)
+        self.assertEqual(len(docs[0]["tests"]), 1)
+
+    def test_read_truncated(self):
+        dst = io.StringIO()
+        self.run_session(JSONLinesFormatter(dst))
+        lines = dst.getvalue().splitlines(keepends=True)
+        truncated = "".join(lines[:2]) + lines[2][:20]
+        docs = list(read_sessions(io.StringIO(truncated)))
+        self.assertEqual(len(docs), 1)
+        self.assertEqual(len(docs[0]["tests"]), 1)
+        # A new session appended to the truncated record.
+        docs = list(read_sessions(io.StringIO(truncated + dst.getvalue())))
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(len(docs[1]["tests"]), 2)
+
+
+class TestResultStats(unittest.TestCase):
+    def _run_test(self, stats, name, result, sections, comparisons):
+        test = TestCase(name, [Section(t, ["1"]) for t in sections])
+        stats.begin_test(name, ["prog"], "", None)
+        stats.execution_result(["prog"], result, test)
+        for tag, diffs in comparisons:
+            if diffs is None:
+                stats.missing_section(Section(tag, ["1"]))
+            else:
+                stats.comparison_result(Section(tag, ["1"]), None, diffs,
+                                        [])
+        stats.end_test()
+
+    def test_counts(self):
+        ok = ExecResult(ER_OK, 0, "", "", 1.0, 0.5, 0.25, 100)
+        slow = ExecResult(ER_OK, 0, "", "", 3.0, 1.0, 0.5, 50)
+        crash = ExecResult(ER_SEGFAULT, -11, "", "")
+        stats = ResultStats()
+        stats.begin_session()
+        self._run_test(stats, "a", ok, ["A", "B"],
+                       [("A", [0.0]), ("B", [0.0, 1.0])])
+        self._run_test(stats, "b", slow, ["A", "B"],
+                       [("A", [0.0]), ("B", None)])
+        self._run_test(stats, None, crash, ["A", "C"], [])
+        self.assertEqual(stats.sections(), ["A", "B", "C"])
+        a, b, c = (stats.section(t) for t in "ABC")
+        self.assertEqual((a.ok, a.warning, a.error), (2, 0, 1))
+        self.assertEqual((b.ok, b.warning, b.error), (0, 1, 1))
+        self.assertEqual((c.ok, c.warning, c.error), (0, 0, 1))
+        self.assertAlmostEqual(a.mean_equality(), 200 / 3)
+        self.assertAlmostEqual(b.mean_equality(), 25.0)
+        t = stats.totals
+        self.assertEqual((t.ok, t.warning, t.error), (2, 1, 3))
+        t = stats.tests
+        self.assertEqual((t.ok, t.warning, t.error), (0, 1, 2))
+        self.assertEqual(stats.test_count, 3)
+        wall = stats.resources["wall_time"]
+        self.assertEqual((wall.total, wall.maximum, wall.argmax),
+                         (4.0, 3.0, "b"))
+        self.assertEqual(stats.resources["cpu_time"].mean(), 1.125)
+        self.assertEqual(stats.resources["max_rss"].argmax, "a")
+
+    def test_no_sections(self):
+        crash = ExecResult(ER_SEGFAULT, -11, "", "")
+        ok = ExecResult(ER_OK, 0, "", "")
+        stats = ResultStats()
+        stats.begin_session()
+        self._run_test(stats, "a", crash, [], [])
+        self._run_test(stats, "b", ok, [], [])
+        t = stats.totals
+        self.assertEqual((t.ok, t.warning, t.error), (0, 0, 1))
+        self.assertEqual(stats.tests.error, 1)
+        self.assertEqual(stats.sections(), [])
+
+    def test_mismatch(self):
+        # Sections compared after a mismatch are not execution errors.
+        mismatch = ExecResult(ER_MISMATCH, 0, "", "")
+        stats = ResultStats()
+        stats.begin_session()
+        self._run_test(stats, "a", mismatch, ["A", "B"], [("A", [0.0])])
+        self.assertEqual(stats.section("A").ok, 1)
+        self.assertEqual(stats.section("B").error, 1)
+        self.assertEqual(stats.tests.error, 1)
+
+
+class TestAsyncCombinedFormatter(unittest.TestCase):
+    section = Section("SECT", [])
+
+    def _session(self, fmt):
+        fmt.begin_session()
+        for n in range(10):
+            fmt.begin_test("test %d" % n, [], "", None)
+            fmt.missing_section(self.section)
+            fmt.end_test()
+        fmt.tests_skipped(3)
+        fmt.end_session()
+
+    def test_order(self):
+        recorders = [RecordingFormatter(), RecordingFormatter()]
+        self._session(AsyncCombinedFormatter(recorders, queue_size=2))
+        expected = RecordingFormatter()
+        self._session(expected)
+        for r in recorders:
+            self.assertEqual(r.events, expected.events)
+
+    def test_drain(self):
+        # end_session waits for slow formatters.
+        class SlowFormatter(RecordingFormatter):
+            def end_test(self):
+                time.sleep(0.01)
+                super().end_test()
+
+        slow = SlowFormatter()
+        self._session(AsyncCombinedFormatter([slow], queue_size=1))
+        self.assertEqual(slow.events[-1], ("end_session", ()))
+
+    def test_error(self):
+        class FailingFormatter(RecordingFormatter):
+            def end_test(self):
+                raise ValueError("failure")
+
+        other = RecordingFormatter()
+        fmt = AsyncCombinedFormatter([FailingFormatter(), other],
+                                     queue_size=1)
+        with self.assertRaises(ValueError):
+            self._session(fmt)
+        self.assertEqual(other.events[-1], ("end_session", ()))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import sys
+sys.path.insert(0, '..')
+from pvcheck.interactiveformatter import Report
+
+
+class FakePad:
+    """Records the text drawn on the pad."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def erase(self):
+        self.rows = {}
+
+    def addnstr(self, row, col, text, n, attr=0):
+        self.rows[row] = (text[:n], attr)
+
+    def refresh(self, *args):
+        pass
+
+
+class TestReport(unittest.TestCase):
+    def setUp(self):
+        self.report = Report("title", 10)
+        for n in range(100000):
+            self.report.add_line("line %d" % n, n % 3)
+
+    def test_length(self):
+        self.assertEqual(self.report.length(), 100000)
+
+    def test_truncation(self):
+        report = Report("title", 4)
+        report.add_line("abcdefgh")
+        pad = FakePad()
+        report.refresh(pad, 5, 80)
+        self.assertEqual(pad.rows, {0: ("abcd", 0)})
+
+    def test_visible_window(self):
+        pad = FakePad()
+        self.report.scroll(5, lines=10)
+        self.report.refresh(pad, 5, 80)
+        self.assertEqual(sorted(pad.rows), list(range(5)))
+        self.assertEqual(pad.rows[0], ("line 10", 1))
+        self.assertEqual(pad.rows[4], ("line 14", 2))
+        self.assertEqual((self.report.top(), self.report.bottom(5)), (11, 15))
+
+    def test_scroll_limits(self):
+        pad = FakePad()
+        self.report.scroll(5, documents=1)
+        self.report.refresh(pad, 5, 80)
+        self.assertEqual(pad.rows[4], ("line 99999", 99999 % 3))
+        self.report.scroll(5, pages=-100000)
+        self.assertEqual(self.report.top(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
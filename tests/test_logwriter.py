@@ -0,0 +1,85 @@
+import unittest
+import sys
+sys.path.insert(0, '..')
+import os
+import gzip
+import lzma
+import tempfile
+from pvcheck.logwriter import *
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, "pvcheck.log")
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def read(self, path=None):
+        with open(path or self.path, "rt") as f:
+            return f.read()
+
+    def session(self, text, **kwargs):
+        with LogWriter(self.path, **kwargs) as log:
+            for line in text.splitlines(keepends=True):
+                log.write(line)
+                log.flush()
+
+    def test_write(self):
+        self.session("a\nb\n")
+        self.session("c\n")
+        self.assertEqual(self.read(), "a\nb\nc\n")
+
+    def test_small_queue(self):
+        text = "".join("%d\n" % i for i in range(1000))
+        self.session(text, queue_size=2)
+        self.assertEqual(self.read(), text)
+
+    def test_rotation(self):
+        for n in range(5):
+            self.session("%d\n" % n * 10, max_size=15, backups=2)
+        self.assertEqual(self.read(), "4\n" * 10)
+        with gzip.open(self.path + ".1.gz", "rt") as f:
+            self.assertEqual(f.read(), "3\n" * 10)
+        with gzip.open(self.path + ".2.gz", "rt") as f:
+            self.assertEqual(f.read(), "2\n" * 10)
+        self.assertFalse(os.path.exists(self.path + ".3.gz"))
+
+    def test_lzma(self):
+        self.session("a\n" * 10, max_size=10, compression="lzma")
+        self.session("b\n", max_size=10, compression="lzma")
+        with lzma.open(self.path + ".1.xz", "rt") as f:
+            self.assertEqual(f.read(), "a\n" * 10)
+        self.assertEqual(self.read(), "b\n")
+
+    def test_no_backups(self):
+        self.session("a\n" * 10, max_size=10, backups=0)
+        self.session("b\n", max_size=10, backups=0)
+        self.assertEqual(sorted(os.listdir(self._tmpdir.name)),
+                         ["pvcheck.log"])
+        self.assertEqual(self.read(), "b\n")
+
+    def test_concurrent_rotation(self):
+        self.session("a\n" * 10)
+        # Opened by another process before the log is rotated.
+        stale = open(self.path, "at")
+        self.session("b\n", max_size=10)
+        log = LogWriter(self.path, max_size=0)
+        log.close()
+        log._file = stale
+        log._max_size = 10
+        log._rotate()
+        log._file.close()
+        self.assertEqual(self.read(), "b\n")
+        self.assertFalse(os.path.exists(self.path + ".2.gz"))
+
+    def test_errors(self):
+        with self.assertRaises(OSError):
+            LogWriter(os.path.join(self.path, "missing", "log"))
+        with self.assertRaises(ValueError):
+            LogWriter(self.path, compression="zip")
+
+
+if __name__ == '__main__':
+    unittest.main()
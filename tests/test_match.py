@@ -1,7 +1,10 @@
 import unittest
 import sys
+import random
+from itertools import zip_longest
 sys.path.insert(0, '..')
 from pvcheck.match import *
+import pvcheck.match
 
 class TestOrderedComparisons(unittest.TestCase):
     def test_compare_sections1(self):
@@ -51,6 +54,32 @@ class TestOrderedComparisons(unittest.TestCase):
         self.assertEqual(diffs, [])
         self.assertEqual(matches, [])
 
+    def test_compare_ordered_chunks(self):
+        exp = ['1 2', 'a', '3.14', 'b c', 'd']
+        chunks = [exp[:2], exp[2:3], exp[3:]]
+        for act in ([], ['1 2'], ['1 2', 'x', '3.141', 'b c', 'd'],
+                    ['1 2', 'a', '3.14', 'b c', 'd', 'e', 'f'],
+                    ['2 1', 'a', '3.15']):
+            diffs, matches = compare_ordered_chunks(act, chunks)
+            exp_diffs, exp_matches = compare_sections(act, exp)
+            self.assertEqual(diffs, exp_diffs)
+            # Correct lines stand for the expected ones.
+            self.assertEqual(list(matches),
+                             [m if d > 0 else a for (a, m, d)
+                              in zip_longest(act, exp_matches, diffs)])
+        diffs, matches = compare_ordered_chunks(['a'], [])
+        self.assertEqual((diffs, list(matches)), ([1.0], [None]))
+
+    def test_compare_ordered_chunks_sparse(self):
+        exp = ['%d' % n for n in range(1000)]
+        act = list(exp)
+        act[10] = 'x'
+        diffs, matches = compare_ordered_chunks(act, [exp[:500], exp[500:]])
+        self.assertEqual(matches._wrong, {10: '10'})
+        self.assertEqual(matches[10], '10')
+        self.assertEqual(matches[-1], '999')
+        self.assertEqual(matches[9:11], ['9', '10'])
+
 
 class TestUnorderedComparisons(unittest.TestCase):
     def test_compare_sections1(self):
@@ -105,6 +134,130 @@ class TestUnorderedComparisons(unittest.TestCase):
         self.assertEqual(diffs, [])
         self.assertEqual(matches, [])
 
+    def test_compare_unordered_numbers(self):
+        exp = ['1 2.5', '+1 2.50', 'x 3', '01 2.5']
+        diffs, matches = compare_sections(['1 2.51', '1.0 2.5', '1 2.5',
+                                           'x +3', '1 2.5'], exp, False)
+        self.assertEqual(diffs, [0.0, 1.0, 0.0, 0.0, 0.0])
+        self.assertEqual(matches, ['1 2.5', None, '+1 2.50', 'x 3',
+                                   '01 2.5'])
+
+    def test_compare_unordered_random(self):
+        # Compare with a straightforward implementation.
+        rnd = random.Random(1)
+        tokens = ['1', '+1', '01', '1.', '1.0', '0.5', '.5', '-0.', '0',
+                  'a', 'b', '1' * 5000, '1e3', '1000']
+
+        def reference(actual, expected):
+            remaining = list(range(len(expected)))
+            diffs, ordered = [], []
+            for x in actual:
+                for n in remaining:
+                    if compare_sections([x], [expected[n]])[0] == [0.0]:
+                        diffs.append(0.0)
+                        ordered.append(expected[n])
+                        remaining.remove(n)
+                        break
+                else:
+                    diffs.append(1.0)
+                    ordered.append(None)
+            diffs.extend([1.0] * len(remaining))
+            ordered.extend(expected[n] for n in remaining)
+            return (diffs, ordered)
+
+        def line():
+            return ' '.join(rnd.choice(tokens)
+                            for _ in range(rnd.randrange(3)))
+
+        for _ in range(200):
+            exp = [line() for _ in range(rnd.randrange(8))]
+            act = [line() for _ in range(rnd.randrange(8))]
+            self.assertEqual(compare_sections(act, exp, False),
+                             reference(act, exp))
+
+
+class TestAlignedComparisons(unittest.TestCase):
+    def test_aligned1(self):
+        exp = ['a', 'b', 'c', 'd']
+        diffs, matches = compare_sections(['a', 'c', 'd'], exp,
+                                          aligned=True)
+        self.assertEqual(diffs, [0.0, 0.0, 0.0, 1.0])
+        self.assertEqual(matches, ['a', 'c', 'd', 'b'])
+
+    def test_aligned2(self):
+        exp = ['a', 'b', 'c']
+        diffs, matches = compare_sections(['x', 'a', 'b', 'y', 'c'], exp,
+                                          aligned=True)
+        self.assertEqual(diffs, [1.0, 0.0, 0.0, 1.0, 0.0])
+        self.assertEqual(matches, [None, 'a', 'b', None, 'c'])
+
+    def test_aligned3(self):
+        exp = ['a 1', 'b 2', 'c 3']
+        diffs, matches = compare_sections(['a 1', 'b 4', 'c 3'], exp,
+                                          aligned=True)
+        self.assertEqual(diffs, [0.0, 0.5, 0.0])
+        self.assertEqual(matches, exp)
+
+    def test_aligned_same_as_ordered(self):
+        exp = ['a', 'b', 'c']
+        for act in (exp, [], ['a', 'b', 'c', 'd'], ['x', 'y', 'z']):
+            self.assertEqual(compare_sections(act, exp, aligned=True),
+                             compare_sections(act, exp))
+
+    def test_aligned_max_cost(self):
+        exp = [str(i) for i in range(10)]
+        act = exp[1:] + ['x']
+        diffs, matches = compare_sections(act, exp, aligned=True)
+        self.assertEqual(diffs, [0.0] * 9 + [1.0, 1.0])
+        self.assertEqual(matches, exp[1:] + [None, '0'])
+        diffs, matches = compare_sections(act, exp, aligned=True,
+                                          max_cost=1)
+        self.assertEqual(diffs, [1.0] * 10)
+        self.assertEqual(matches, exp)
+
+    def test_aligned_unordered(self):
+        exp = ['a', 'b']
+        self.assertEqual(compare_sections(['b', 'a'], exp, False, True),
+                         compare_sections(['b', 'a'], exp, False))
+
+
+class TestIncrementalComparisons(unittest.TestCase):
+    def _incremental(self, actual, expected, ordered):
+        comparison = IncrementalComparison(expected, ordered)
+        results = [comparison.add(line) for line in actual]
+        return (results, comparison.end(), comparison.errors)
+
+    def test_incremental1(self):
+        exp = ['a 1', 'b 2.5']
+        results, ok, errors = self._incremental(['a 01', 'b 2.51'], exp, True)
+        self.assertEqual(results, [True, True])
+        self.assertTrue(ok)
+        results, ok, errors = self._incremental(['a 2', 'b 2.5', 'c'], exp,
+                                                True)
+        self.assertEqual(results, [False, True, False])
+        self.assertFalse(ok)
+        self.assertEqual(errors, 2)
+
+    def test_incremental2(self):
+        exp = ['a', 'b', 'c']
+        results, ok, errors = self._incremental(['c', 'x'], exp, False)
+        self.assertEqual(results, [True, False])
+        self.assertFalse(ok)
+        self.assertEqual(errors, 3)
+
+    def test_incremental_random(self):
+        rnd = random.Random(3)
+        tokens = ['1', '01', '1.', '1.0', 'a']
+        for _ in range(300):
+            exp = [' '.join(rnd.choice(tokens) for _ in range(2))
+                   for _ in range(rnd.randrange(5))]
+            act = [' '.join(rnd.choice(tokens) for _ in range(2))
+                   for _ in range(rnd.randrange(5))]
+            for ordered in (True, False):
+                diffs, matches = compare_sections(act, exp, ordered)
+                results, ok, errors = self._incremental(act, exp, ordered)
+                self.assertEqual(ok, max(diffs, default=0) == 0)
+
 
 class TestFieldComparisons(unittest.TestCase):
     def test_compare_text1(self):
@@ -157,5 +310,76 @@ class TestFieldComparisons(unittest.TestCase):
         self.assertEqual(matches, ['-4.'])
 
 
+class TestCompiledSections(unittest.TestCase):
+    def _check_same(self, actual, expected, ordered):
+        compiled = compile_section(expected)
+        self.assertEqual(compare_sections(actual, compiled, ordered),
+                         compare_sections(actual, expected, ordered))
+
+    def test_compiled1(self):
+        exp = ['a 1 2.5', '+15 3.14 x', '', 'efg 0.1e1']
+        for act in (['a 1 2.5', '015 3.141 x', '', 'efg 1.0'],
+                    ['a 01 2.51', 'x 3.14 +15'],
+                    ['', 'a 1 2.5', 'efg 0.1e1', '15 3.14 x', 'extra'],
+                    []):
+            self._check_same(act, exp, True)
+            self._check_same(act, exp, False)
+
+    def test_compiled_reuse(self):
+        compiled = compile_section(['1 2', '3.5'])
+        for _ in range(3):
+            diffs, matches = compare_sections(['1 2', '3.49'], compiled)
+            self.assertEqual(diffs, [0.0, 0.0])
+            self.assertEqual(matches, ['1 2', '3.5'])
+
+    def test_compiled_huge_int(self):
+        exp = ['1' * 5000]
+        diffs, matches = compare_sections(exp, exp)
+        self.assertEqual(diffs, [1.0])
+
+
+@unittest.skipUnless(pvcheck.match.numpy, "numpy is not available")
+class TestVectorizedComparisons(unittest.TestCase):
+    def _plain(self, actual, expected):
+        numpy = pvcheck.match.numpy
+        pvcheck.match.numpy = None
+        try:
+            return compare_sections(actual, expected)
+        finally:
+            pvcheck.match.numpy = numpy
+
+    def test_vectorized_random(self):
+        rnd = random.Random(2)
+        exp_tokens = ['1', '-2', '+03', '3.', '2.5', '2.675', '0.125',
+                      '-0.5', '1.000', '0.', '99999999999.5']
+        act_tokens = ['1', '01', '2', '2.5', '2.4999999', '2.675', '2.67',
+                      '2.68', '0.12', '0.13', '-0', '1e3', 'inf', 'nan',
+                      '1_0', '0.1250000001', '99999999999.5', '3']
+
+        def line(tokens, n):
+            return ' '.join(rnd.choice(tokens) for _ in range(n))
+
+        for _ in range(20):
+            exp = [line(exp_tokens, rnd.randrange(20)) for _ in range(800)]
+            act = [(e if rnd.random() < 0.2 else
+                    line(act_tokens, len(e.split()) + (rnd.random() < 0.1)))
+                   for e in exp[:rnd.randrange(900)]]
+            act.extend(['1 2'] * rnd.randrange(3))
+            compiled = compile_section(exp)
+            self.assertIsNotNone(compiled.numeric_arrays())
+            self.assertEqual(compare_sections(act, compiled),
+                             self._plain(act, exp))
+
+    def test_vectorized_fallback(self):
+        exp = ['1.5 2'] * 5000
+        act = ['1.5 2'] * 4999 + ['x 2']
+        diffs, matches = compare_sections(act, compile_section(exp))
+        self.assertEqual(diffs, [0.0] * 4999 + [0.5])
+
+    def test_small_sections(self):
+        self.assertIsNone(compile_section(['1 2']).numeric_arrays())
+        self.assertIsNone(compile_section(['a'] * 5000).numeric_arrays())
+
+
 if __name__ == '__main__':
     unittest.main()
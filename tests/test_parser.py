@@ -1,5 +1,6 @@
 import unittest
 import sys
+import random
 sys.path.insert(0, '..')
 from pvcheck.parser import *
 
@@ -64,7 +65,105 @@ in the wall
         self.assertEqual(l[0].content, ['great-test 1', 'great-test 2'])
         self.assertEqual(l[1].tag, 'ANOTHER-BRICK-IN-THE-WALL')
         self.assertEqual(l[1].content, ['another', 'brick', 'in the wall'])
-        
+
+
+class TestParseOutput(unittest.TestCase):
+    _PARTS = ['[A]', '[ B ]', '[c_1]', '[9]', '[', ']', '[\u00e8]', 'x',
+              ' y ', '#', ' # ', '', ' ', '\t', 'prompt: ', '1 2', '\u00e8',
+              '\x1f', '\u3000', '\n', '\n', '\n', '\n', '\r\n']
+    _RARE = ['\r', '\x0b', '\x0c', '\x1c', '\x85', '\u2028']
+
+    def _sections(self, seq):
+        return [(s.tag, s.content) for s in seq]
+
+    def _check(self, text):
+        expected = self._sections(parse_sections(text.splitlines()))
+        self.assertEqual(self._sections(parse_output(text)), expected)
+
+    def test_parse_output1(self):
+        self._check('pre\n# [X]\n[A] tail\n a \n\n#c\n  [ B ]\r\nx\r\n'
+                    '[bad\n]\n[C]')
+
+    def test_parse_output_random(self):
+        rnd = random.Random(0)
+        for n in range(1000):
+            parts = self._PARTS + (self._RARE if n % 4 == 0 else [])
+            self._check(''.join(rnd.choice(parts) for _ in range(40)))
+
+    def test_parse_output_lazy(self):
+        sections = list(parse_output('[A]\n1\n[B]\n2\n'))
+        self.assertIsNone(sections[0]._content)
+        self.assertEqual(sections[1].content, ['2'])
+        self.assertIsNone(sections[0]._content)
+        self.assertEqual(sections[0].text(), '1\n')
+
+
+class TestIndexOutput(unittest.TestCase):
+    _TEXT = 'x\n[A]\n1\n[B]\n2\n[A]\n3\n[C]\n4\n'
+
+    def test_index_output1(self):
+        index = index_output(self._TEXT, {'A', 'C', 'D'})
+        self.assertEqual(sorted(index), ['A', 'C'])
+        self.assertEqual(index['A'].content, ['1'])
+        self.assertEqual(index['C'].content, ['4'])
+
+    def test_index_output_policies(self):
+        for policy, content in (('first', ['1']), ('last', ['3']),
+                                ('merge', ['1', '3'])):
+            for buf in (self._TEXT, self._TEXT.replace('\n', '\r')):
+                index = index_output(buf, {'A'}, {'A': policy})
+                self.assertEqual(index['A'].content, content)
+
+    def test_index_output_skip(self):
+        sections = list(parse_output(self._TEXT))
+        index = index_output(self._TEXT, {'A', ''})
+        self.assertEqual(index[''].content, ['x'])
+        self.assertEqual(sections[0].tag, '')
+
+    def test_index_output_lazy(self):
+        index = index_output('[A]\n1\n[B]\n2\n', {'A'})
+        self.assertIsNone(index['A']._content)
+        self.assertEqual(index['A'].content, ['1'])
+
+
+class TestIncrementalParser(unittest.TestCase):
+    def _parse(self, pieces):
+        # Rebuild the sections from the events.
+        parser = IncrementalParser()
+        sections = []
+        for text in pieces:
+            events = (parser.close() if text is None else
+                      parser.feed(text))
+            for kind, value in events:
+                if kind == 'header':
+                    sections.append((value, []))
+                else:
+                    if not sections:
+                        sections.append(('', []))
+                    sections[-1][1].append(value)
+        return sections
+
+    def test_incremental_random(self):
+        rnd = random.Random(0)
+        parts = ['[A]', '[ B ]', 'x', ' y ', '# c', '', ' ', 'prompt: [C]',
+                 '\n', '\r\n', '\r', '\n', '\x0b', '\u2028', '1 2']
+        for _ in range(300):
+            text = ''.join(rnd.choice(parts) for _ in range(30))
+            cuts = sorted(rnd.randrange(len(text) + 1) for _ in range(4))
+            pieces = [text[a:b] for a, b in zip([0] + cuts, cuts + [None])]
+            expected = [(s.tag, s.content)
+                        for s in parse_sections(text.splitlines())]
+            self.assertEqual(self._parse(pieces + [None]), expected)
+
+    def test_incremental_events(self):
+        parser = IncrementalParser()
+        self.assertEqual(list(parser.feed('[A]\nab')), [('header', 'A')])
+        self.assertEqual(list(parser.feed('c\n')), [('line', 'abc')])
+        self.assertEqual(list(parser.feed('d\r')), [])
+        self.assertEqual(list(parser.feed('\n')), [('line', 'd')])
+        self.assertEqual(list(parser.feed('e')), [])
+        self.assertEqual(list(parser.close()), [('line', 'e')])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,9 +2,14 @@ import unittest
 import sys
 sys.path.insert(0, '..')
 import io
+import json
+import os
+import time
+import tempfile
 from pvcheck.pvcheck import *
 from pvcheck.testdata import *
 from pvcheck.formatter import *
+from pvcheck.jsonformatter import JSONFormatter
 from pvcheck.executor import *
 
 
@@ -57,6 +62,243 @@ NOTFOUND: missing section
         self.assertEqual(failures, 2)
         self.assertEqual(dst.getvalue(), exp)
 
+    def test_exec_suite_aligned(self):
+        dst = io.StringIO()
+        fmt = TextFormatter(destination=dst,
+                            verbosity=TextFormatter.WARNING)
+        pv = PvCheck(Executor(), fmt)
+
+        sections = [
+            Section(".SECTIONS", ["OUT aligned"]),
+            Section(".TEST", ["echo1"]),
+            Section(".ARGS", ["[OUT]\na\nc\nx\nd"]),
+            Section("OUT", ["a", "b", "c", "d"])
+        ]
+        failures = pv.exec_suite(TestSuite(sections), ["echo"])
+        exp = """OUT: unexpected line 'x'
+OUT: missing line (expected 'b')
+"""
+        self.assertEqual(failures, 1)
+        self.assertEqual(dst.getvalue(), exp)
+
+    def test_exec_suite_duplicates(self):
+        sections = [
+            Section(".SECTIONS", ["LAST last", "MERGED merge"]),
+            Section(".ARGS", ["[FIRST]\n1\n[LAST]\n1\n[MERGED]\n1\n"
+                              "[FIRST]\n2\n[LAST]\n2\n[MERGED]\n2"]),
+            Section("FIRST", ["1"]),
+            Section("LAST", ["2"]),
+            Section("MERGED", ["1", "2"])
+        ]
+        fmt = RecordingFormatter()
+        pv = PvCheck(Executor(), fmt)
+        failures = pv.exec_suite(TestSuite(sections), ["echo"])
+        self.assertEqual(failures, 0)
+        diffs = [args[2] for name, args in fmt.events
+                 if name == "comparison_result"]
+        self.assertEqual(diffs, [[0.0], [0.0], [0.0, 0.0]])
+
+    def test_exec_suite_parallel(self):
+        sections = []
+        for n in range(20):
+            sections.extend([
+                Section(".TEST", ["test%d" % n]),
+                Section(".ARGS", ["[OUT]\n%d" % (n % 3)]),
+                Section("OUT", ["0"])
+            ])
+        outputs = []
+        for jobs in (1, 4):
+            dst = io.StringIO()
+            # Skip the summary, since it includes the execution times
+            fmt = TextFormatter(destination=dst,
+                                verbosity=TextFormatter.SUCCESS)
+            pv = PvCheck(Executor(), fmt)
+            failures = pv.exec_suite(TestSuite(sections), ["echo"],
+                                     jobs=jobs)
+            self.assertEqual(failures, 13)
+            outputs.append(dst.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_exec_suite_maxfail(self):
+        sections = []
+        for n in range(10):
+            sections.extend([
+                Section(".TEST", ["test%d" % n]),
+                Section(".ARGS", ["[OUT]\n%d" % (n % 3)]),
+                Section("OUT", ["0"])
+            ])
+        for jobs in (1, 4):
+            dst = io.StringIO()
+            fmt = TextFormatter(destination=dst,
+                                verbosity=TextFormatter.WARNING)
+            pv = PvCheck(Executor(), fmt)
+            failures = pv.exec_suite(TestSuite(sections), ["echo"],
+                                     jobs=jobs, maxfail=3)
+            self.assertEqual(failures, 3)
+            self.assertIn("TOO MANY FAILURES: 5 TESTS SKIPPED",
+                          dst.getvalue())
+
+    def test_exec_suite_exitfirst_parallel(self):
+        # The tests in progress are interrupted.
+        sections = [
+            Section(".TEST", ["fail"]),
+            Section(".ARGS", ["-c", "exit 1"]),
+            Section("OUT", ["0"]),
+            Section(".TEST", ["slow1"]),
+            Section(".ARGS", ["-c", "sleep 10"]),
+            Section(".TEST", ["slow2"]),
+            Section(".ARGS", ["-c", "sleep 10"])
+        ]
+        fmt = RecordingFormatter()
+        pv = PvCheck(Executor(), fmt)
+        start = time.monotonic()
+        failures = pv.exec_suite(TestSuite(sections), ["sh"], jobs=3,
+                                 maxfail=1)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(failures, 1)
+        self.assertIn(("tests_skipped", (2,)), fmt.events)
+        self.assertEqual(fmt.events[-1], ("end_session", ()))
+
+    def test_exec_suite_stream(self):
+        sections = [
+            Section(".TEST", ["wrong"]),
+            Section(".ARGS", ["-c", "echo '[OUT]'; echo 2; sleep 10"]),
+            Section("OUT", ["1"]),
+            Section(".TEST", ["right"]),
+            Section(".ARGS", ["-c", "echo '[OUT]'; echo 1"]),
+            Section("OUT", ["1"])
+        ]
+        dst = io.StringIO()
+        fmt = TextFormatter(destination=dst,
+                            verbosity=TextFormatter.WARNING)
+        pv = PvCheck(Executor(), fmt)
+        start = time.monotonic()
+        failures = pv.exec_suite(TestSuite(sections), ["sh"], timeout=20,
+                                 stream=True)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(failures, 1)
+        exp = """WRONG OUTPUT: PROCESS TERMINATED
+OUT: line 1 is wrong  (expected '1', got '2')
+"""
+        self.assertEqual(dst.getvalue(), exp)
+
+    def test_exec_suite_stream_maxerrors(self):
+        # The program is stopped when OUT is wrong, even if OTHER
+        # has not been produced yet.
+        sections = [
+            Section(".ARGS", ["-c", "echo '[OUT]'; echo 2; echo 3; sleep 10;"
+                              " echo '[OTHER]'"]),
+            Section("OUT", ["1", "2", "3"]),
+            Section("OTHER", []),
+        ]
+        fmt = RecordingFormatter()
+        pv = PvCheck(Executor(), fmt)
+        start = time.monotonic()
+        pv.exec_suite(TestSuite(sections), ["sh"], stream=True, maxerrors=2)
+        self.assertLess(time.monotonic() - start, 5)
+        start = time.monotonic()
+        pv.exec_suite(TestSuite(sections), ["sh"], stream=True, maxerrors=4,
+                      timeout=1)
+        self.assertGreater(time.monotonic() - start, 0.9)
+
+    def test_compiled_sections(self):
+        pv = PvCheck(Executor(), RecordingFormatter())
+        shared = Section("OUT", ["1 2"])
+        compiled = pv._compiled_section(shared)
+        for n in range(COMPILED_CACHE_SIZE):
+            pv._compiled_section(Section("OUT", [str(n)]))
+            self.assertIs(pv._compiled_section(shared), compiled)
+        for n in range(COMPILED_CACHE_SIZE):
+            pv._compiled_section(Section("OUT", [str(n)]))
+        self.assertEqual(len(pv._compiled), COMPILED_CACHE_SIZE)
+        self.assertIsNot(pv._compiled_section(shared), compiled)
+
+    def test_invalid_limits(self):
+        sections = [
+            Section(".TEST", ["bad"]),
+            Section(".LIMITS", ["memory lots"]),
+            Section(".ARGS", ["[OUT]\n1"]),
+            Section("OUT", ["1"])
+        ]
+        fmt = RecordingFormatter()
+        pv = PvCheck(Executor(), fmt)
+        with self.assertRaises(TestFileError) as cm:
+            pv.exec_suite(TestSuite(sections), ["echo"])
+        self.assertIn("memory lots", str(cm.exception))
+        self.assertEqual(fmt.events[-1], ("end_session", ()))
+
+    def test_invalid_alignment(self):
+        for option in ("aligned=abc", "aligned=-5"):
+            sections = [
+                Section(".TEST", ["bad"]),
+                Section(".SECTIONS", ["OUT " + option]),
+                Section(".ARGS", ["[OUT]\n1"]),
+                Section("OUT", ["1"])
+            ]
+            fmt = RecordingFormatter()
+            pv = PvCheck(Executor(), fmt)
+            with self.assertRaises(TestFileError) as cm:
+                pv.exec_suite(TestSuite(sections), ["echo"])
+            self.assertIn("'bad'", str(cm.exception))
+            self.assertIn(option, str(cm.exception))
+
+    def test_missing_input_file(self):
+        dst = io.StringIO()
+        fmt = TextFormatter(destination=dst,
+                            verbosity=TextFormatter.ERROR)
+        pv = PvCheck(Executor(), fmt)
+        sections = [
+            Section(".TEST", ["missing"]),
+            Section(".INPUT_FILE", ["__zzzzz"]),
+            Section(".ARGS", ["[OUT]\n1"]),
+            Section("OUT", ["1"]),
+            Section(".TEST", ["ok"]),
+            Section(".ARGS", ["[OUT]\n1"]),
+            Section("OUT", ["1"])
+        ]
+        self.assertEqual(pv.exec_suite(TestSuite(sections), ["echo"]), 1)
+        self.assertIn("FAILED TO RUN THE FILE '__zzzzz'", dst.getvalue())
+
+    def test_referenced_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "in.txt"), "wt") as f:
+                f.write("1\n2\n")
+            with open(os.path.join(tmpdir, "data.txt"), "wt") as f:
+                f.write("3\n")
+            sections = resolve_paths([
+                Section(".INPUT_FILE", ["in.txt"]),
+                Section(".INPUT", ["ignored"]),
+                Section(".FILE_FROM", ["data.txt"]),
+                Section(".ARGS", ["-c", "echo '[OUT]'; cat - \"$1\"", "sh",
+                                  ".FILE"]),
+                Section("OUT", ["1", "2", "3"])
+            ], tmpdir)
+            fmt = RecordingFormatter()
+            pv = PvCheck(Executor(), fmt)
+            self.assertEqual(pv.exec_suite(TestSuite(sections), ["sh"]), 0)
+
+    def test_expected_from(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "out.txt"), "wt") as f:
+                f.write("".join("%d\n" % i for i in range(1000)))
+            sections = resolve_paths([
+                Section(".ARGS", ["-c", "echo '[OUT]'; seq 0 999 | sed 5s/4/x/"]),
+                Section(".EXPECTED_FROM", ["OUT out.txt"]),
+            ], tmpdir)
+            dst = io.StringIO()
+            pv = PvCheck(Executor(), TextFormatter(destination=dst))
+            self.assertEqual(pv.exec_suite(TestSuite(sections), ["sh"]), 1)
+            self.assertIn("OUT: line 5 is wrong  (expected '4', got 'x')",
+                          dst.getvalue())
+            dst = io.StringIO()
+            pv = PvCheck(Executor(), JSONFormatter(destination=dst))
+            pv.exec_suite(TestSuite(sections), ["sh"])
+            section = json.loads(dst.getvalue())["tests"][0]["sections"]["OUT"]
+            self.assertIsNone(section["expected"])
+            self.assertEqual(section["expected_file"],
+                             os.path.join(tmpdir, "out.txt"))
+            self.assertEqual(section["wrong_lines"], [[4, "x", "4"]])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,12 @@
 import unittest
 import sys
 sys.path.insert(0, '..')
+import io
+import os
+import pickle
+import tempfile
 from pvcheck.testdata import *
+from pvcheck.parser import parse_sections
 
 
 class TestSection(unittest.TestCase):
@@ -16,6 +21,110 @@ class TestSection(unittest.TestCase):
         self.assertEqual(s.tag, 'name')
         self.assertEqual(s.content, ['line1', 'line2'])
 
+    def test_compact(self):
+        s = Section('name', ['line1', '', 'line3']).compact()
+        self.assertIsInstance(s.content, Lines)
+        self.assertEqual(s.content, ['line1', '', 'line3'])
+        self.assertEqual(s.text(), 'line1\n\nline3\n')
+        self.assertEqual(s.encoded(), b'line1\n\nline3\n')
+        self.assertEqual(s.copy().content, ['line1', '', 'line3'])
+        self.assertIsInstance(s.copy().content, list)
+
+
+class TestLines(unittest.TestCase):
+    def test_sequence(self):
+        lines = Lines(['a', 'bb', '', 'ccc'])
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[1], 'bb')
+        self.assertEqual(lines[2], '')
+        self.assertEqual(lines[-1], 'ccc')
+        self.assertEqual(lines[1:3], ['bb', ''])
+        self.assertEqual(list(lines), ['a', 'bb', '', 'ccc'])
+        with self.assertRaises(IndexError):
+            lines[4]
+
+    def test_empty(self):
+        lines = Lines()
+        self.assertEqual(len(lines), 0)
+        self.assertEqual(lines.text(), '')
+        self.assertEqual(lines, [])
+        self.assertEqual(Section('x', lines).text(), '')
+
+    def test_eq(self):
+        lines = Lines(['a', 'b'])
+        self.assertEqual(lines, ['a', 'b'])
+        self.assertEqual(['a', 'b'], lines)
+        self.assertEqual(lines, Lines(['a', 'b']))
+        self.assertNotEqual(lines, ['a', 'b', 'c'])
+        self.assertNotEqual(lines, Lines(['a\nb']))
+        self.assertNotEqual(lines, 'a\nb\n')
+
+    def test_pickle(self):
+        lines = Lines(['a', 'b'])
+        lines.encoded()
+        copy = pickle.loads(pickle.dumps(Section('x', lines)))
+        self.assertEqual(copy.content, lines)
+        self.assertEqual(copy.encoded(), b'a\nb\n')
+
+    def test_parse(self):
+        text = "[A]\n1\n[B]\n" + "x\n" * 100
+        a, b = parse_sections(io.StringIO(text))
+        self.assertIsInstance(a.content, list)
+        self.assertIsInstance(b.content, Lines)
+        self.assertEqual(b.text(), "x\n" * 100)
+
+
+class TestMappedLines(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, "expected.txt")
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def write(self, text):
+        with open(self.path, "wt") as f:
+            f.write(text)
+        return MappedLines(self.path)
+
+    def test_lines(self):
+        lines = self.write("first  \n\n# comment\n" +
+                           "".join("%d\n" % i for i in range(1000)) +
+                           "last")
+        expected = ["first"] + [str(i) for i in range(1000)] + ["last"]
+        self.assertEqual(list(lines), expected)
+        self.assertEqual(len(lines), 1002)
+        self.assertEqual(lines[1], "0")
+        self.assertEqual(lines[-1], "last")
+        self.assertEqual(lines[1:3], ["0", "1"])
+        with self.assertRaises(IndexError):
+            lines[1002]
+        chunks = list(lines.chunks(size=100))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(sum(chunks, []), expected)
+
+    def test_empty(self):
+        lines = self.write("")
+        self.assertEqual(list(lines), [])
+        self.assertEqual(len(lines), 0)
+        self.assertEqual(Section("A", lines).text(), "")
+
+    def test_pickle(self):
+        lines = self.write("a\nb\n")
+        self.assertEqual(list(pickle.loads(pickle.dumps(lines))), ["a", "b"])
+
+    def test_expected_from(self):
+        self.write("1\n2\n")
+        sections = resolve_paths([
+            Section(".EXPECTED_FROM", ["OUT expected.txt"])
+        ], self._tmpdir.name)
+        t = TestCase('desc', sections)
+        self.assertIsNone(t.find_section(".EXPECTED_FROM"))
+        s = t.find_section("OUT")
+        self.assertIsInstance(s.content, MappedLines)
+        self.assertEqual(s.content.path, self.path)
+        self.assertEqual(s.text(), "1\n2\n")
+
 
 class TestTestCase(unittest.TestCase):
     def test_init(self):
@@ -42,6 +151,15 @@ class TestTestCase(unittest.TestCase):
         self.assertEqual(t.sections()[0].tag, 'A')
         self.assertEqual(t.sections()[0].content, ['line1', 'line2'])
 
+    def test_add_section_no_side_effects(self):
+        s1 = Section('A', ['line1'])
+        s2 = Section('A', ['line2'])
+        t = TestCase('desc', [s1, s2, Section('A', ['line3'])])
+        self.assertEqual(t.find_section('A').content,
+                         ['line1', 'line2', 'line3'])
+        self.assertEqual(s1.content, ['line1'])
+        self.assertEqual(s2.content, ['line2'])
+
     def test_find_section(self):
         t = TestCase('desc', [
             Section('A', ['lineA1', 'lineA2']),
@@ -139,6 +257,113 @@ class TestTestSuite(unittest.TestCase):
                          ['pre1', 'pre2', 'pre3'])
         self.assertEqual(tc[1].sections()[1].tag, 'BBB')
 
+    def test_shared_prefix(self):
+        prefix = Section('.INPUT', ['a', 'b'])
+        suite = TestSuite([
+            prefix,
+            Section('.TEST', ['test1']),
+            Section('.INPUT', ['c']),
+            Section('.TEST', ['test2']),
+            Section('.TEST', ['test3'])
+        ])
+        tc = suite.test_cases()
+        self.assertEqual(tc[0].find_section('.INPUT').content, ['a', 'b', 'c'])
+        self.assertIs(tc[1].find_section('.INPUT'), prefix)
+        self.assertIs(tc[2].find_section('.INPUT'), prefix)
+        self.assertEqual(prefix.content, ['a', 'b'])
+
+
+class TestLazyTestSuite(unittest.TestCase):
+    TEXT = """# comment
+[AAA]
+pre
+
+[.TEST]
+  first test
+[AAA]
+a1
+[.SECTIONS]
+BBB unordered
+[BBB]
+b1
+  [ .TEST ]
+# no description
+[BBB]
+b2
+[.TEST]
+
+second, with .TEST in the name
+[AAA]
+[.TEST] in the content is a header
+"""
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.filename = self.write(self.TEXT)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def write(self, text, name="suite.test"):
+        path = os.path.join(self._tmpdir.name, name)
+        with open(path, "wt") as f:
+            f.write(text)
+        return path
+
+    def assertSameSuite(self, lazy, eager):
+        lcases = list(lazy.test_cases())
+        ecases = eager.test_cases()
+        self.assertEqual(len(lazy.test_cases()), len(ecases))
+        self.assertEqual(lazy.descriptions(), eager.descriptions())
+        for lc, ec in zip(lcases, ecases):
+            self.assertEqual(lc.description, ec.description)
+            self.assertEqual([(s.tag, s.content) for s in lc.sections()],
+                             [(s.tag, s.content) for s in ec.sections()])
+            for s in ec.sections():
+                self.assertEqual(lc.section_options(s.tag),
+                                 ec.section_options(s.tag))
+
+    def eager(self, text, prefix=()):
+        return TestSuite(list(prefix) +
+                         list(parse_sections(io.StringIO(text))))
+
+    def test_same_as_eager(self):
+        prefix = [Section("VALGRIND", [])]
+        suite = LazyTestSuite(self.filename, prefix)
+        self.assertEqual(len(suite.test_cases()), 4)
+        self.assertSameSuite(suite, self.eager(self.TEXT, prefix))
+
+    def test_random_access(self):
+        suite = LazyTestSuite(self.filename)
+        test = suite.test_case(1)
+        self.assertEqual(test.description, "Test-2")
+        self.assertEqual(test.find_section("BBB").content, ["b2"])
+        self.assertEqual(test.find_section("AAA").content, ["pre"])
+        self.assertEqual(suite.test_cases()[-1].description, "Test-4")
+        with self.assertRaises(IndexError):
+            suite.test_cases()[4]
+
+    def test_no_tests(self):
+        for text in ("", "[AAA]\nx\n"):
+            path = self.write(text, "other.test")
+            self.assertSameSuite(LazyTestSuite(path), self.eager(text))
+
+    def test_index_file(self):
+        index = os.path.join(self._tmpdir.name, "index", "suite.json")
+        suite = LazyTestSuite(self.filename, index_file=index)
+        self.assertTrue(os.path.exists(index))
+        # A valid index is trusted.
+        with open(index, "rt") as f:
+            data = f.read()
+        with open(index, "wt") as f:
+            f.write(data.replace("Test-2", "Changed"))
+        suite = LazyTestSuite(self.filename, index_file=index)
+        self.assertEqual(suite.descriptions()[1], "Changed")
+        # The index is rebuilt after the file changes.
+        self.write(self.TEXT + "[.TEST]\nlast\n")
+        suite = LazyTestSuite(self.filename, index_file=index)
+        self.assertSameSuite(suite, self.eager(self.TEXT + "[.TEST]\nlast\n"))
+
 
 if __name__ == '__main__':
     unittest.main()